@@ -73,6 +73,9 @@ class Main(object):
         a('-L', '--language',
             help='use translated strings in LANGUAGE')
 
+        a('--profile-templates', action='store_true', default=False,
+            help='write template expansion statistics to STATUS_FILE.profile.json (or OUTPUT.profile.json)')
+
         options, args = parser.parse_args()
         return options, args, parser
 
@@ -114,6 +117,10 @@ class Main(object):
                     print ' %s=%s:\t%s' % (name, param, info['help'])
                 else:
                     print ' %s:\t%s' % (name, info['help'])
+        from mwlib.templ import budget
+        print 'Template expansion options (usable with every writer):'
+        for name, info in sorted(budget.writer_options.items()):
+            print ' %s=%s:\t%s' % (name, info['param'], info['help'])
 
     def get_environment(self):
         from mwlib.status import Status
@@ -180,6 +187,17 @@ class Main(object):
                 writer_options[str(key)] = value
         if options.language:
             writer_options['lang'] = options.language
+
+        from mwlib.templ import budget
+        limits = {}
+        for option in writer_options.keys():
+            if option in budget.writer_options:
+                limits[option[len('expander_'):]] = writer_options.pop(option)
+        try:
+            budget.set_limits(**limits)
+        except ValueError as err:
+            parser.error('Bad template expansion limit: %s\n%s' % (err, use_help))
+
         for option in writer_options.keys():
             if option not in getattr(writer, 'options', {}):
                 print 'Warning: unknown writer option %r' % option
@@ -187,6 +205,10 @@ class Main(object):
 
         init_tmp_cleaner()
 
+        from mwlib.templ import profiler
+        if options.profile_templates:
+            profiler.enable()
+
         self.status = Status(options.status_file, progress_range=(1, 33))
         self.status(progress=0)
 
@@ -214,6 +236,8 @@ class Main(object):
             if hasattr(writer, 'file_extension'):
                 kwargs['file_extension'] = writer.file_extension
             self.status(status='finished', progress=100, **kwargs)
+            from mwlib.templ import lookup
+            lookup.report()
             if options.keep_zip is None and self.zip_filename is not None:
                 utils.safe_unlink(self.zip_filename)
         except Exception as e:
@@ -232,6 +256,8 @@ class Main(object):
                 os.rename(tmpfile, options.error_file)
             raise
         finally:
+            if options.profile_templates:
+                profiler.get_profiler().write_report(profiler.report_path(options.status_file or options.output))
             if env is not None and env.images is not None:
                 try:
                     if not options.keep_tmpfiles:
@@ -14,6 +14,8 @@ import re
 import inspect
 import math
 
+from mwlib import lrucache
+
 
 class ExprError(Exception):
     pass
@@ -142,17 +144,31 @@ class Expr(object):
         return long(s)
 
     def output_operator(self, op):
-        return functions[op](self.operand_stack)
+        self.program.append(functions[op])
 
     def output_operand(self, operand):
-        self.operand_stack.append(operand)
+        if isinstance(operand, int):
+            self.program.append(operand)
+        else:
+            self.program.append(_push(self.as_float_or_int(operand)))
 
-    def parse_expr(self, s):
-        tokens = tokenize(s)
-        if not tokens:
-            return ""
+    def compile(self, tokens):
+        """compile tokens as returned by shape into a program for run.
+
+        parse errors are compiled into the program, so that they are
+        raised at the same point of the evaluation as before.
+        """
+
+        self.program = []
+        try:
+            self._compile(tokens)
+        except ExprError, err:
+            self.program.append(_fail(err))
+        else:
+            self.program.append(_check_stack)
+        return self.program
 
-        self.operand_stack = []
+    def _compile(self, tokens):
         operator_stack = []
 
         last_operand, last_operator = False, True
@@ -161,10 +177,10 @@ class Expr(object):
             if operand in ("e", "E") and (last_operand or last_operator == ")"):
                 operand, operator = operator, operand
 
-            if operand:
+            if operand != "":
                 if last_operand:
                     raise ExprError("expected operator")
-                self.output_operand(self.as_float_or_int(operand))
+                self.output_operand(operand)
             elif operator == "(":
                 operator_stack.append("(")
             elif operator == ")":
@@ -191,7 +207,7 @@ class Expr(object):
             else:
                 raise ExprError("unknown operator: %r" % (operator,))
 
-            last_operand, last_operator = operand, operator
+            last_operand, last_operator = operand != "", operator
 
         while operator_stack:
             p = operator_stack.pop()
@@ -199,23 +215,95 @@ class Expr(object):
                 raise ExprError("unbalanced parenthesis")
             self.output_operator(p)
 
-        if len(self.operand_stack) != 1:
-            raise ExprError("bad stack: %s" % (self.operand_stack,))
+    def parse_expr(self, s):
+        tokens, operands = shape(s)
+        if not tokens:
+            return ""
+
+        return run(self.compile(tokens), operands)
+
+
+def _push(value):
+    def push(stack):
+        stack.append(value)
+    return push
+
+
+def _fail(err):
+    def fail(stack):
+        raise ExprError(*err.args)
+    return fail
+
 
-        return self.operand_stack[-1]
+def _check_stack(stack):
+    if len(stack) != 1:
+        raise ExprError("bad stack: %s" % (stack,))
 
 
-_cache = {}
+def shape(s):
+    """tokenize s like tokenize, but replace the numbers with their index
+    in the list of operands. return (tokens, operands)"""
+
+    res = []
+    operands = []
+    constants = Expr.constants
+    for (v1, v2) in rxpattern.findall(s):
+        if v1:
+            res.append((len(operands), ""))
+            if "." in v1:
+                operands.append(float(v1))
+            else:
+                operands.append(long(v1))
+        elif v2:
+            v2 = v2.lower()
+            if v2 in constants:
+                res.append((v2, ""))
+            else:
+                res.append(("", v2))
+    return tuple(res), operands
+
+
+def run(program, operands):
+    """run a program as returned by Expr.compile"""
+
+    stack = []
+    for x in program:
+        if type(x) is int:
+            stack.append(operands[x])
+        else:
+            x(stack)
+    return stack[-1]
+
+
+# compiled programs keyed by the shape of the expression and results keyed
+# by the expression itself
+_programs = lrucache.mt_lrucache(2000)
+_results = lrucache.mt_lrucache(20000)
+
+
+def evaluate(s):
+    """evaluate s with a cached program for expressions of the same shape"""
+
+    tokens, operands = shape(s)
+    if not tokens:
+        return ""
+
+    try:
+        program = _programs[tokens]
+    except KeyError:
+        program = _programs[tokens] = Expr().compile(tokens)
+
+    return run(program, operands)
 
 
 def expr(s):
     try:
-        return _cache[s]
+        return _results[s]
     except KeyError:
         pass
 
-    r = Expr().parse_expr(s)
-    _cache[s] = r
+    r = evaluate(s)
+    _results[s] = r
     return r
 
 
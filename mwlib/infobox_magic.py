@@ -1,11 +1,11 @@
 from xml.sax.saxutils import quoteattr
 from mwlib import expander
-from mwlib.templ import parser
+from mwlib.templ import cache
 
 
 def mark_infobox(self, name, raw):
 
-    res = parser.parse(raw, replace_tags=self.replace_tags)
+    res = cache.get_cache().parse(raw, self.uniquifier)
     if not name.lower().startswith("infobox"):
         return res
     print "marking infobox %r" % name
@@ -23,7 +23,9 @@ import sqlite3dbm
 from lxml import etree
 
 from mwlib import utils, nshandling, conf, myjson as json
+from mwlib._conf import as_bool
 from mwlib.net import sapi as mwapi
+from mwlib.templ import deps
 
 
 class shared_progress(object):
@@ -94,6 +96,7 @@ class fsoutput(object):
         os.makedirs(os.path.join(self.path, "images"))
         self.revfile = open(os.path.join(self.path, "revisions-1.txt"), "wb")
         self.seen = dict()
+        self.existing = set()
         self.imgcount = 0
         self.nfo = None
 
@@ -111,6 +114,7 @@ class fsoutput(object):
     def close(self):
         if self.nfo is not None:
             self.dump_json(nfo=self.nfo)
+        self.write_existing()
         self.revfile.close()
         self.revfile = None
 
@@ -133,7 +137,14 @@ class fsoutput(object):
     def write_licenses(self, licenses):
         self.dump_json(licenses=licenses)
 
+    def write_existing(self):
+        """write the sorted titles of all pages known to exist, one per line"""
+        f = open(os.path.join(self.path, "existing.txt"), "wb")
+        f.write("\n".join(sorted(self.existing)).encode("utf-8"))
+        f.close()
+
     def write_expanded_page(self, title, ns, txt, revid=None):
+        self.existing.add(title)
         rev = dict(title=title, ns=ns, expanded=1)
         if revid is not None:
             rev["revid"] = revid
@@ -151,6 +162,9 @@ class fsoutput(object):
             ns = p.get("ns")
             revisions = p.get("revisions")
 
+            if title and "missing" not in p and "invalid" not in p:
+                self.existing.add(title)
+
             if revisions is None:
                 continue
 
@@ -177,6 +191,7 @@ class fsoutput(object):
         self.html.close()
 
     def write_redirects(self, redirects):
+        self.existing.update(redirects)
         self.dump_json(redirects=redirects)
 
 
@@ -272,6 +287,10 @@ class fetcher(object):
 
         self.count_total = 0
         self.count_done = 0
+        # round trips for fetching pages, and pages only the static
+        # template closure found
+        self.count_page_requests = 0
+        self.count_closure_pages = 0
         self.redirects = {}
         self.cat2members = {}
 
@@ -289,6 +308,11 @@ class fetcher(object):
         self.fsout.write_siteinfo(siteinfo)
         self.nshandler = nshandling.nshandler(siteinfo)
 
+        if conf.get("fetch", "template_closure", False, as_bool):
+            self.closure = deps.Closure(self.nshandler, self.redirects)
+        else:
+            self.closure = None
+
         params = mwapi.get_collection_params(api)
         self.__dict__.update(params)
 
@@ -534,6 +558,27 @@ class fetcher(object):
         if targets:
             self.fetch_used("titles", targets)
 
+    def _schedule_dependencies(self, data):
+        """schedule the templates and modules statically transcluded by
+        the fetched pages, which the templates property did not report,
+        e.g. the ones used by older revisions"""
+
+        for p in data.get("pages", {}).values():
+            if p.get("ns") == deps.NS_MODULE:
+                continue
+
+            title = p.get("title")
+            for r in p.get("revisions") or []:
+                txt = r.get("*")
+                if not txt or self.nshandler.redirect_matcher(txt):
+                    continue
+
+                for t in self.closure.add_page(title, txt, included=p.get("ns") != 0):
+                    if t not in self.scheduled:
+                        self.pages_todo.append(t)
+                        self.scheduled.add(t)
+                        self.count_closure_pages += 1
+
     def _extract_attribute(self, lst, attr):
         res = []
         for x in lst:
@@ -700,12 +745,15 @@ class fetcher(object):
         limit = self.api.api_request_limit
 
         def fetch_pages(**kw):
+            self.count_page_requests += 1
             data = self.api.fetch_pages(**kw)
             self._find_redirect(data)
             r = data.get("redirects", [])
             self._update_redirects(r)
             self._handle_categories(data)
             self.fsout.write_pages(data)
+            if self.closure is not None:
+                self._schedule_dependencies(data)
 
         def doit(name, lst):
             while lst and self.api.idle():
@@ -741,6 +789,8 @@ class fetcher(object):
 
     def finish(self):
         self._sanity_check()
+        print "fetched pages in %d requests, %d pages added by the template closure" % (
+            self.count_page_requests, self.count_closure_pages)
         self.fsout.write_redirects(self.redirects)
         self.fsout.write_licenses(self.licenses)
         self.fsout.close()
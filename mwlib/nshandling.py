@@ -191,7 +191,9 @@ def get_nshandler_for_lang(lang):
     if si is None:
         si = siteinfo.get_siteinfo("en")
         assert si, "siteinfo-en not found"
-    return nshandler(si)
+
+    from mwlib import sitecontext
+    return sitecontext.get_context(si).nshandler
 
 
 def get_redirect_matcher(siteinfo, handler=None):
@@ -239,6 +239,10 @@ def main():
         sys.exit("--url option missing")
 
     make_cachedir(cachedir)
+
+    # share parsed templates between the mw-render processes we start
+    os.environ.setdefault("MWLIB_EXPANDER_TEMPLATE_CACHE", os.path.join(cachedir, "templates"))
+
     from mwlib.async import slave
     slave.main(commands, numgreenlets=numgreenlets, argv=args)
 
@@ -11,7 +11,7 @@ import sqlite3dbm
 from hashlib import sha1
 from mwlib import myjson as json
 
-from mwlib import nshandling, utils
+from mwlib import nshandling, utils, sitecontext
 from mwlib.log import Log
 
 log = Log('nuwiki')
@@ -103,8 +103,9 @@ class nuwiki(object):
             self.imageinfo = DumbJsonDB(fn, allow_pickle=allow_pickle)
 
         self.redirects = self._loadjson("redirects.json", {})
+        self.existing = self._loadtitles("existing.txt")
         self.siteinfo = self._loadjson("siteinfo.json", {})
-        self.nshandler = nshandling.nshandler(self.siteinfo)
+        self.nshandler = sitecontext.get_context(self.siteinfo).nshandler
         self.en_nshandler = nshandling.get_nshandler_for_lang('en')
         self.nfo = self._loadjson("nfo.json", {})
 
@@ -128,6 +129,15 @@ class nuwiki(object):
             return json.load(open(path, "rb"))
         return default
 
+    def _loadtitles(self, path):
+        path = self._pathjoin(path)
+        if not self._exists(path):
+            return None
+        txt = unicode(open(path, "rb").read(), "utf-8")
+        if not txt:
+            return frozenset()
+        return frozenset(txt.split("\n"))
+
     def _read_revisions(self):
         count = 1
         while True:
@@ -199,6 +209,14 @@ class nuwiki(object):
         fqname = self.nshandler.get_fqname(name, defaultns=defaultns)
         return self.get_page(fqname)
 
+    def page_exists(self, fqname):
+        """return whether the page fqname exists on the wiki. uses the index
+        written by the fetcher, older zip files only know the pages they
+        contain"""
+        if self.existing is None:
+            return self.get_page(fqname) is not None
+        return fqname in self.existing
+
     def normalize_and_get_image_path(self, name):
         assert isinstance(name, basestring)
         name = unicode(name)
@@ -40,8 +40,14 @@ def _change_classes(node):
             node.children = []
 
         if node.type == T.t_complex_compat:
-            node.__class__ = node.compatnode.__class__
-            node.__dict__ = node.compatnode.__dict__
+            compatnode = node.compatnode
+            node.__class__ = compatnode.__class__
+            node.__dict__ = compatnode.__dict__
+            for name in T.fields:
+                try:
+                    setattr(node, name, getattr(compatnode, name))
+                except AttributeError:
+                    delattr(node, name)
             return
 
         if node.type == T.t_magicword:
@@ -4,9 +4,12 @@
 # Copyright (c) 2007-2009 PediaPress GmbH
 # See README.rst for additional licensing information.
 
+from timeit import default_timer as timer
+
 from mwlib.utoken import tokenize, show, token as T, walknode, walknodel
 from mwlib.refine import util
-from mwlib import tagext, uniq, nshandling
+from mwlib import tagext, uniq, nshandling, sitecontext, conf
+from mwlib._conf import as_bool
 
 from mwlib.refine.parse_table import parse_tables, parse_table_cells, parse_table_rows, fix_tables, remove_table_garbage
 from mwlib.refine.tagparser import tagparser
@@ -16,26 +19,6 @@ try:
 except ImportError:
     _core = None
 
-T.t_complex_table = "complex_table"
-T.t_complex_caption = "complex_caption"
-T.t_complex_table_row = "complex_table_row"
-T.t_complex_table_cell = "complex_table_cell"
-T.t_complex_tag = "complex_tag"
-T.t_complex_link = "link"
-T.t_complex_section = "section"
-T.t_complex_article = "article"
-T.t_complex_indent = "indent"
-T.t_complex_line = "line"
-T.t_complex_named_url = "named_url"
-T.t_complex_style = "style"
-T.t_complex_node = "node"
-T.t_complex_preformatted = "preformatted"
-T.t_complex_compat = "compat"
-
-T.t_vlist = "vlist"
-
-T.children = None
-
 
 def get_token_walker(skip_tags=set()):
     def walk(tokens):
@@ -76,6 +59,11 @@ def parse_inputbox(tokens, xopts):
             del t.children[:]
 
 
+# inputbox nodes of nested parses (like the children of <ref>) are handled again
+parse_inputbox.triggers = tagparser.triggers | set([T.t_complex_tag])
+parse_inputbox.produces = tagparser.produces
+
+
 def _parse_gallery_txt(txt, xopts):
     lines = [x.strip() for x in txt.split("\n")]
     sub = []
@@ -103,13 +91,16 @@ class bunch(object):
 
 
 class parse_sections(object):
+    triggers = set([T.t_section])
+    produces = set([T.t_complex_section])
+
     def __init__(self, tokens, xopts):
         self.tokens = tokens
         self.run()
 
     def run(self):
         tokens = self.tokens
-        i = 0
+        res = []
 
         sections = []
         current = bunch(start=None, end=None, endtitle=None)
@@ -118,85 +109,88 @@ class parse_sections(object):
             if current.start is None or current.endtitle is None:
                 return False
 
-            l1 = tokens[current.start].text.count("=")
-            l2 = tokens[current.endtitle].text.count("=")
+            l1 = res[current.start].text.count("=")
+            l2 = res[current.endtitle].text.count("=")
             level = min(l1, l2)
 
             # FIXME: make this a caption
-            caption = T(type=T.t_complex_node, children=tokens[current.start + 1:current.endtitle])
+            caption = T(type=T.t_complex_node, children=res[current.start + 1:current.endtitle])
             if l2 > l1:
                 caption.children.append(T(type=T.t_text, text=u"=" * (l2 - l1)))
             elif l1 > l2:
                 caption.children.insert(0, T(type=T.t_text, text=u"=" * (l1 - l2)))
 
-            body = T(type=T.t_complex_node, children=tokens[current.endtitle + 1:i])
+            body = T(type=T.t_complex_node, children=res[current.endtitle + 1:])
 
             sect = T(type=T.t_complex_section, tagname="@section",
                      children=[caption, body], level=level, blocknode=True)
-            tokens[current.start:i] = [sect]
+            del res[current.start:]
 
             while sections and level <= sections[-1].level:
                 sections.pop()
             if sections:
-                sections[-1].children.append(tokens[current.start])
-                del tokens[current.start]
-                current.start -= 1
+                sections[-1].children.append(sect)
+            else:
+                res.append(sect)
 
             sections.append(sect)
             return True
 
-        while i < len(self.tokens):
-            t = tokens[i]
+        for t in tokens:
             if t.type == T.t_section:
                 if create():
-                    i = current.start + 1
                     current = bunch(start=None, end=None, endtitle=None)
-                else:
-                    current.start = i
-                    i += 1
+                current.start = len(res)
             elif t.type == T.t_section_end:
-                current.endtitle = i
-                i += 1
-            else:
-                i += 1
+                current.endtitle = len(res)
+            res.append(t)
 
         create()
+        tokens[:] = res
 
 
 class parse_urls(object):
+    triggers = set([T.t_urllink])
+    produces = set([T.t_complex_named_url, T.t_special])
+
     def __init__(self, tokens, xopts):
         self.tokens = tokens
         self.run()
 
     def run(self):
         tokens = self.tokens
-        i = 0
+        res = []
         start = None
-        while i < len(tokens):
-            t = tokens[i]
 
+        def create():
+            sub = res[start + 1:]
+            node = T(type=T.t_complex_named_url, children=sub, caption=res[start].text[1:])
+            del res[start:]
+            res.append(node)
+
+        for t in tokens:
             if t.type == T.t_urllink and start is None:
-                start = i
-                i += 1
+                start = len(res)
+                res.append(t)
             elif t.type == T.t_special and t.text == "]" and start is not None:
-                sub = self.tokens[start + 1:i]
-                self.tokens[start:i + 1] = [T(type=T.t_complex_named_url,
-                                              children=sub, caption=self.tokens[start].text[1:])]
-                i = start
+                create()
                 start = None
             elif t.type == T.t_2box_close and start is not None:
-                self.tokens[i].type = T.t_special
-                self.tokens[i].text = "]"
-                sub = self.tokens[start + 1:i]
-                self.tokens[start:i] = [
-                    T(type=T.t_complex_named_url, children=sub, caption=self.tokens[start].text[1:])]
-                i = start
+                t.type = T.t_special
+                t.text = "]"
+                create()
+                res.append(t)
                 start = None
             else:
-                i += 1
+                res.append(t)
+
+        tokens[:] = res
 
 
 class parse_singlequote(object):
+    triggers = set([T.t_singlequote])
+    produces = set([T.t_complex_style, T.t_complex_node])
+
     def __init__(self, tokens, xopts):
         self.tokens = tokens
         self.run()
@@ -227,84 +221,83 @@ class parse_singlequote(object):
                     styles[i].type = T.t_complex_node
 
         tokens = self.tokens
-        pos = 0
+        res = []
         start = None
         counts = []
         styles = []
 
-        while pos < len(tokens):
-            t = tokens[pos]
+        def create():
+            style = T(type=T.t_complex_style, children=res[start + 1:])
+            del res[start:]
+            res.append(style)
+            styles.append(style)
+
+        for t in tokens:
             if t.type == T.t_singlequote:
-                if start is None:
-                    counts.append(len(t.text))
-                    start = pos
-                    pos += 1
-                else:
-                    tokens[start:pos] = [T(type=T.t_complex_style, children=tokens[start + 1:pos])]
-                    styles.append(tokens[start])
-                    pos = start + 1
-                    start = None
+                if start is not None:
+                    create()
+                # a closing quote also starts the next style
+                counts.append(len(t.text))
+                start = len(res)
             elif t.type == T.t_newline:
                 if start is not None:
-                    tokens[start:pos] = [T(type=T.t_complex_style, children=tokens[start + 1:pos])]
-                    styles.append(tokens[start])
-                    pos = start
+                    create()
                     start = None
-                pos += 1
 
                 if counts:
                     finish()
                     counts = []
                     styles = []
-            else:
-                pos += 1
+            res.append(t)
 
         if start is not None:
-            tokens[start:pos] = [T(type=T.t_complex_style, children=tokens[start + 1:pos])]
-            styles.append(tokens[start])
+            create()
 
         if counts:
             finish()
 
+        tokens[:] = res
+
 
 class parse_preformatted(object):
-    need_walker = False
+    skip_tags = set(["table", "li", "tr", "@section"])
+    triggers = set([T.t_pre])
+    produces = set([T.t_complex_preformatted])
 
     def __init__(self, tokens, xopts):
-        walker = get_token_walker(skip_tags=set(["table", "li", "tr", "@section"]))
-        for t in walker(tokens):
-            self.tokens = t
-            self.run()
+        self.tokens = tokens
+        self.run()
 
     def run(self):
         tokens = self.tokens
-        i = 0
+        res = []
         start = None
-        while i < len(tokens):
-            t = tokens[i]
+        for t in tokens:
             if t.type == T.t_pre:
                 assert start is None
-                start = i
-                i += 1
+                start = len(res)
             elif t.type == T.t_newline and start is not None:
-                sub = tokens[start + 1:i + 1]
-                if start > 0 and tokens[start - 1].type == T.t_complex_preformatted:
-                    del tokens[start:i + 1]
-                    tokens[start - 1].children.extend(sub)
-                    i = start
+                sub = res[start + 1:]
+                sub.append(t)
+                del res[start:]
+                if start > 0 and res[-1].type == T.t_complex_preformatted:
+                    res[-1].children.extend(sub)
                 else:
-                    tokens[start:i + 1] = [T(type=T.t_complex_preformatted,
-                                             children=sub, blocknode=True)]
-                    i = start + 1
+                    res.append(T(type=T.t_complex_preformatted,
+                                 children=sub, blocknode=True))
                 start = None
+                continue
             elif t.blocknode or (t.type == T.t_complex_tag and t.tagname in ("blockquote", "table", "timeline", "div")):
                 start = None
-                i += 1
-            else:
-                i += 1
+            res.append(t)
+
+        tokens[:] = res
 
 
 class parse_lines(object):
+    triggers = set([T.t_item, T.t_colon])
+    produces = set([T.t_complex_style, T.t_complex_tag, T.t_complex_node])
+
     def __init__(self, tokens, xopts):
         self.tokens = tokens
         self.run()
@@ -323,17 +316,19 @@ class parse_lines(object):
                 return node.lineprefix[0]
             return None
 
-        lines.append(T(type=T.t_complex_line, lineprefix='<guard>'))  # guard
-
-        startpos = 0
-        while startpos < len(lines) - 1:
-            prefix = getchar(lines[startpos])
+        # the result is collected in a new list, deleting the lines moved
+        # into items would be quadratic in the number of lines
+        res = []
+        pos = 0
+        while pos < len(lines):
+            prefix = getchar(lines[pos])
             if prefix is None:
-                if lines[startpos].tagname:
-                    lines[startpos].type = T.t_complex_tag
+                if lines[pos].tagname:
+                    lines[pos].type = T.t_complex_tag
                 else:
-                    lines[startpos].type = T.t_complex_node
-                startpos += 1
+                    lines[pos].type = T.t_complex_node
+                res.append(lines[pos])
+                pos += 1
                 continue
 
             endtag = None
@@ -361,30 +356,29 @@ class parse_lines(object):
             node.children = []
             dd = None
 
-            def appendline():
-                line = lines[startpos]
+            def appendline(pos):
+                line = lines[pos]
                 if endtag:
                     for i, x in enumerate(line.children):
                         if x.rawtagname == endtag and x.type == T.t_html_tag_end:
                             after = line.children[i + 1:]
                             del line.children[i:]
                             item.children.append(line)
-                            lines[startpos] = T(type=T.t_complex_line, tagname="p",
-                                                lineprefix=None, children=after)
-                            return
+                            lines[pos] = T(type=T.t_complex_line, tagname="p",
+                                           lineprefix=None, children=after)
+                            return pos
 
-                item.children.append(lines[startpos])
-                del lines[startpos]
+                item.children.append(line)
+                return pos + 1
 
-            while startpos < len(lines) - 1 and getchar(lines[startpos]) == prefix:
+            while pos < len(lines) and getchar(lines[pos]) == prefix:
                 # collect items
                 item = newitem()
                 item.children = []
-                appendline()
+                pos = appendline(pos)
 
-                while startpos < len(
-                        lines) - 1 and prefix == getchar(lines[startpos]) and len(lines[startpos].lineprefix) > 1:
-                    appendline()
+                while pos < len(lines) and prefix == getchar(lines[pos]) and len(lines[pos].lineprefix) > 1:
+                    pos = appendline(pos)
 
                 for x in item.children:
                     x.lineprefix = x.lineprefix[1:]
@@ -397,75 +391,68 @@ class parse_lines(object):
                 if prefix in ":;":
                     break
 
-            lines.insert(startpos, node)
-            startpos += 1
+            res.append(node)
             if dd is not None:
-                lines.insert(startpos, dd)
-                startpos += 1
-        del lines[-1]  # remove guard
+                res.append(dd)
+
+        lines[:] = res
 
     def run(self):
         tokens = self.tokens
-        i = 0
+        res = []
         lines = []
         startline = None
         firsttoken = None
 
         def getlineprefix():
-            return (tokens[startline].text or "").strip()
+            return (res[startline].text or "").strip()
 
-        while i < len(self.tokens):
-            t = tokens[i]
+        def replace_lines():
+            self.analyze(lines)
+            res[firsttoken:] = lines
+
+        for t in tokens:
             if t.type in (T.t_item, T.t_colon):
                 if firsttoken is None:
-                    firsttoken = i
-                startline = i
-                i += 1
+                    firsttoken = len(res)
+                startline = len(res)
             elif t.type == T.t_newline and startline is not None:
-                sub = self.tokens[startline + 1:i + 1]
+                sub = res[startline + 1:]
+                sub.append(t)
                 lines.append(
-                    T(type=T.t_complex_line, start=tokens[startline].start, len=0, children=sub, lineprefix=getlineprefix()))
+                    T(type=T.t_complex_line, start=res[startline].start, len=0, children=sub, lineprefix=getlineprefix()))
                 startline = None
-                i += 1
             elif t.type == T.t_break:
                 if startline is not None:
-                    sub = self.tokens[startline + 1:i]
+                    sub = res[startline + 1:]
                     lines.append(
-                        T(type=T.t_complex_line, start=tokens[startline].start, len=0, children=sub, lineprefix=getlineprefix()))
+                        T(type=T.t_complex_line, start=res[startline].start, len=0, children=sub, lineprefix=getlineprefix()))
                     startline = None
                 if lines:
-                    self.analyze(lines)
-                    self.tokens[firsttoken:i] = lines
-                    i = firsttoken
-                    firsttoken = None
-                    lines = []
-                    continue
-
+                    replace_lines()
                 firsttoken = None
-
                 lines = []
-                i += 1
-            else:
-                if startline is None and lines:
-                    self.analyze(lines)
-                    self.tokens[firsttoken:i] = lines
-                    i = firsttoken
-                    lines = []
-                    firsttoken = None
-                else:
-                    i += 1
+            elif startline is None and lines:
+                replace_lines()
+                lines = []
+                firsttoken = None
+            res.append(t)
 
         if startline is not None:
-            sub = self.tokens[startline + 1:]
+            sub = res[startline + 1:]
             lines.append(
-                T(type=T.t_complex_line, start=tokens[startline].start, children=sub, lineprefix=getlineprefix()))
+                T(type=T.t_complex_line, start=res[startline].start, children=sub, lineprefix=getlineprefix()))
 
         if lines:
-            self.analyze(lines)
-            self.tokens[firsttoken:] = lines
+            replace_lines()
+
+        tokens[:] = res
 
 
 class parse_links(object):
+    triggers = set([T.t_2box_close])
+    produces = set([T.t_complex_link])
+
     def __init__(self, tokens, xopts):
         self.xopts = xopts
         lang = xopts.lang
@@ -478,7 +465,7 @@ class parse_links(object):
         assert self.nshandler is not None, 'nshandler not set'
 
         if imagemod is None:
-            imagemod = util.ImageMod()
+            imagemod = sitecontext.get_imagemod()
         self.imagemod = imagemod
 
         self.run()
@@ -493,42 +480,40 @@ class parse_links(object):
 
         return True
 
-    def extract_image_modifiers(self, marks, node):
+    def extract_image_modifiers(self, tokens, marks, node):
         cap = None
         for i in range(1, len(marks) - 1):
-            tmp = self.tokens[marks[i] + 1:marks[i + 1]]
+            tmp = tokens[marks[i] + 1:marks[i + 1]]
             if not self.handle_image_modifier(T.join_as_text(tmp), node):
                 cap = tmp
         return cap
 
     def run(self):
         tokens = self.tokens
-        i = 0
+        # the links are collected in a new list with the marks pointing
+        # into it, so that a link only costs the tokens it wraps
+        res = []
         marks = []
 
         stack = []
 
-        while i < len(self.tokens):
-            t = tokens[i]
+        for t in tokens:
             if t.type == T.t_2box_open:
                 if len(marks) > 1:
                     stack.append(marks)
-                marks = [i]
-                i += 1
+                marks = [len(res)]
             elif t.type == T.t_newline and len(marks) < 2:
                 if stack:
                     marks = stack.pop()
                 else:
                     marks = []
-                i += 1
             elif t.type == T.t_special and t.text == "|":
-                marks.append(i)
-                i += 1
+                marks.append(len(res))
             elif t.type == T.t_2box_close and marks:
-                marks.append(i)
+                marks.append(len(res))
                 start = marks[0]
 
-                target = T.join_as_text(tokens[start + 1:marks[1]]).strip()
+                target = T.join_as_text(res[start + 1:marks[1]]).strip()
                 target = target.strip(u"\u200e\u200f")
                 if target.startswith(":"):
                     target = target[1:]
@@ -561,7 +546,7 @@ class parse_links(object):
                     interwiki = None
 
                 if not ilink and not partial:
-                    i += 1
+                    res.append(t)
                     if stack:
                         marks = stack.pop()
                     else:
@@ -577,127 +562,351 @@ class parse_links(object):
 
                 sub = None
                 if ns == nshandling.NS_IMAGE:
-                    sub = self.extract_image_modifiers(marks, node)
+                    sub = self.extract_image_modifiers(res, marks, node)
                 elif len(marks) > 2:
-                    sub = tokens[marks[1] + 1:marks[-1]]
+                    sub = res[marks[1] + 1:marks[-1]]
 
                 if sub is None:
                     sub = []
 
                 node.children = sub
-                tokens[start:i + 1] = [node]
+                del res[start:]
+                res.append(node)
                 node.target = target
                 node.full_target = full
                 if stack:
                     marks = stack.pop()
                 else:
                     marks = []
-                i = start + 1
-            else:
-                i += 1
+                continue
+
+            res.append(t)
+
+        tokens[:] = res
 
 
 class parse_paragraphs(object):
-    need_walker = False
+    skip_tags = set(["p", "ol", "ul", "table", "tr", "@section"])
+    # breaks and the types of block nodes
+    triggers = set([T.t_break, T.t_complex_tag, T.t_complex_section, T.t_complex_preformatted,
+                    T.t_complex_link, T.t_complex_table, T.t_complex_node])
+    produces = set([T.t_complex_tag])
 
     def __init__(self, tokens, xopts):
-        walker = get_token_walker(skip_tags=set(["p", "ol", "ul", "table", "tr", "@section"]))
-        for t in walker(tokens):
-            self.tokens = t
-            self.run()
+        self.tokens = tokens
+        self.run()
 
     def run(self):
         tokens = self.tokens
-        i = 0
-        first = 0
+        res = []
+        sub = []
+        found = False
 
-        def create(delta=1):
-            sub = tokens[first:i]
-            if sub:
-                tokens[first:i + delta] = [T(type=T.t_complex_tag,
-                                             tagname='p', children=sub, blocknode=True)]
+        def create():
+            res.append(T(type=T.t_complex_tag, tagname='p', children=sub, blocknode=True))
 
-        while i < len(self.tokens):
-            t = tokens[i]
+        for t in tokens:
             if t.type == T.t_break:
-                create()
-                first += 1
-                i = first
-            elif t.blocknode:  # blocknode
-                create(delta=0)
-                first += 1
-                i = first
+                found = True
+                if sub:
+                    create()  # drops the break
+                    sub = []
+                else:
+                    res.append(t)
+            elif t.blocknode:
+                found = True
+                if sub:
+                    create()
+                    sub = []
+                res.append(t)
             else:
-                i += 1
+                sub.append(t)
 
-        if first:
-            create()
+        # nothing changes without breaks and block nodes
+        if found:
+            if sub:
+                create()
+            tokens[:] = res
+
+
+default_skip_tags = set(["table", "tr", "@section"])
+
+_type_bits = {}
+
+
+def get_type_mask(types):
+    """return the bitmask with the bits of the token types in types set.
+    Bits are assigned to the types on first use."""
+    mask = 0
+    for x in types:
+        try:
+            mask |= _type_bits[x]
+        except KeyError:
+            mask |= _type_bits.setdefault(x, 1 << len(_type_bits))
+    return mask
+
+
+def get_parser_name(p):
+    if isinstance(p, tagparser):
+        return "tagparser(%s)" % (",".join(sorted(p.name2tag)),)
+    return getattr(p, "__name__", None) or p.__class__.__name__
+
+
+class fused_parsers(object):
+    """run a sequence of parsers in a single traversal of the token tree
+
+    Each parser declares:
+
+    triggers -- the token types it reacts to or None. It is not run on
+                lists of tokens, which contain none of them.
+    produces -- the token types it may introduce into the list
+    skip_tags -- it is not run on the children of nodes with these tags
+                 (default_skip_tags)
+    restructures -- whether it wraps siblings into new nodes (True)
+    retags -- whether it changes the tagname of nodes with children (False)
+
+    Every list is handed to all parsers before its children are visited.
+    A list created by a parser is only handed to the parsers following
+    it, as if each parser had walked the tree on its own.
+
+    Each list carries the mask of the token types in it and the mask of
+    the token types in the whole subtree below it (see get_type_mask).
+    Subtrees, in which none of the parsers can be triggered, are not
+    visited at all (unless skip_subtrees is false).
+    """
+
+    skip_subtrees = True
+
+    def __init__(self, parsers, xopts, timings=None):
+        self.parsers = []
+        for i, p in enumerate(parsers):
+            triggers = p.triggers
+            if triggers is not None:
+                triggers = get_type_mask(triggers)
+            produces = getattr(p, "produces", None)
+            if produces is not None:
+                produces = get_type_mask(produces)
+            self.parsers.append((i, p, getattr(p, "skip_tags", default_skip_tags), triggers, produces,
+                                 getattr(p, "restructures", True), getattr(p, "retags", False)))
+        self.xopts = xopts
+        self.timings = timings
+
+        # id -> [list, index of the first parser to run, mask of its token
+        # types, mask of the token types in its subtree], keeps the lists
+        # alive, so that their ids are not reused
+        self.first = {}
+        # id -> (index of the retagging parser, tagname of the owner before)
+        self.retagged = {}
+        # (first parser, tagname of the owner, retagged) -> parsers to run
+        self.schedules = {}
+        # subtree mask -> whether any parser may be triggered
+        self.needed = {}
+
+    def get_schedule(self, start, tagname, retagged):
+        key = (start, tagname, retagged)
+        try:
+            return self.schedules[key]
+        except KeyError:
+            pass
+
+        res = []
+        for x in self.parsers[start:]:
+            if retagged is not None and x[0] <= retagged[0]:
+                if retagged[1] not in x[2]:
+                    res.append(x)
+            elif tagname not in x[2]:
+                res.append(x)
+
+        self.schedules[key] = res
+        return res
+
+    def is_needed(self, mask):
+        """whether any parser may be triggered in a subtree with mask"""
+        try:
+            return self.needed[mask]
+        except KeyError:
+            pass
+
+        # no parser has to be run, unless one of them is triggered by the
+        # types already there. so the types they produce do not matter.
+        res = False
+        for x in self.parsers:
+            if x[3] is None or x[3] & mask:
+                res = True
+                break
+        self.needed[mask] = res
+        return res
+
+    def set_entry(self, tokens, start):
+        """register tokens as created by the parser before start. all
+        non-empty lists below tokens must have been registered before."""
+        first = self.first
+        mask = get_type_mask(set([t.type for t in tokens]))
+        subtree = mask
+        for t in tokens:
+            if t.children:
+                subtree |= first[id(t.children)][3]
+        first[id(tokens)] = [tokens, start, mask, subtree]
+
+    def register(self, tokens, start):
+        """register the lists below tokens, which are not known yet, as
+        created by the parser before start"""
+        first = self.first
+        new = []
+        todo = [tokens]
+        while todo:
+            for t in todo.pop():
+                children = t.children
+                if children is not None and id(children) not in first:
+                    first[id(children)] = None
+                    new.append(children)
+                    todo.append(children)
+
+        # children before their parents
+        for x in reversed(new):
+            self.set_entry(x, start)
+
+    def run(self, p, tokens):
+        if self.timings is None:
+            p(tokens, self.xopts)
+            return
+
+        stime = timer()
+        p(tokens, self.xopts)
+        needed = timer() - stime
+        name = get_parser_name(p)
+        self.timings[name] = self.timings.get(name, 0.0) + needed
+        self.spent += needed
+
+    def process(self, tokens, owner, entry):
+        tagname = owner.tagname if owner is not None else None
+        mask = entry[2]
+
+        for i, p, skip_tags, triggers, produces, restructures, retags in self.get_schedule(
+                entry[1], tagname, self.retagged.get(id(tokens))):
+            if triggers is not None:
+                if mask is None:
+                    mask = get_type_mask(set([t.type for t in tokens]))
+                if not triggers & mask:
+                    continue
+
+            if retags:
+                owners = [(t, t.tagname) for t in tokens if t.children]
+
+            self.run(p, tokens)
+
+            if produces is None:
+                mask = None
+            elif mask is not None:
+                mask |= produces
+
+            if restructures:
+                self.register(tokens, i + 1)
+            if retags:
+                for t, before in owners:
+                    if t.tagname != before and id(t.children) not in self.retagged:
+                        self.retagged[id(t.children)] = (i, before)
+
+    def __call__(self, tokens):
+        stime = timer()
+        self.spent = 0.0
+
+        first = self.first
+        for x in reversed(list(get_token_walker()(tokens))):
+            self.set_entry(x, 0)
+
+        skip_subtrees = self.skip_subtrees
+        is_needed = self.is_needed
+
+        self.process(tokens, None, first[id(tokens)])
+        todo = [tokens]
+        while todo:
+            for t in todo.pop():
+                children = t.children
+                if children:
+                    entry = first[id(children)]
+                    if skip_subtrees and not is_needed(entry[3]):
+                        continue
+                    self.process(children, t, entry)
+                    todo.append(children)
+
+        if self.timings is not None:
+            self.timings["traversal"] = self.timings.get("traversal", 0.0) + timer() - stime - self.spent
 
 
 class combined_parser(object):
+    """run parsers from last to first over the token tree. Consecutive
+    parsers, which declare the token types they react to, are run by
+    fused_parsers unless MWLIB_REFINE_FUSED=0. The seconds spent in each
+    parser are added to xopts.timings, if it is a dict."""
+
+    fused = conf.get("refine", "fused", True, as_bool)
+
     def __init__(self, parsers):
         self.parsers = parsers
 
     def __call__(self, tokens, xopts):
         parsers = list(self.parsers)
-
-        default_walker = get_token_walker(skip_tags=set(["table", "tr", "@section"]))
+        timings = getattr(xopts, "timings", None)
 
         while parsers:
             p = parsers.pop()
 
+            if self.fused and hasattr(p, "triggers"):
+                group = [p]
+                while parsers and hasattr(parsers[-1], "triggers"):
+                    group.append(parsers.pop())
+                if len(group) > 1:
+                    fused_parsers(group, xopts, timings)(tokens)
+                    continue
+
+            stime = timer()
             need_walker = getattr(p, "need_walker", True)
             if need_walker:
-                # print "using default token walker for", p
-                walker = default_walker
+                walker = get_token_walker(skip_tags=getattr(p, "skip_tags", default_skip_tags))
                 for x in walker(tokens):
                     p(x, xopts)
             else:
                 p(tokens, xopts)
 
+            if timings is not None:
+                name = get_parser_name(p)
+                timings[name] = timings.get(name, 0.0) + timer() - stime
+
 
 def mark_style_tags(tokens, xopts):
     tags = set("abbr tt strike ins del small sup sub b strong cite i u em big font s var kbd".split())
 
-    todo = [(0, dict(), tokens)]
+    # (position in tokens, open tags, tokens, new content of tokens)
+    todo = [(0, dict(), tokens, [])]
 
     def create():
-        if not state or i <= start:
-            return False
+        if not state or len(res) <= start:
+            return
 
-        children = tokens[start:i]
+        children = res[start:]
         for tag, tok in state.items():
             outer = T(type=T.t_complex_tag, tagname=tag, children=children, vlist=tok.vlist)
             children = [outer]
-        tokens[start:i] = [outer]
-        return True
+        res[start:] = [outer]
 
     while todo:
-        i, state, tokens = todo.pop()
-        start = i
+        i, state, tokens, res = todo.pop()
+        start = len(res)
         while i < len(tokens):
             t = tokens[i]
+            i += 1
             if t.type == T.t_html_tag and t.rawtagname in tags:
-                del tokens[i]
                 if t.tag_selfClosing:
                     continue
 
+                create()
+                start = len(res)
                 if t.rawtagname in state:
-                    if create():
-                        start += 1
-                        i = start
-                    start = i
-
                     del state[t.rawtagname]
-                    continue
-
-                if create():
-                    start += 1
-                    i = start
-                start = i
-                state[t.rawtagname] = t
+                else:
+                    state[t.rawtagname] = t
             elif t.type == T.t_html_tag_end and t.rawtagname in tags:
-                del tokens[i]
                 rawtagname = t.rawtagname
 
                 if rawtagname not in state:
@@ -707,31 +916,33 @@ def mark_style_tags(tokens, xopts):
                         rawtagname = "sup"
 
                 if rawtagname in state:
-                    if create():
-                        start += 1
-                        i = start
+                    create()
+                    start = len(res)
                     del state[rawtagname]
             elif t.children:
-                if create():
-                    start += 1
-                    i = start
-                assert tokens[i] is t
+                create()
+                res.append(t)
                 if t.type in (T.t_complex_table, T.t_complex_table_row, T.t_complex_table_cell):
-                    todo.append((i + 1, state, tokens))
-                    todo.append((0, dict(), t.children))
+                    todo.append((i, state, tokens, res))
+                    todo.append((0, dict(), t.children, []))
                 else:
-                    todo.append((i + 1, state, tokens))
-                    todo.append((0, state, t.children))
+                    todo.append((i, state, tokens, res))
+                    todo.append((0, state, t.children, []))
                 break
             else:
-                i += 1
-        create()
+                res.append(t)
+        else:
+            create()
+            tokens[:] = res
 
 
 mark_style_tags.need_walker = False
 
 
 class parse_uniq(object):
+    triggers = set([T.t_uniq])
+    produces = set([T.t_complex_tag, T.t_complex_compat, T.t_text])
+
     def __init__(self, tokens, xopts):
         self.tagextensions = tagext.default_registry
 
@@ -894,7 +1105,8 @@ class parse_uniq(object):
                 pages = [u"%s/%s" % (base, i) for i in range(si, ei + 1)]
 
             rawtext = u"".join(u"{{%s}}\n" % x for x in pages)
-            te = expander.__class__(rawtext, pagename=expander.pagename, wikidb=expander.db)
+            te = expander.__class__(rawtext, pagename=expander.pagename, wikidb=expander.db,
+                                    budget=expander.budget)
             children = parse_txt(te.expandTemplates(True),
                                  xopts=XBunch(**xopts.__dict__),
                                  expander=te,
@@ -941,6 +1153,11 @@ def fix_named_url_double_brackets(tokens, xopt):
     fix_urllink_inside_link(tokens, xopt)
 
 
+fix_named_url_double_brackets.triggers = set([T.t_2box_open, T.t_urllink])
+fix_named_url_double_brackets.produces = set([T.t_special, T.t_urllink])
+fix_named_url_double_brackets.restructures = False
+
+
 def fix_break_between_pre(tokens, xopt):
     idx = 0
     while idx < len(tokens) - 1:
@@ -952,12 +1169,18 @@ def fix_break_between_pre(tokens, xopt):
             idx += 1
 
 
+fix_break_between_pre.triggers = set([T.t_pre])
+fix_break_between_pre.produces = set([T.t_newline])
+fix_break_between_pre.restructures = False
+
+
 def fixlitags(tokens, xopts):
     root = T(type=T.t_complex_tag, tagname="div")
     todo = [(root, tokens)]
     while todo:
         parent, tokens = todo.pop()
         if parent.tagname not in ("ol", "ul"):
+            res = []
             idx = 0
             while idx < len(tokens):
                 start = idx
@@ -965,11 +1188,13 @@ def fixlitags(tokens, xopts):
                     idx += 1
 
                 if idx > start:
-                    lst = T(type=T.t_complex_tag, tagname="ul", children=tokens[start:idx])
-                    tokens[start:idx + 1] = [lst]
-                    idx = start + 1
+                    res.append(T(type=T.t_complex_tag, tagname="ul", children=tokens[start:idx]))
+                    # the token following the items is dropped
+                    idx += 1
                 else:
+                    res.append(tokens[idx])
                     idx += 1
+            tokens[:] = res
 
         for t in tokens:
             if t.children:
@@ -992,7 +1217,7 @@ def parse_txt(txt, xopts=None, **kwargs):
     if xopts.nshandler is None:
         xopts.nshandler = nshandling.get_nshandler_for_lang(xopts.lang or 'en')
 
-    xopts.imagemod = util.ImageMod(xopts.magicwords)
+    xopts.imagemod = sitecontext.get_imagemod(xopts.magicwords)
 
     uniquifier = xopts.uniquifier
     if uniquifier is None:
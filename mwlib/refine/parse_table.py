@@ -45,21 +45,23 @@ class parse_table_cells(object):
 
     def run(self):
         tokens = self.tokens
-        i = 0
         start = None
         self.is_header = False
 
-        def makecell(skip_end=0):
-            st = tokens[start].text.strip()
+        # cells are built at the end of res, never in the middle of tokens
+        res = []
+
+        def makecell():
+            st = res[start].text.strip()
             if st == "|":
                 self.is_header = False
             elif st == "!":
                 self.is_header = True
             is_header = self.is_header
 
-            if tokens[start].rawtagname == "th":
+            if res[start].rawtagname == "th":
                 is_header = True
-            elif tokens[start].rawtagname == "td":
+            elif res[start].rawtagname == "td":
                 is_header = False
 
             if is_header:
@@ -67,39 +69,37 @@ class parse_table_cells(object):
             else:
                 tagname = "td"
 
-            search_modifier = tokens[start].text.strip() in ("|", "!", "||", "!!")
-            sub = tokens[start + 1:i - skip_end]
+            search_modifier = res[start].text.strip() in ("|", "!", "||", "!!")
+            sub = res[start + 1:]
             self.replace_tablecaption(sub)
-            tokens[start:i] = [T(type=T.t_complex_table_cell, tagname=tagname,
-                                 start=tokens[start].start, children=sub,
-                                 vlist=tokens[start].vlist, is_header=is_header)]
+            cell = T(type=T.t_complex_table_cell, tagname=tagname,
+                     start=res[start].start, children=sub,
+                     vlist=res[start].vlist, is_header=is_header)
+            del res[start:]
+            res.append(cell)
             if search_modifier:
-                self.find_modifier(tokens[start])
+                self.find_modifier(cell)
 
-        while i < len(tokens):
-            if self.is_table_cell_start(tokens[i]):
+        for t in tokens:
+            if self.is_table_cell_start(t):
                 if start is not None:
                     makecell()
-                    start += 1
-                    i = start + 1
-                else:
-                    start = i
-                    i += 1
-
-            elif self.is_table_cell_end(tokens[i]):
+                start = len(res)
+                res.append(t)
+            elif self.is_table_cell_end(t):
                 if start is not None:
-                    i += 1
-                    makecell(skip_end=1)
-                    i = start + 1
+                    makecell()
                     start = None
                 else:
-                    i += 1
+                    res.append(t)
             else:
-                i += 1
+                res.append(t)
 
         if start is not None:
             makecell()
 
+        tokens[:] = res
+
 
 class parse_table_rows(object):
     def __init__(self, tokens, xopts):
@@ -129,8 +129,6 @@ class parse_table_rows(object):
 
     def run(self):
         tokens = self.tokens
-        i = 0
-
         start = None
         remove_start = 1
         rowbegintoken = None
@@ -147,56 +145,51 @@ class parse_table_rows(object):
                 return {}
             return dict(vlist=rowbegintoken.vlist)
 
-        while i < len(tokens):
-            if start is None and self.is_table_cell_start(tokens[i]):
+        res = []
+
+        def makerow():
+            children = res[start + remove_start:]
+            row = T(type=T.t_complex_table_row, tagname="tr",
+                    start=res[start].start, children=children, **args())
+            del res[start:]
+            res.append(row)
+            if should_find_modifier():
+                self.find_modifier(row)
+            parse_table_cells(children, self.xopts)
+
+        for t in tokens:
+            if start is None and self.is_table_cell_start(t):
                 rowbegintoken = None
-                start = i
+                start = len(res)
                 remove_start = 0
-                i += 1
-            elif self.is_table_row_start(tokens[i]):
+                res.append(t)
+            elif self.is_table_row_start(t):
                 if start is not None:
-                    children = tokens[start + remove_start:i]
-                    tokens[start:i] = [T(type=T.t_complex_table_row, tagname="tr",
-                                         start=tokens[start].start, children=children, **args())]
-                    if should_find_modifier():
-                        self.find_modifier(tokens[start])
-                    parse_table_cells(children, self.xopts)
-                    start += 1  # we didn't remove the start symbol above
-                    rowbegintoken = tokens[start]
-                    remove_start = 1
-                    i = start + 1
-
-                else:
-                    rowbegintoken = tokens[i]
-                    remove_start = 1
-                    start = i
-                    i += 1
-            elif self.is_table_row_end(tokens[i]):
+                    makerow()
+                rowbegintoken = t
+                remove_start = 1
+                start = len(res)
+                res.append(t)
+            elif self.is_table_row_end(t):
                 if start is not None:
-                    sub = tokens[start + remove_start:i]
-                    tokens[start:i + 1] = [T(type=T.t_complex_table_row, tagname="tr",
-                                             start=tokens[start].start, children=sub, **args())]
-                    if should_find_modifier():
-                        self.find_modifier(tokens[start])
-                    parse_table_cells(sub, self.xopts)
-                    i = start + 1
+                    makerow()
                     start = None
                     rowbegintoken = None
                 else:
-                    i += 1
+                    res.append(t)
             else:
-                i += 1
+                res.append(t)
 
         if start is not None:
-            sub = tokens[start + remove_start:]
-            tokens[start:] = [T(type=T.t_complex_table_row, tagname="tr",
-                                start=tokens[start].start, children=sub, **args())]
-            if should_find_modifier():
-                self.find_modifier(tokens[start])
-            parse_table_cells(sub, self.xopts)
+            makerow()
+
+        tokens[:] = res
 
 
 class parse_tables(object):
+    triggers = set([T.t_begintable, T.t_html_tag])
+    produces = set([T.t_complex_table])
+
     def __init__(self, tokens, xopts):
         self.xopts = xopts
         self.tokens = tokens
@@ -269,43 +262,48 @@ class parse_tables(object):
 
     def run(self):
         tokens = self.tokens
-        i = 0
         stack = []
+        res = []
 
         def maketable():
             start = stack.pop()
-            starttoken = tokens[start]
-            sub = tokens[start + 1:i]
+            starttoken = res[start]
+            sub = res[start + 1:]
+            del res[start:]
             from mwlib.refine import core
             tp = core.tagparser()
             tp.add("caption", 5)
             tp(sub, self.xopts)
-            tokens[start:i + 1] = [T(type=T.t_complex_table,
-                                     tagname="table", start=tokens[start].start, children=sub,
-                                     vlist=starttoken.vlist, blocknode=True)]
+            table = T(type=T.t_complex_table,
+                      tagname="table", start=starttoken.start, children=sub,
+                      vlist=starttoken.vlist, blocknode=True)
+            res.append(table)
             if starttoken.text.strip() == "{|":
-                self.find_modifier(tokens[start])
+                self.find_modifier(table)
             self.handle_rows(sub)
-            self.find_caption(tokens[start])
-            return start
-
-        while i < len(tokens):
-            if self.is_table_start(tokens[i]):
-                stack.append(i)
-                i += 1
-            elif self.is_table_end(tokens[i]):
-                if stack:
-                    i = maketable() + 1
-                else:
-                    i += 1
+            self.find_caption(table)
+
+        for t in tokens:
+            if self.is_table_start(t):
+                stack.append(len(res))
+                res.append(t)
+            elif self.is_table_end(t) and stack:
+                maketable()
             else:
-                i += 1
+                res.append(t)
 
         while stack:
             maketable()
 
+        tokens[:] = res
+
 
 class fix_tables(object):
+    triggers = set([T.t_complex_table])
+    produces = set([T.t_complex_node])
+    restructures = False
+    retags = True
+
     def __init__(self, tokens, xopts):
         self.xopts = xopts
         self.tokens = tokens
@@ -361,30 +359,28 @@ def extract_garbage(tokens, is_allowed, is_whitespace=None):
 
 
 class remove_table_garbage(object):
-    need_walker = False
+    skip_tags = set()
+    triggers = set([T.t_complex_table])
+    produces = set([T.t_complex_node])
 
     def __init__(self, tokens, xopts):
-        from mwlib.refine import core
-        walker = core.get_token_walker()
-        for t in walker(tokens):
-            self.tokens = t
-            self.run()
+        self.tokens = tokens
+        self.run()
 
     def run(self):
         tokens = self.tokens
-        tableidx = 0
-        while tableidx < len(tokens):
-            if tokens[tableidx].type == T.t_complex_table:
-                # garbage = extract_garbage(tokens[tableidx].children,
+        res = []
+        for t in tokens:
+            res.append(t)
+            if t.type == T.t_complex_table:
+                # garbage = extract_garbage(t.children,
                 # is_allowed=lambda t: t.type in (T.t_complex_table_row,
                 # T.t_complex_caption))
 
-                tmp = []
-                for c in tokens[tableidx].children:
+                for c in t.children:
                     if c.type == T.t_complex_table_row:
                         rowgarbage = extract_garbage(c.children,
                                                      is_allowed=lambda t: t.type in (T.t_complex_table_cell, ))
-                        tmp.extend(rowgarbage)
+                        res.extend(rowgarbage)
 
-                tokens[tableidx + 1:tableidx + 1] = tmp
-            tableidx += 1
+        tokens[:] = res
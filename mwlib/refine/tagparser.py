@@ -18,6 +18,9 @@ class taginfo(object):
 
 
 class tagparser(object):
+    triggers = set([T.t_html_tag, T.t_html_tag_end])
+    produces = set([T.t_complex_tag])
+
     def __init__(self, tags=[]):
         self.name2tag = name2tag = {}
         for t in tags:
@@ -43,13 +46,15 @@ class tagparser(object):
 
         return 0
 
-    def close_stack(self, spos, tokens, pos):
+    def close_stack(self, spos, res):
+        """wrap the tokens following the open tags in the stack starting
+        at spos, which are all at the end of res"""
         close = self.stack[spos:]
         del self.stack[spos:]
         close.reverse()
 
         for i, t in close:
-            vlist = tokens[i].vlist
+            vlist = res[i].vlist
             display = vlist.get("style", {}).get("display", "").lower()
             if display == "inline":
                 blocknode = False
@@ -58,47 +63,42 @@ class tagparser(object):
             else:
                 blocknode = t.blocknode
 
-            sub = tokens[i + 1:pos]
-            tokens[i:pos] = [T(type=T.t_complex_tag, children=sub,
-                               tagname=t.tagname, blocknode=blocknode, vlist=tokens[i].vlist)]
-            pos = i + 1
-
-        return pos
+            sub = res[i + 1:]
+            del res[i:]
+            res.append(T(type=T.t_complex_tag, children=sub,
+                         tagname=t.tagname, blocknode=blocknode, vlist=vlist))
 
     def __call__(self, tokens, xopts):
-        pos = 0
         self.stack = stack = [self.guard]
         get = self.name2tag.get
 
-        while pos < len(tokens):
-            t = tokens[pos]
-            # print t
+        # the tags are wrapped in a new list, splicing tokens in place
+        # would be quadratic in the number of tags
+        res = []
+        for t in tokens:
             tag = get(t.rawtagname)
             if tag is None:
-                pos += 1
+                res.append(t)
                 continue
             if t.type == T.t_html_tag:
                 if t.tag_selfClosing:
-                    tokens[pos].type = T.t_complex_tag
-                    tokens[pos].tagname = tokens[pos].rawtagname
-                    tokens[pos].rawtagname = None
-                    pos += 1
+                    t.type = T.t_complex_tag
+                    t.tagname = t.rawtagname
+                    t.rawtagname = None
                 else:
                     if stack[-1][1].prio == tag.prio and not tag.nested:
-                        pos = self.close_stack(len(stack) - 1, tokens, pos)
-                        assert tokens[pos] is t
+                        self.close_stack(len(stack) - 1, res)
 
-                    stack.append((pos, tag))
-                    pos += 1
+                    stack.append((len(res), tag))
+                res.append(t)
             else:
                 assert t.type == T.t_html_tag_end
                 # find a matching tag in the stack
                 spos = self.find_in_stack(tag)
                 if spos:
-                    pos = self.close_stack(spos, tokens, pos)
-                    assert tokens[pos] is t
-                    del tokens[pos]
+                    self.close_stack(spos, res)
                 else:
-                    pos += 1
+                    res.append(t)
 
-        self.close_stack(1, tokens, pos)
+        self.close_stack(1, res)
+        tokens[:] = res
@@ -2,7 +2,7 @@
 # Copyright (c) 2007-2009 PediaPress GmbH
 # See README.rst for additional licensing information.
 
-from mwlib import expander, nshandling, metabook
+from mwlib import expander, nshandling, metabook, sitecontext
 from mwlib.log import Log
 from mwlib.refine import core, compat
 
@@ -59,7 +59,7 @@ def parseString(
     if siteinfo is None:
         nshandler = nshandling.get_nshandler_for_lang(lang)
     else:
-        nshandler = nshandling.nshandler(siteinfo)
+        nshandler = sitecontext.get_context(siteinfo).nshandler
     a = compat.parse_txt(input, title=title, wikidb=wikidb, nshandler=nshandler,
                          lang=lang, magicwords=magicwords, uniquifier=uniquifier, expander=te)
 
@@ -71,6 +71,7 @@ class ImageMod(object):
 
     def __init__(self, magicwords=None):
         self.alias_map = {}
+        self._compiled = {}
         self.initAliasMap(self.default_magicwords)
         if magicwords is not None:
             self.initAliasMap(magicwords)
@@ -89,12 +90,13 @@ class ImageMod(object):
             elif name in ['img_alt', 'img_link']:
                 aliases_regexp = aliases_regexp.replace('\\$1', '(.*)')
             self.alias_map[name] = aliases_regexp
+            self._compiled[name] = re.compile(aliases_regexp, re.IGNORECASE)
 
     def parse(self, mod):
         mod = mod.lower().strip()
-        for mod_type, mod_reg in self.alias_map.items():
-            rx = re.compile(mod_reg, re.IGNORECASE)
-            mo = rx.match(mod)
+        compiled = self._compiled
+        for mod_type in self.alias_map:
+            mo = compiled[mod_type].match(mod)
             if mo:
                 for match in mo.groups()[::-1]:
                     if match:
@@ -0,0 +1,98 @@
+# Copyright (c) 2007-2009 PediaPress GmbH
+# See README.rst for additional licensing information.
+
+"""tables, which only depend on the siteinfo
+
+get_context(siteinfo) returns a SiteContext holding the namespace
+handler, the magic word alias map, the regular expressions used by the
+template parser and the image modifier parser for siteinfo. Contexts are
+built once per process and shared by the template parser, the expander,
+refine.core.parse_txt and nuwiki. They are looked up by the identity of
+the siteinfo dict first and by a fingerprint of its content second, so
+siteinfo dicts must not be modified after they have been used.
+"""
+
+import re
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from hashlib import sha1
+
+from mwlib import lrucache, nshandling
+
+
+def fingerprint(siteinfo):
+    return sha1(json.dumps(siteinfo, sort_keys=True)).hexdigest()
+
+
+class SiteContext(object):
+    def __init__(self, siteinfo):
+        from mwlib.templ import parser
+
+        self.siteinfo = siteinfo
+        self.fingerprint = None
+        self.nshandler = nshandling.nshandler(siteinfo)
+        self.aliasmap = parser.aliasmap(siteinfo)
+
+        self.name2rx = {"if": re.compile("^#if:"),
+                        "switch": re.compile("^#switch:")}
+        for d in siteinfo.get("magicwords", []):
+            name = d["name"]
+            if name in ("if", "switch"):
+                aliases = [re.escape(x) for x in d["aliases"]]
+                rx = "^#(%s):" % ("|".join(aliases),)
+                self.name2rx[name] = re.compile(rx)
+
+        self._imagemod = None
+
+    @property
+    def imagemod(self):
+        if self._imagemod is None:
+            self._imagemod = get_imagemod(self.siteinfo.get("magicwords"))
+        return self._imagemod
+
+    def __repr__(self):
+        return "<SiteContext %s>" % (self.fingerprint,)
+
+
+_by_id = lrucache.mt_lrucache(32)  # id(obj) -> (obj, value), obj is kept alive
+_by_fingerprint = lrucache.mt_lrucache(32)
+
+
+def _lookup(obj, build):
+    try:
+        return _by_id[id(obj)][1]
+    except KeyError:
+        pass
+    value = build(obj)
+    _by_id[id(obj)] = (obj, value)
+    return value
+
+
+def _build_context(siteinfo):
+    fp = fingerprint(siteinfo)
+    try:
+        return _by_fingerprint[fp]
+    except KeyError:
+        pass
+    ctx = SiteContext(siteinfo)
+    _by_fingerprint[fp] = ctx
+
+    # nshandler fixes up the siteinfo of wikipedia sites in place
+    ctx.fingerprint = fingerprint(siteinfo)
+    _by_fingerprint[ctx.fingerprint] = ctx
+    return ctx
+
+
+def get_context(siteinfo):
+    """return the shared SiteContext for siteinfo"""
+    return _lookup(siteinfo, _build_context)
+
+
+def get_imagemod(magicwords=None):
+    """return a shared refine.util.ImageMod for magicwords"""
+    from mwlib.refine import util
+    return _lookup(magicwords, util.ImageMod)
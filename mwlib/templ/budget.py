@@ -0,0 +1,183 @@
+# Copyright (c) 2007-2009 PediaPress GmbH
+# See README.rst for additional licensing information.
+
+"""resource budget for the expansion of a single article
+
+Each Expander has a Budget, which limits the number of node evaluations,
+the size of the expanded output, the time spent expanding and the
+number of template calls. A limit of 0 disables the respective check,
+and all limits are 0 unless configured. The limits are read from the
+[expander] section of the configuration (e.g.
+MWLIB_EXPANDER_MAX_SECONDS) unless they have been set with set_limits,
+which mw-render does for the writer options named expander_max_nodes,
+expander_max_output, expander_max_seconds and expander_max_templates.
+Expanders created for the tags of an article (e.g. <pages>) share the
+budget of the article's expander. The clock starts with the first
+expansion, not when the Expander is created.
+
+Node evaluations are counted in batches of check_interval: the
+evaluators decrement expander.budget_ticks and call Budget.check once it
+drops below zero. It starts at -1, so the first node evaluation
+already calls check. Without limits on nodes, seconds and output, check
+sets it to sys.maxint, so that it is not called again during the
+expansion. Expander._expand accounts the remaining ticks
+when it is done, so that expanders can share a budget. check looks at the clock and the size of the
+output expanded so far. Once a limit has been hit, every
+further node evaluation raises BudgetExceeded, which Expander._expand
+catches: the article is cut off where the budget ran out.
+BudgetExceeded is no Exception, so that the handlers of parser
+functions like #expr do not turn it into an error message.
+"""
+
+import sys
+import time
+
+from mwlib import conf
+
+# name -> (default, convert)
+defaults = dict(max_nodes=(0, int),
+                max_output=(0, int),
+                max_seconds=(0, float),
+                max_templates=(0, int))
+
+# options accepted by mw-render in --writer-options
+writer_options = {
+    'expander_max_nodes': dict(param='N', help='stop expanding templates of an article after N node evaluations'),
+    'expander_max_output': dict(param='N', help='stop expanding templates of an article after N characters of output'),
+    'expander_max_seconds': dict(param='SECONDS', help='stop expanding templates of an article after SECONDS seconds'),
+    'expander_max_templates': dict(param='N', help='stop expanding templates of an article after N template calls'),
+}
+
+_limits = {}
+
+
+class BudgetExceeded(BaseException):
+    pass
+
+
+def set_limits(**kw):
+    """override the configured limits for all expanders created afterwards"""
+
+    for name, value in kw.items():
+        if name not in defaults:
+            raise ValueError("unknown expansion limit: %r" % (name,))
+        _limits[name] = defaults[name][1](value)
+
+
+def get_limit(name):
+    if name in _limits:
+        return _limits[name]
+    default, convert = defaults[name]
+    return conf.get("expander", name, default, convert)
+
+
+class Budget(object):
+    check_interval = 256
+
+    def __init__(self, max_nodes=None, max_output=None, max_seconds=None, max_templates=None):
+        if max_nodes is None:
+            max_nodes = get_limit("max_nodes")
+        if max_output is None:
+            max_output = get_limit("max_output")
+        if max_seconds is None:
+            max_seconds = get_limit("max_seconds")
+        if max_templates is None:
+            max_templates = get_limit("max_templates")
+
+        self.max_nodes = max_nodes
+        self.max_output = max_output
+        self.max_seconds = max_seconds
+        self.max_templates = max_templates
+
+        self.starttime = None
+        self.nodes = 0
+        self._interval = 0
+        self.templates = 0
+        self.exceeded = None
+
+        # the top level output buffer, how much of it has been measured
+        # and the size of the output of previous expansions
+        self.output = None
+        self._measured = 0
+        self._output_size = 0
+        self._previous_output = 0
+
+    def start(self):
+        """start the clock, unless it is already running"""
+
+        if self.starttime is None:
+            self.starttime = time.time()
+
+    def fail(self, reason):
+        if self.exceeded is None:
+            self.exceeded = reason
+        raise BudgetExceeded(self.exceeded)
+
+    def set_output(self, out):
+        """make out the top level output buffer. the output of the
+        previous buffer still counts towards max_output"""
+
+        self._previous_output = self.output_size()
+        self.output = out
+        self._measured = self._output_size = 0
+
+    def output_size(self):
+        out = self.output
+        if out is None:
+            return self._previous_output
+        n = len(out)
+        if n < self._measured:
+            # the buffer has been truncated
+            self._measured = self._output_size = 0
+        for i in xrange(self._measured, n):
+            self._output_size += len(out[i])
+        self._measured = n
+        return self._previous_output + self._output_size
+
+    def check(self, expander):
+        """account the node evaluations since the last check and raise
+        BudgetExceeded if a limit has been hit"""
+
+        self.account(expander)
+        if self.exceeded is not None:
+            self.fail(self.exceeded)
+
+        if self.max_nodes or self.max_seconds or self.max_output:
+            interval = self.check_interval
+        else:
+            interval = sys.maxint
+
+        if self.max_nodes:
+            if self.nodes > self.max_nodes:
+                self.fail("more than %d node evaluations" % (self.max_nodes,))
+            interval = min(interval, self.max_nodes - self.nodes)
+
+        if self.max_seconds and time.time() - self.starttime > self.max_seconds:
+            self.fail("expansion took longer than %s seconds" % (self.max_seconds,))
+
+        if self.max_output and self.output_size() > self.max_output:
+            self.fail("more than %d characters of output" % (self.max_output,))
+
+        self._interval = interval
+        expander.budget_ticks = interval - 1
+
+    def account(self, expander):
+        """account the node evaluations of expander since the last check.
+        the next node evaluation of any expander sharing this budget
+        calls check again"""
+
+        self.nodes += self._interval - expander.budget_ticks - 1
+        self._interval = 0
+        expander.budget_ticks = -1
+
+    def count_template(self):
+        self.templates += 1
+        if self.max_templates and self.templates > self.max_templates:
+            self.fail("more than %d template calls" % (self.max_templates,))
+
+    def __repr__(self):
+        seconds = 0.0
+        if self.starttime is not None:
+            seconds = time.time() - self.starttime
+        return "<Budget nodes=%d templates=%d output=%d seconds=%.1f exceeded=%r>" % (
+            self.nodes, self.templates, self.output_size(), seconds, self.exceeded)
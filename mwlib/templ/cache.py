@@ -0,0 +1,157 @@
+# Copyright (c) 2007-2009 PediaPress GmbH
+# See README.rst for additional licensing information.
+
+"""content addressed cache for parsed templates
+
+Parsed templates are keyed by the sha1 of the raw template text, a hash
+of the magicwords used while parsing and the mwlib version. Entries are
+kept in memory and optionally in a directory on disk, which can be
+shared between processes (nslave passes its cache directory to mw-render
+via MWLIB_EXPANDER_TEMPLATE_CACHE).
+"""
+
+import os
+import cPickle
+import tempfile
+from hashlib import sha1
+
+try:
+    import simplejson as json
+except ImportError:
+    import json
+
+from mwlib import lrucache, conf
+from mwlib._version import version
+from mwlib.uniq import Uniquifier
+from mwlib.siteinfo import get_siteinfo
+from mwlib.templ import parser, log
+
+_magicword_hashes = {}
+
+
+def magicwords_hash(siteinfo):
+    """return hexdigest of the magicwords defined in siteinfo"""
+    try:
+        si, h = _magicword_hashes[id(siteinfo)]
+        if si is siteinfo:
+            return h
+    except KeyError:
+        pass
+
+    magicwords = siteinfo.get("magicwords", [])
+    h = sha1(json.dumps(magicwords, sort_keys=True)).hexdigest()
+    _magicword_hashes[id(siteinfo)] = (siteinfo, h)
+    return h
+
+
+def rebind(entry, uniquifier):
+    """register the uniq markers of a cache entry with uniquifier and
+    return the parsed template"""
+
+    parsed, uniqs = entry
+    uniquifier.uniq2repl.update(uniqs)
+    return parsed
+
+
+class TemplateCache(object):
+    def __init__(self, path=None, maxsize=2000):
+        self.path = path
+        self.mem = lrucache.mt_lrucache(maxsize)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+    def get_key(self, raw, siteinfo):
+        h = sha1(raw.encode("utf-8"))
+        h.update("\0%s\0%s" % (magicwords_hash(siteinfo), version))
+        return h.hexdigest()
+
+    def _get_path(self, key):
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def _load(self, key):
+        if self.path is None:
+            return None
+
+        fn = self._get_path(key)
+        try:
+            f = open(fn, "rb")
+        except IOError:
+            return None
+
+        try:
+            return cPickle.load(f)
+        except Exception, err:
+            log.warn("could not load cached template %r: %s" % (fn, err))
+            return None
+        finally:
+            f.close()
+
+    def _store(self, key, entry):
+        if self.path is None:
+            return
+
+        fn = self._get_path(key)
+        try:
+            d = os.path.dirname(fn)
+            if not os.path.isdir(d):
+                os.makedirs(d)
+            fd, tmp = tempfile.mkstemp(dir=d)
+            f = os.fdopen(fd, "wb")
+            f.write(cPickle.dumps(entry, 2))
+            f.close()
+            os.rename(tmp, fn)
+        except (OSError, IOError), err:
+            log.warn("could not store cached template %r: %s" % (fn, err))
+
+    def _parse(self, raw, siteinfo, key):
+        # the markers are unique for each template, so the parsed
+        # template can be shared between expanders
+        u = Uniquifier()
+        u.random_string = key[:16]
+        parsed = parser.parse(raw, uniquifier=u, siteinfo=siteinfo)
+        return (parsed, tuple(u.uniq2repl.items()))
+
+    def get_entry(self, raw, siteinfo=None):
+        if siteinfo is None:
+            siteinfo = get_siteinfo("en")
+
+        key = self.get_key(raw, siteinfo)
+        try:
+            entry = self.mem[key]
+            self.hits += 1
+            return entry
+        except KeyError:
+            pass
+
+        entry = self._load(key)
+        if entry is None:
+            self.misses += 1
+            entry = self._parse(raw, siteinfo, key)
+            self._store(key, entry)
+        else:
+            self.disk_hits += 1
+
+        self.mem[key] = entry
+        return entry
+
+    def parse(self, raw, uniquifier, siteinfo=None):
+        """return parsed template for raw and register its uniq markers with uniquifier"""
+        return rebind(self.get_entry(raw, siteinfo=siteinfo), uniquifier)
+
+    def stats(self):
+        return dict(hits=self.hits, disk_hits=self.disk_hits, misses=self.misses)
+
+    def __repr__(self):
+        return "<TemplateCache path=%r hits=%s disk_hits=%s misses=%s>" % (
+            self.path, self.hits, self.disk_hits, self.misses)
+
+
+_cache = None
+
+
+def get_cache():
+    global _cache
+    if _cache is None:
+        _cache = TemplateCache(path=conf.get("expander", "template_cache", None))
+    return _cache
@@ -0,0 +1,238 @@
+# Copyright (c) 2007-2009 PediaPress GmbH
+# See README.rst for additional licensing information.
+
+"""persistent cache for the expansion of top-level template calls
+
+When an article is rendered again after a small edit, most of its
+top-level template calls are unchanged. If MWLIB_EXPANDER_CALL_CACHE
+names a directory, Expander.expandTemplates stores the output of every
+pure top-level call (see memo.TemplateMemo.is_pure_call) there. The
+entry is keyed by a hash of the call's source, the siteinfo, the local
+values and whether the preceding output ends with a newline. Each entry
+records the templates used by the expansion, together with a hash of
+their raw text. A later expansion splices in the stored output of an
+unchanged call, as long as none of these templates has changed, and
+only expands the other calls.
+
+Cached calls do not count towards the expansion budget.
+"""
+
+import os
+import cPickle
+import tempfile
+import weakref
+from hashlib import sha1
+from timeit import default_timer as timer
+
+from mwlib import lrucache, conf
+from mwlib._version import version
+from mwlib.uniq import uniqrx
+from mwlib.templ import log, memo, evaluate
+from mwlib.templ.marks import mark
+from mwlib.templ.evaluate import OutputBuffer
+from mwlib.templ.nodes import Template
+
+
+def get_template_id(raw):
+    """return the hash identifying the revision of a template"""
+    if raw is None:
+        return None
+    return sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _hash_node(node, uniq2repl, h):
+    if isinstance(node, basestring):
+        if "\x7fUNIQ" in node:
+            node = uniqrx.sub(lambda m: repr(uniq2repl.get(m.group(0))), node)
+        h.update(repr(node))
+        return
+
+    h.update("(%s" % type(node).__name__)
+    for x in node:
+        _hash_node(x, uniq2repl, h)
+    h.update(")")
+
+
+class CallCache(object):
+    def __init__(self, path, maxsize=2000):
+        self.path = path
+        self.mem = lrucache.mt_lrucache(maxsize)
+        self._purity = weakref.WeakKeyDictionary()  # wikidb -> TemplateMemo
+
+        self.hits = 0
+        self.misses = 0
+        self.uncacheable = 0
+        self.saved = 0.0
+
+    def is_pure_call(self, expander, node):
+        try:
+            m = self._purity.get(expander.db)
+            if m is None:
+                m = self._purity[expander.db] = memo.TemplateMemo(0)
+        except TypeError:
+            return False
+        return m.is_pure_call(expander, node)
+
+    def get_key(self, expander, node, res):
+        """return the key of the top-level call node or None if its output
+        depends on more than its source and the templates it uses"""
+
+        if not self.is_pure_call(expander, node):
+            return None
+
+        h = sha1(version)
+        h.update("\0%s\0" % (expander.context.fingerprint,))
+        local_values = expander.resolver.local_values
+        if local_values:
+            h.update(repr(sorted(local_values.items())))
+        h.update("\0%d%d\0" % (type(res) is OutputBuffer, bool(res) and res[-1].endswith("\n")))
+        # deeper calls are dropped, when the recursion limit is reached
+        h.update("%d\0" % (expander.recursion_limit - expander.recursion_count,))
+        _hash_node(node, expander.uniquifier.uniq2repl, h)
+        return h.hexdigest()
+
+    def _get_path(self, key):
+        return os.path.join(self.path, key[:2], key[2:])
+
+    def _load(self, key):
+        try:
+            return self.mem[key]
+        except KeyError:
+            pass
+
+        fn = self._get_path(key)
+        try:
+            f = open(fn, "rb")
+        except IOError:
+            return None
+
+        try:
+            entry = cPickle.load(f)
+        except Exception, err:
+            log.warn("could not load cached template call %r: %s" % (fn, err))
+            return None
+        finally:
+            f.close()
+
+        self.mem[key] = entry
+        return entry
+
+    def _store(self, key, entry):
+        self.mem[key] = entry
+
+        fn = self._get_path(key)
+        try:
+            d = os.path.dirname(fn)
+            if not os.path.isdir(d):
+                os.makedirs(d)
+            fd, tmp = tempfile.mkstemp(dir=d)
+            f = os.fdopen(fd, "wb")
+            f.write(cPickle.dumps(entry, 2))
+            f.close()
+            os.rename(tmp, fn)
+        except (OSError, IOError), err:
+            log.warn("could not store cached template call %r: %s" % (fn, err))
+
+    def _is_valid(self, expander, entry):
+        for name, template_id in entry[0]:
+            if expander.get_template_id(name) != template_id:
+                return False
+        return True
+
+    def flatten(self, expander, node, variables, res):
+        """expand the top-level template call node into res"""
+
+        profiler = expander.profiler
+        key = self.get_key(expander, node, res)
+        if key is None:
+            self.uncacheable += 1
+            if profiler is not None:
+                profiler.call_cache["uncacheable"] += 1
+            evaluate.flatten(node, expander, variables, res)
+            return
+
+        entry = self._load(key)
+        if entry is not None and self._is_valid(expander, entry):
+            deps, text, last, uniqs, needed = entry
+            if text:
+                res.append(text)
+            if last is not None:
+                res.append(last)
+
+            uniq2repl = expander.uniquifier.uniq2repl
+            for k, v in uniqs:
+                if k not in uniq2repl:
+                    uniq2repl[k] = v
+
+            self.hits += 1
+            self.saved += needed
+            if profiler is not None:
+                profiler.call_cache["hits"] += 1
+                profiler.call_cache["saved"] += needed
+            return
+
+        self.misses += 1
+        if profiler is not None:
+            profiler.call_cache["misses"] += 1
+
+        used = expander.used_templates
+        expander.used_templates = set()
+        try:
+            idx = len(res)
+            stime = timer()
+            evaluate.flatten(node, expander, variables, res)
+            needed = timer() - stime
+            deps = tuple(sorted((name, expander.get_template_id(name)) for name in expander.used_templates))
+        finally:
+            if used is not None:
+                used.update(expander.used_templates)
+            expander.used_templates = used
+
+        chunks = res[idx:]
+        last = None
+        if chunks and isinstance(chunks[-1], mark):
+            # only the last chunk is ever looked at by later output
+            last = chunks[-1]
+        text = u"".join(chunks)
+
+        uniq2repl = expander.uniquifier.uniq2repl
+        uniqs = tuple((u, uniq2repl[u]) for u in set(uniqrx.findall(text)) if u in uniq2repl)
+
+        self._store(key, (deps, text, last, uniqs, needed))
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, uncacheable=self.uncacheable, saved=self.saved)
+
+    def __repr__(self):
+        return "<CallCache path=%r %s>" % (self.path, " ".join("%s=%s" % x for x in sorted(self.stats().items())))
+
+
+_cache = None
+
+
+def get_callcache():
+    """return the CallCache or None if MWLIB_EXPANDER_CALL_CACHE is not set"""
+    global _cache
+    path = conf.get("expander", "call_cache", None)
+    if not path:
+        return None
+    if _cache is None or _cache.path != path:
+        _cache = CallCache(path)
+    return _cache
+
+
+def _flatten_item(node, expander, variables, res):
+    if type(node) is Template:
+        expander.callcache.flatten(expander, node, variables, res)
+    else:
+        evaluate.flatten(node, expander, variables, res)
+
+
+def flatten(expander, parsed, variables, res):
+    """flatten parsed like evaluate.flatten, but look up the top-level
+    template calls in the call cache"""
+
+    if type(parsed) is Template:
+        expander.callcache.flatten(expander, parsed, variables, res)
+    else:
+        evaluate.flatten(parsed, expander, variables, res, _flatten_item)
@@ -0,0 +1,305 @@
+# Copyright (c) 2007-2009 PediaPress GmbH
+# See README.rst for additional licensing information.
+
+"""compile parsed templates to python functions
+
+compile_node(node) returns a function f(expander, variables, res),
+which appends the same output to res as
+evaluate.flatten(node, expander, variables, res). Every non-string node
+is turned into a small generated function, which does the same
+recursion accounting as flatten. Template nodes and the magic nodes are
+not compiled, they call their own flatten method.
+
+Whether the parser function nodes are accounted by the profiler is
+decided when compiling: compile_node(node, profiled=True) is used for
+expanders with a profiler.
+"""
+
+from mwlib import lrucache
+from mwlib.templ import log, nodes, magics, profiler
+from mwlib.templ.evaluate import (TemplateRecursion, MemoryLimitError, flatten,
+                                  OutputBuffer, append_block, maybe_newline, dummy_mark)
+
+# the recursion check and budget tick evaluate.flatten does for every
+# non-string node. every generated function starts with it, including
+# the ones, which resolve a variable with a literal name directly.
+_enter = """\
+    if expander.recursion_count > expander.recursion_limit:
+        raise TemplateRecursion()
+    expander.budget_ticks -= 1
+    if expander.budget_ticks < 0:
+        expander.budget.check(expander)
+"""
+
+_header = """\
+def f(expander, variables, res):
+""" + _enter + """\
+    expander.recursion_count += 1
+    try:
+        oldlen = len(res)
+        try:
+%s
+        except TemplateRecursion:
+            if expander.recursion_count > 2:
+                raise
+            del res[oldlen:]
+            log.warn("template recursion error ignored")
+    finally:
+        expander.recursion_count -= 1
+"""
+
+_globals = dict(TemplateRecursion=TemplateRecursion,
+                MemoryLimitError=MemoryLimitError,
+                log=log,
+                flatten=flatten,
+                maybe_newline=maybe_newline,
+                dummy_mark=dummy_mark,
+                OutputBuffer=OutputBuffer,
+                append_block=append_block,
+                maybe_numeric=nodes.maybe_numeric,
+                maybe_numeric_compare=magics.maybe_numeric_compare,
+                ebad=unichr(0xebad))
+
+
+class _codegen(object):
+    def __init__(self, profiled):
+        self.lines = []
+        self.ns = dict(_globals)
+        self.profiled = profiled
+
+    def const(self, value):
+        name = "k%d" % len(self.ns)
+        self.ns[name] = value
+        return name
+
+    def emit(self, line, indent=0):
+        self.lines.append("    " * (indent + 3) + line)
+
+    def call(self, child, target, indent=0):
+        """emit code, which flattens child into the list named target"""
+        if isinstance(child, basestring):
+            self.emit("%s.append(%s)" % (target, self.const(child)), indent)
+        else:
+            self.emit("%s(expander, variables, %s)" % (self.const(compile_node(child, self.profiled)), target),
+                      indent)
+
+    def function(self):
+        if not self.lines:
+            self.emit("pass")
+        src = _header % ("\n".join(self.lines),)
+        exec compile(src, "<compiled template>", "exec") in self.ns
+        return self.ns["f"]
+
+
+def _compile_sequence(node, g):
+    for x in node:
+        g.call(x, "res")
+
+
+def _compile_if(node, g):
+    g.emit("cond = []")
+    g.call(node[0], "cond")
+    g.emit('cond = u"".join(cond).strip()')
+    g.emit("cond = cond.strip(ebad)")
+    g.emit("tmp = OutputBuffer()")
+    g.emit("if cond:")
+    if len(node) > 1:
+        g.call(node[1], "tmp", 1)
+    else:
+        g.emit("pass", 1)
+    if len(node) > 2:
+        g.emit("else:")
+        g.call(node[2], "tmp", 1)
+    g.emit("append_block(res, tmp)")
+
+
+def _compile_ifeq(node, g):
+    g.emit("v1 = []")
+    g.call(node[0], "v1")
+    g.emit('v1 = u"".join(v1).strip()')
+    g.emit("v2 = []")
+    if len(node) > 1:
+        g.call(node[1], "v2")
+    g.emit('v2 = u"".join(v2).strip()')
+    g.emit("tmp = OutputBuffer()")
+    g.emit("if maybe_numeric_compare(v1, v2):")
+    if len(node) > 2:
+        g.call(node[2], "tmp", 1)
+    else:
+        g.emit("pass", 1)
+    if len(node) > 3:
+        g.emit("else:")
+        g.call(node[3], "tmp", 1)
+    g.emit("append_block(res, tmp)")
+
+
+def _compile_block(node, g):
+    g.emit("tmp = OutputBuffer()")
+    g.call(node[0], "tmp")
+    g.emit("append_block(res, tmp)")
+
+
+def _compile_variable(node, g):
+    name = node[0]
+    if isinstance(name, basestring):
+        name = name.strip()
+        if len(name) > 256 * 1024:
+            # let the evaluator raise the error
+            g.emit("%s.flatten(expander, variables, res)" % (g.const(node),))
+            return
+        # the name needs no flatten call, the lookup still runs after
+        # _enter like Variable.flatten runs after flatten's checks
+        g.emit("v = variables.get(%s, None)" % (g.const(name),))
+        missing = u"{{{%s}}}" % (name,)
+    else:
+        g.emit("name = []")
+        g.call(name, "name")
+        g.emit('name = u"".join(name).strip()')
+        g.emit("if len(name) > 256*1024:")
+        g.emit('raise MemoryLimitError("template name too long: %s bytes" % (len(name),))', 1)
+        g.emit("v = variables.get(name, None)")
+        missing = None
+
+    g.emit("if v is None:")
+    if len(node) > 1:
+        g.call(node[1], "res", 1)
+    elif missing is not None:
+        g.emit("res.append(%s)" % (g.const(missing),), 1)
+    else:
+        g.emit('res.append(u"{{{%s}}}" % (name,))', 1)
+    g.emit("else:")
+    g.emit("res.append(v)", 1)
+
+
+class _switch(object):
+    """evaluates a SwitchNode like SwitchNode.flatten, but uses compiled
+    functions for the value, the unresolved keys and the results"""
+
+    def __init__(self, node, profiled):
+        if node.unresolved is None:
+            node._init()
+        self.node = node
+        self.value = compile_node(node[0], profiled)
+        self.unresolved = tuple((compile_node(k, profiled), v) for k, v in node.unresolved)
+
+        compiled = {}
+        for pos, v in node.fast.values():
+            compiled[id(v)] = compile_node(v, profiled)
+        for k, v in node.unresolved:
+            compiled[id(v)] = compile_node(v, profiled)
+        self.compiled = compiled
+
+    def __call__(self, expander, variables, res):
+        node = self.node
+        fast = node.fast
+        sentinel = node.sentinel
+
+        val = []
+        self.value(expander, variables, val)
+        val = u"".join(val).strip()
+
+        num_val = nodes.maybe_numeric(val)
+
+        pos, retval = min(fast.get(val, sentinel), fast.get(num_val, sentinel))
+
+        if pos is None:
+            pos = len(self.unresolved) + 1
+
+        for k, v in self.unresolved[:pos]:
+            tmp = []
+            k(expander, variables, tmp)
+            tmp = u"".join(tmp).strip()
+            if tmp == val:
+                retval = v
+                break
+            if num_val is not None and nodes.maybe_numeric(tmp) == num_val:
+                retval = v
+                break
+
+        if retval is None:
+            for a in expander.aliasmap.get_aliases("default") or ["#default"]:
+                retval = fast.get(a)
+                if retval is not None:
+                    retval = retval[1]
+                    break
+            retval = retval or u""
+
+        tmp = OutputBuffer()
+        c = self.compiled.get(id(retval))
+        if c is None:
+            flatten(retval, expander, variables, tmp)
+        else:
+            c(expander, variables, tmp)
+        append_block(res, tmp)
+
+
+def _compile_switch(node, g):
+    g.emit("%s(expander, variables, res)" % (g.const(_switch(node, g.profiled)),))
+
+
+def _compile_delegate(node, g):
+    g.emit("%s.flatten(expander, variables, res)" % (g.const(node),))
+
+
+_compilers = {
+    tuple: _compile_sequence,
+    list: _compile_sequence,
+    nodes.Node: _compile_sequence,
+    nodes.IfNode: _compile_if,
+    nodes.IfeqNode: _compile_ifeq,
+    nodes.BlockNode: _compile_block,
+    nodes.IfBlockNode: _compile_block,
+    nodes.IfeqBlockNode: _compile_block,
+    nodes.SwitchBlockNode: _compile_block,
+    nodes.Variable: _compile_variable,
+    nodes.SwitchNode: _compile_switch,
+}
+
+
+def _append_string(s):
+    def f(expander, variables, res):
+        res.append(s)
+    return f
+
+
+def compile_node(node, profiled=False):
+    """return a function f(expander, variables, res), which does the same
+    as flatten(node, expander, variables, res). if profiled is true, f
+    may only be called with expanders, which have a profiler"""
+
+    if isinstance(node, (unicode, str)):
+        return _append_string(node)
+
+    g = _codegen(profiled)
+    _compilers.get(type(node), _compile_delegate)(node, g)
+    if profiled:
+        name = profiler.get_node_names().get(type(node))
+        if name is not None:
+            return _profiled(g.function(), name)
+    return g.function()
+
+
+def _profiled(f, name):
+    """account calls of f as parser function name"""
+    def profiled(expander, variables, res):
+        expander.profiler.call(f, name, expander, variables, res)
+    return profiled
+
+
+_cache = lrucache.mt_lrucache(2000)
+
+
+def get_compiled(node, profiled=False):
+    """return the compiled form of node. compiled forms are cached as long
+    as node is kept in the cache"""
+    key = (id(node), profiled)
+    try:
+        n, f = _cache[key]
+        if n is node:
+            return f
+    except KeyError:
+        pass
+
+    f = compile_node(node, profiled)
+    _cache[key] = (node, f)
+    return f
@@ -0,0 +1,175 @@
+# Copyright (c) 2007-2009 PediaPress GmbH
+# See README.rst for additional licensing information.
+
+"""static template dependencies
+
+get_dependencies(parsed) returns the templates and Lua modules a parsed
+page transcludes by a literal name. A Closure computes the transitive
+closure of these dependencies level by level, resolving names with the
+nshandler and following redirects, so that each level can be fetched
+with one bulk request:
+
+    c = Closure(nshandler, redirects)
+    todo = c.add_page(title, raw)
+    while todo:
+        todo = c.add_pages(get_pages(todo))
+
+Templates are parsed through the shared template cache, which is
+thereby warmed for the expanders. Names, which are only known at
+expansion time like {{{{{1}}}}} or {{flag {{{country}}}}}, cannot be
+resolved statically and are left out.
+"""
+
+from mwlib import sitecontext
+from mwlib.uniq import Uniquifier
+from mwlib.templ.nodes import Template
+from mwlib.templ import parser, cache, magics, magic_nodes
+
+NS_MAIN = 0
+NS_TEMPLATE = 10
+NS_MODULE = 828
+
+_resolver = magics.MagicResolver()
+
+
+def get_dependencies(parsed, title=u"", aliasmap=None):
+    """return the list of (name, default namespace) of the templates and
+    modules transcluded by the parsed page title"""
+
+    res = []
+    todo = [parsed]
+    while todo:
+        n = todo.pop()
+        if isinstance(n, basestring):
+            continue
+
+        if isinstance(n, Template) and isinstance(n[0], basestring):
+            dep = _get_dependency(n[0].strip(), title, aliasmap)
+            if dep is not None:
+                res.append(dep)
+
+        todo.extend(reversed(n))
+
+    return res
+
+
+def _get_dependency(name, title, aliasmap):
+    if not name or name.startswith("[[") or "|" in name or "\x7f" in name:
+        return None
+
+    if ":" in name:
+        prefix, remainder = name.split(":", 1)
+        if aliasmap is not None:
+            prefix = aliasmap.resolve_magic_alias(prefix) or prefix
+        if prefix.strip().lower() == "#invoke":
+            remainder = remainder.strip()
+            if remainder:
+                return (remainder, NS_MODULE)
+            return None
+        if prefix.lower() in magic_nodes.registry or _resolver.has_magic(prefix):
+            return None
+    elif _resolver.has_magic(name):
+        return None
+
+    if name.startswith("#"):
+        return None
+    if name.startswith("/"):
+        return (title + name, NS_MAIN)
+    return (name, NS_TEMPLATE)
+
+
+class Closure(object):
+    """transitive closure of the templates and modules transcluded by a
+    set of pages. redirects maps names to redirect targets, redirect pages
+    found while walking the closure are recorded in found_redirects"""
+
+    def __init__(self, nshandler, redirects=None, aliasmap=None):
+        self.nshandler = nshandler
+        if redirects is None:
+            redirects = {}
+        self.redirects = redirects
+        if aliasmap is None:
+            aliasmap = sitecontext.get_context(nshandler.siteinfo).aliasmap
+        self.aliasmap = aliasmap
+        self.has_modules = str(NS_MODULE) in nshandler.siteinfo.get("namespaces", {})
+        self.uniquifier = Uniquifier()
+        self.found_redirects = {}
+
+        self.seen = set()
+        self.pages = {}  # name -> raw text or None if missing
+        self.levels = []
+
+    def resolve(self, name, ns):
+        """return the name, under which the dependency (name, ns) has to be
+        fetched or None"""
+        if ns == NS_MODULE and not self.has_modules:
+            return None
+        fqname = self.nshandler.get_fqname(name, defaultns=ns)
+        fqname = self.redirects.get(fqname, fqname)
+        return self.found_redirects.get(fqname, fqname)
+
+    def _schedule(self, deps, todo):
+        for name, ns in deps:
+            fqname = self.resolve(name, ns)
+            if fqname is not None and fqname not in self.seen:
+                self.seen.add(fqname)
+                todo.append(fqname)
+
+    def add_page(self, title, raw, included=False):
+        """add a page of the book (or an already fetched template if
+        included is true) and return the names of its dependencies, which
+        have not been scheduled before"""
+
+        self.seen.add(title)
+        if included:
+            parsed = cache.get_cache().parse(raw, self.uniquifier)
+        else:
+            parsed = parser.parse(raw, included=False, uniquifier=self.uniquifier)
+
+        todo = []
+        self._schedule(get_dependencies(parsed, title, self.aliasmap), todo)
+        return todo
+
+    def add_pages(self, pages):
+        """add the pages fetched for the names returned by the last call
+        (a dict mapping names to raw text, missing pages may be left out)
+        and return the next level of names to fetch"""
+
+        todo = []
+        self.levels.append(sorted(pages))
+        for name, raw in pages.items():
+            self.pages[name] = raw
+            if not raw:
+                continue
+
+            if self.has_modules and self.nshandler.splitname(name)[0] == NS_MODULE:
+                # lua code, its dependencies are not transclusions
+                continue
+
+            redirect = self.nshandler.redirect_matcher(raw)
+            if redirect:
+                target = self.nshandler.get_fqname(redirect)
+                self.found_redirects[name] = target
+                if target not in self.seen:
+                    self.seen.add(target)
+                    todo.append(target)
+                continue
+
+            todo.extend(self.add_page(name, raw, included=True))
+        return todo
+
+
+def get_closure(roots, get_pages, nshandler, redirects=None, aliasmap=None):
+    """yield the transitive dependencies of the pages roots (a list of
+    (title, raw text)) in breadth first batches of names. get_pages is
+    called once per batch with the list of names and must return a dict
+    mapping names to raw text"""
+
+    c = Closure(nshandler, redirects=redirects, aliasmap=aliasmap)
+    todo = []
+    for title, raw in roots:
+        todo.extend(c.add_page(title, raw))
+
+    while todo:
+        yield todo
+        todo = c.add_pages(get_pages(todo))
@@ -2,16 +2,22 @@
 # Copyright (c) 2007-2009 PediaPress GmbH
 # See README.rst for additional licensing information.
 
-from mwlib.templ import magics, log, DEBUG, parser, mwlocals
+import sys
+
+from mwlib.templ import magics, log, DEBUG, parser, mwlocals, cache
+from mwlib.templ.budget import Budget, BudgetExceeded
 from mwlib.uniq import Uniquifier
-from mwlib import nshandling, siteinfo, metabook
+from mwlib import sitecontext, siteinfo, metabook, conf
+from mwlib._conf import as_bool
 
 
 class TemplateRecursion(Exception):
     pass
 
 
-def flatten(node, expander, variables, res):
+def flatten(node, expander, variables, res, flatten_item=None):
+    """expand node into res. the items of a list or tuple node are passed
+    to flatten_item instead of flatten, if it is given"""
     t = type(node)
     if isinstance(node, (unicode, str)):
         res.append(node)
@@ -19,6 +25,9 @@ def flatten(node, expander, variables, res):
 
     if expander.recursion_count > expander.recursion_limit:
         raise TemplateRecursion()
+    expander.budget_ticks -= 1
+    if expander.budget_ticks < 0:
+        expander.budget.check(expander)
 
     expander.recursion_count += 1
     try:
@@ -26,10 +35,14 @@ def flatten(node, expander, variables, res):
         oldlen = len(res)
         try:
             if t is list or t is tuple:
+                if flatten_item is None:
+                    flatten_item = flatten
                 for x in node:
-                    flatten(x, expander, variables, res)
-            else:
+                    flatten_item(x, expander, variables, res)
+            elif expander.profiler is None:
                 node.flatten(expander, variables, res)
+            else:
+                expander.profiler.flatten(node, expander, variables, res)
         except TemplateRecursion:
             if expander.recursion_count > 2:
                 raise
@@ -73,7 +86,27 @@ if not hasattr(tuple, 'index'):
     equalsplit = equalsplit_25
 
 
+def _literal(node):
+    """return the concatenation of node, if it is a sequence of strings, None otherwise"""
+    if type(node) is not tuple and type(node) is not list:
+        return None
+    for x in node:
+        if type(x) is not unicode:
+            return None
+    return u"".join(node)
+
+
+# the value recorded for a lookup, which raised an exception
+failed_read = object()
+
+
 class ArgumentList(object):
+    """the arguments of a template invocation.
+
+    names and values are expanded lazily and at most once. with
+    DEBUG_EXPANDER set, stats counts lookups, cache hits and expansions.
+    """
+
     def __init__(self, args=tuple(), expander=None, variables=None):
         self.args = tuple(args)
 
@@ -86,8 +119,23 @@ class ArgumentList(object):
         self.varnum = 0
 
         self.namedargs = {}
+        self.values = {}  # expanded positional arguments
         self.count = 0
 
+        # list of (name, recursion_count, value or None) of the lookups
+        # done by get, while memo.TemplateMemo records them
+        self.reads = None
+        # set by memo.TemplateMemo, while it replays recorded lookups and
+        # while it expands the template after a replay, which did not
+        # hit. maps id(node) to (node, recursion_count, value) or (node,
+        # recursion_count, None, exc_info...) of the expanded arguments
+        self.replayed = None
+
+        if DEBUG:
+            self.stats = dict(lookups=0, hits=0, expanded=0)
+        else:
+            self.stats = None
+
     def __len__(self):
         self.count += 1
         return len(self.args)
@@ -100,8 +148,95 @@ class ArgumentList(object):
             return [self.get(x,  None) or u"" for x in range(start, stop)]
         return self.get(n, None) or u''
 
+    def _check_recursion(self):
+        # flatten would raise for the nodes we do not flatten
+        if self.expander.recursion_count > self.expander.recursion_limit:
+            raise TemplateRecursion()
+
+    def _expand(self, node):
+        lit = _literal(node)
+        if lit is not None:
+            self._check_recursion()
+            return lit
+
+        replayed = self.replayed
+        if replayed is not None:
+            r = replayed.get(id(node))
+            if r is not None and r[0] is node and r[1] == self.expander.recursion_count:
+                if r[2] is None:
+                    raise r[3], r[4], r[5]
+                return r[2]
+
+        if self.stats is not None:
+            self.stats["expanded"] += 1
+        tmp = OutputBuffer()
+        if replayed is None:
+            flatten(node, self.expander, self.variables, tmp)
+            return u"".join(tmp)
+
+        # the expansion following a replay, which did not hit, does the
+        # same expansions at the same depths
+        try:
+            flatten(node, self.expander, self.variables, tmp)
+        except Exception:
+            replayed[id(node)] = (node, self.expander.recursion_count, None) + sys.exc_info()
+            raise
+        res = u"".join(tmp)
+        replayed[id(node)] = (node, self.expander.recursion_count, res)
+        return res
+
+    def _parse_next(self):
+        arg = self.args[self.varnum]
+        self.varnum += 1
+
+        name, val = equalsplit(arg)
+        if name is not None:
+            name = self._expand(name).strip()
+            do_strip = True
+        else:
+            name = str(self.varcount)
+            self.varcount += 1
+            do_strip = False
+
+        if do_strip and isinstance(val, unicode):
+            val = val.strip()
+        self.namedargs[name] = (do_strip, val)
+        return name
+
+    def _get_recorded(self, n, default):
+        reads = self.reads
+        self.reads = None
+        try:
+            v = self.get(n, None)
+        except:
+            reads.append((n, self.expander.recursion_count, failed_read))
+            raise
+        finally:
+            self.reads = reads
+        reads.append((n, self.expander.recursion_count, v))
+        if v is None:
+            return default
+        return v
+
+    def _get_state(self):
+        return (self.varnum, self.varcount, self.count, dict(self.namedargs), dict(self.values))
+
+    def _set_state(self, state):
+        self.varnum, self.varcount, self.count, namedargs, values = state
+        self.namedargs.clear()
+        self.namedargs.update(namedargs)
+        self.values.clear()
+        self.values.update(values)
+
     def get(self, n, default):
+        if self.reads is not None:
+            return self._get_recorded(n, default)
+
         self.count += 1
+        stats = self.stats
+        if stats is not None:
+            stats["lookups"] += 1
+
         if isinstance(n, (int, long)):
             try:
                 a = self.args[n]
@@ -109,68 +244,54 @@ class ArgumentList(object):
                 return default
             if isinstance(a, unicode):
                 return a.strip()
-            tmp = []
-            flatten(a, self.expander, self.variables, tmp)
-            _insert_implicit_newlines(tmp)
-            tmp = u"".join(tmp).strip()
+
+            tmp = self.values.get(n)
+            if tmp is not None:
+                if stats is not None:
+                    stats["hits"] += 1
+                self._check_recursion()
+                return tmp
+
+            tmp = self._expand(a).strip()
             if len(tmp) > 256*1024:
                 raise MemoryLimitError("template argument too long: %s bytes" % len(tmp))
-            # FIXME: cache value ???
+            self.values[n] = tmp
             return tmp
 
         assert isinstance(n, basestring), "expected int or string"
 
         if n not in self.namedargs:
             while self.varnum < len(self.args):
-                arg = self.args[self.varnum]
-                self.varnum += 1
-
-                name, val = equalsplit(arg)
-                if name is not None:
-                    tmp = []
-                    flatten(name, self.expander, self.variables, tmp)
-                    _insert_implicit_newlines(tmp)
-                    name = u"".join(tmp).strip()
-                    do_strip = True
-                else:
-                    name = str(self.varcount)
-                    self.varcount += 1
-                    do_strip = False
-
-                if do_strip and isinstance(val, unicode):
-                    val = val.strip()
-                self.namedargs[name] = (do_strip, val)
-
-                if n == name:
+                if n == self._parse_next():
                     break
 
         try:
             do_strip, val = self.namedargs[n]
             if isinstance(val, unicode):
+                if stats is not None:
+                    stats["hits"] += 1
                 return val
         except KeyError:
             return default
 
-        tmp = []
-        flatten(val, self.expander, self.variables, tmp)
-        _insert_implicit_newlines(tmp)
-        tmp = u"".join(tmp)
+        tmp = self._expand(val)
         if do_strip:
             tmp = tmp.strip()
 
         self.namedargs[n] = (do_strip, tmp)
         return tmp
 
+    def __repr__(self):
+        if self.stats is None:
+            return object.__repr__(self)
+        return "<ArgumentList %s args, %s>" % (len(self.args), " ".join("%s=%s" % x for x in sorted(self.stats.items())))
+
 
 def is_implicit_newline(raw):
     """should we add a newline to templates starting with *, #, :, ;, {|
     see: http://meta.wikimedia.org/wiki/Help:Newlines_and_spaces#Automatic_newline_at_the_start
     """
-    sw = raw.startswith
-    for x in ('*', '#', ':', ';', '{|'):
-        if sw(x):
-            return True
-    return False
+    return raw.startswith(('*', '#', ':', ';', '{|'))
 
 
 from mwlib.templ.marks import mark, mark_start, mark_end, mark_maybe_newline, maybe_newline, dummy_mark, eqmark
@@ -199,10 +320,94 @@ def _insert_implicit_newlines(res, maybe_newline=maybe_newline):
     del res[-2:]
 
 
+class OutputBuffer(list):
+    """a list of output chunks, in which maybe_newline marks are resolved.
+
+    a node appending a maybe_newline mark to an OutputBuffer resolves it
+    with resolve_newline as soon as the two chunks following it have
+    been appended. this gives the same result as calling
+    _insert_implicit_newlines on the list afterwards. in plain lists the
+    marks are left alone.
+
+    the results of #if, #ifeq and #switch are stripped in place and
+    spliced into the parent buffer (see append_block) instead of being
+    joined, so that large outputs are not copied once per nesting level.
+    """
+
+    __slots__ = ()
+
+    def strip(self):
+        """strip whitespace from both ends in place, like
+        u"".join(self).strip() would"""
+
+        start = 0
+        while start < len(self):
+            s = self[start].lstrip()
+            if s:
+                self[start] = s
+                break
+            start += 1
+        del self[:start]
+
+        stop = len(self)
+        while stop:
+            s = self[stop-1].rstrip()
+            if s:
+                self[stop-1] = s
+                break
+            stop -= 1
+        del self[stop:]
+        return self
+
+    def head(self, n):
+        """return the first n characters"""
+        res = u""
+        for x in self:
+            res += x
+            if len(res) >= n:
+                break
+        return res[:n]
+
+
+def resolve_newline(res, i):
+    """resolve the maybe_newline mark at res[i], if res is an OutputBuffer"""
+
+    if type(res) is not OutputBuffer:
+        return
+
+    if i and res[i-1].endswith("\n"):
+        return
+
+    s1 = res[i+1]
+    if isinstance(s1, mark):
+        return
+    if len(s1) < 2 and len(res) > i+2:
+        s1 += res[i+2]
+    if is_implicit_newline(s1):
+        res[i] = '\n'
+
+
+def append_block(res, tmp):
+    """append the stripped OutputBuffer tmp to res. tmp is preceded by a
+    resolved maybe_newline mark and followed by dummy_mark like the
+    result of #if"""
+
+    tmp.strip()
+    if type(res) is OutputBuffer and not (res and res[-1].endswith("\n")) and is_implicit_newline(tmp.head(2)):
+        res.append('\n')
+    else:
+        res.append(maybe_newline)
+    res.extend(tmp)
+    res.append(dummy_mark)
+
+
 class Expander(object):
     magic_displaytitle = None   # set via {{DISPLAYTITLE:...}}
 
-    def __init__(self, txt, pagename="", wikidb=None, recursion_limit=100):
+    # expand templates with the functions generated by templ.compiler
+    compile_templates = conf.get("expander", "compile", False, as_bool)
+
+    def __init__(self, txt, pagename="", wikidb=None, recursion_limit=100, budget=None):
         assert wikidb is not None, "must supply wikidb argument in Expander.__init__"
         self.pagename = pagename
         self.db = wikidb
@@ -218,7 +423,8 @@ class Expander(object):
             print "WARNING: failed to get siteinfo from %r" % (self.db,)
             si = siteinfo.get_siteinfo("de")
 
-        self.nshandler = nshandler = nshandling.nshandler(si)
+        self.context = sitecontext.get_context(si)
+        self.nshandler = nshandler = self.context.nshandler
         self.siteinfo = si
 
         if self.db and hasattr(self.db, "getSource"):
@@ -246,13 +452,23 @@ class Expander(object):
 
         self.recursion_limit = recursion_limit
         self.recursion_count = 0
-        self.aliasmap = parser.aliasmap(self.siteinfo)
+        self.budget = budget or Budget()
+        self.budget_ticks = -1
+        self.aliasmap = self.context.aliasmap
 
         self.parsed = parser.parse(
             txt, included=False, replace_tags=self.replace_tags, siteinfo=self.siteinfo)
         # show(self.parsed)
         self.parsedTemplateCache = {}
 
+        from mwlib.templ import memo, lookup, profiler, callcache
+        self.memo = memo.get_memo(wikidb)
+        self.lookup = lookup.get_lookup(wikidb)
+        self.profiler = profiler.get_profiler()
+        self.callcache = callcache.get_callcache()
+        self.used_templates = None  # names passed to getParsedTemplate, see callcache
+        self.template_ids = {}
+
     def resolve_magic_alias(self, name):
         return self.aliasmap.resolve_magic_alias(name)
 
@@ -269,16 +485,18 @@ class Expander(object):
         else:
             ns = 10
 
+        if self.used_templates is not None:
+            self.used_templates.add(name)
+
         try:
             return self.parsedTemplateCache[name]
         except KeyError:
             pass
 
-        page = self.db.normalize_and_get_page(name, ns)
-        if page:
-            raw = page.rawtext
-        else:
-            raw = None
+        raw = self._get_raw_template(name, ns)
+        if self.callcache is not None:
+            from mwlib.templ.callcache import get_template_id
+            self.template_ids[name] = get_template_id(raw)
 
         if raw is None:
             res = None
@@ -288,13 +506,51 @@ class Expander(object):
         self.parsedTemplateCache[name] = res
         return res
 
+    def _get_raw_template(self, name, ns):
+        if self.lookup is not None:
+            return self.lookup.get_raw(self.db, name, ns)
+
+        page = self.db.normalize_and_get_page(name, ns)
+        if page:
+            return page.rawtext
+        return None
+
+    def get_template_id(self, name):
+        """return the callcache.get_template_id of the template name"""
+        try:
+            return self.template_ids[name]
+        except KeyError:
+            pass
+
+        from mwlib.templ.callcache import get_template_id
+        res = self.template_ids[name] = get_template_id(self._get_raw_template(name, 10))
+        return res
+
+    def flatten_template(self, parsed, variables, res):
+        if self.compile_templates:
+            from mwlib.templ import compiler
+            compiler.get_compiled(parsed, self.profiler is not None)(self, variables, res)
+        else:
+            flatten(parsed, self, variables, res)
+
     def _parse_raw_template(self, name, raw):
-        return parser.parse(raw, replace_tags=self.replace_tags)
+        return cache.get_cache().parse(raw, self.uniquifier)
 
     def _expand(self, parsed, keep_uniq=False):
-        res = ["\n"]  # guard, against implicit newlines at the beginning
-        flatten(parsed, self, ArgumentList(expander=self), res)
-        _insert_implicit_newlines(res)
+        res = OutputBuffer(["\n"])  # guard, against implicit newlines at the beginning
+        self.budget.start()
+        self.budget.set_output(res)
+        try:
+            if self.callcache is None:
+                flatten(parsed, self, ArgumentList(expander=self), res)
+            else:
+                from mwlib.templ import callcache
+                callcache.flatten(self, parsed, ArgumentList(expander=self), res)
+        except BudgetExceeded, err:
+            log.warn("expansion of %r stopped: %s" % (self.pagename, err))
+        finally:
+            self.budget.account(self)
+            self.budget.set_output(None)
         res[0] = u''
         res = u"".join(res)
         if not keep_uniq:
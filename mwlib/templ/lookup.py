@@ -0,0 +1,156 @@
+# Copyright (c) 2007-2009 PediaPress GmbH
+# See README.rst for additional licensing information.
+
+"""template lookup cache shared by all expanders using the same wikidb
+
+Expander.getParsedTemplate asks the TemplateLookup for the raw text of
+a template. Results are cached by (name, default namespace) for the
+lifetime of the wikidb, i.e. for all articles of a book, including
+templates which do not exist.
+
+If the wikidb normalizes names with its nshandler (as nuwiki does),
+lookups are additionally shared by canonical name and by redirect
+target, so that {{tl}}, {{Tl}} and {{Template:tl}} and all redirects
+to the same template only fetch the page once.
+
+The wikidb must not change while it is being used for expansion. Set
+MWLIB_EXPANDER_LOOKUP_CACHE=0 to disable the cache.
+"""
+
+import weakref
+
+from mwlib import conf
+from mwlib._conf import as_bool
+from mwlib.templ import log
+
+
+class Entry(object):
+    """result of a template lookup: the canonical name and redirect target
+    (or None if the wikidb does not normalize names) and the raw text
+    (None if the template is missing)"""
+
+    __slots__ = ["fqname", "target", "raw"]
+
+    def __init__(self, fqname, target, raw):
+        self.fqname = fqname
+        self.target = target
+        self.raw = raw
+
+    @property
+    def missing(self):
+        return self.raw is None
+
+    def __repr__(self):
+        return "<Entry %r -> %r missing=%r>" % (self.fqname, self.target, self.missing)
+
+
+class TemplateLookup(object):
+    def __init__(self, wikidb):
+        self.entries = {}    # (name, ns) -> Entry
+        self.canonical = {}  # canonical name or redirect target -> Entry
+
+        nshandler = getattr(wikidb, "nshandler", None)
+        if nshandler is not None and hasattr(wikidb, "get_page"):
+            self.nshandler = nshandler
+            self.redirects = getattr(wikidb, "redirects", None) or {}
+        else:
+            self.nshandler = None
+            self.redirects = {}
+
+        self.lookups = 0
+        self.hits = 0
+        self.shared = 0
+        self.fetched = 0
+        self.missing = 0
+        self.redirected = 0
+
+    def get_entry(self, wikidb, name, ns):
+        """return the Entry for the template name in default namespace ns"""
+
+        self.lookups += 1
+        key = (name, ns)
+        try:
+            res = self.entries[key]
+            self.hits += 1
+            return res
+        except KeyError:
+            pass
+
+        if self.nshandler is None:
+            res = Entry(None, None, self._get_raw(wikidb.normalize_and_get_page(name, ns)))
+        else:
+            res = self._resolve(wikidb, name, ns)
+
+        self.entries[key] = res
+        return res
+
+    def get_raw(self, wikidb, name, ns):
+        return self.get_entry(wikidb, name, ns).raw
+
+    def _resolve(self, wikidb, name, ns):
+        fqname = self.nshandler.get_fqname(name, defaultns=ns)
+        target = self.redirects.get(fqname, fqname)
+
+        res = self.canonical.get(fqname)
+        if res is None and target != fqname:
+            # the wikidb falls back to the page itself, if the target is missing
+            res = self.canonical.get(target)
+            if res is not None and res.missing:
+                res = None
+
+        if res is not None:
+            self.shared += 1
+            return res
+
+        page = wikidb.get_page(fqname)
+        res = Entry(fqname, target, self._get_raw(page))
+        self.canonical[fqname] = res
+        if target != fqname:
+            self.redirected += 1
+            if getattr(page, "title", None) == target:
+                self.canonical.setdefault(target, res)
+        return res
+
+    def _get_raw(self, page):
+        self.fetched += 1
+        if page:
+            raw = page.rawtext
+        else:
+            raw = None
+        if raw is None:
+            self.missing += 1
+        return raw
+
+    def stats(self):
+        return dict(lookups=self.lookups, hits=self.hits, shared=self.shared,
+                    fetched=self.fetched, missing=self.missing, redirected=self.redirected)
+
+    def __repr__(self):
+        return "<TemplateLookup %s>" % " ".join("%s=%s" % x for x in sorted(self.stats().items()))
+
+
+_lookups = weakref.WeakKeyDictionary()
+
+
+def get_lookup(wikidb, create=True):
+    """return the TemplateLookup shared by all expanders using wikidb or
+    None if the lookup cache is disabled"""
+
+    if wikidb is None or not conf.get("expander", "lookup_cache", True, as_bool):
+        return None
+
+    try:
+        res = _lookups.get(wikidb)
+    except TypeError:
+        return None
+
+    if res is None and create:
+        res = _lookups[wikidb] = TemplateLookup(wikidb)
+    return res
+
+
+def report():
+    """log the statistics of all template lookup caches"""
+    for x in _lookups.values():
+        if x.lookups:
+            log.info("template lookups: %s" % " ".join("%s=%s" % kv for kv in sorted(x.stats().items())))
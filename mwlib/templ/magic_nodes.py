@@ -30,8 +30,15 @@ class Time(nodes.Node):
         else:
             d = None
 
+        if len(self) > 2:
+            lang = []
+            evaluate.flatten(self[2], expander, variables, lang)
+            lang = u"".join(lang).strip() or None
+        else:
+            lang = None
+
         from mwlib.templ import magic_time
-        res.append(magic_time.time(format, d))
+        res.append(magic_time.time(format, d, lang))
 
 
 class Anchorencode(nodes.Node):
@@ -84,9 +91,8 @@ class Tag(nodes.Node):
         parameters = u''
 
         for parm in self[2:]:
-            tmp = []
+            tmp = evaluate.OutputBuffer()
             evaluate.flatten(parm, expander, variables, tmp)
-            evaluate._insert_implicit_newlines(tmp)
             tmp = u"".join(tmp)
             if "=" in tmp:
                 key, value = tmp.split("=", 1)
@@ -96,9 +102,8 @@ class Tag(nodes.Node):
         tmpres.append("<%s%s>" % (name, parameters))
 
         if len(self) > 1:
-            tmp = []
+            tmp = evaluate.OutputBuffer()
             evaluate.flatten(self[1], expander, variables, tmp)
-            evaluate._insert_implicit_newlines(tmp)
             tmp = u"".join(tmp)
             tmpres.append(tmp)
 
@@ -1,10 +1,12 @@
 import sys
+import time as _time
 import datetime
 import re
 import calendar
 import roman
 from timelib import strtodatetime as parsedate
 
+from mwlib import lrucache
 from mwlib.strftime import strftime
 
 
@@ -84,29 +86,90 @@ def formatdate(format, date):
     return tmp
 
 
-def time(format, datestring=None):
-    date = None
+def _parsedate(datestring, now):
+    """return the datetime for datestring relative to the timestamp now
+    or None if it is invalid"""
+
+    if re.match("\d\d\d\d$", datestring):
+        try:
+            return datetime.datetime.fromtimestamp(now).replace(
+                hour=int(datestring[:2]), minute=int(datestring[2:]), second=0)
+        except ValueError:
+            pass
+
+    try:
+        return parsedate(datestring, now)
+    except ValueError:
+        pass
+    except Exception, err:
+        sys.stderr.write("ERROR in parsedate: %r while parsing %r" % (err, datestring))
+    return None
+
+
+# Parsed dates are keyed by the input, formatted results by (format,
+# input, language). Both get the current second added to the key, if they
+# depend on the current time, like "+1 day" or "2008" (20:08 today).
+_dates = lrucache.mt_lrucache(5000)
+_results = lrucache.mt_lrucache(20000)
+_shift = 400 * 86400 + 3661
+_stats = dict(hits=0, misses=0, parse_hits=0, parse_misses=0)
+
+
+def _lookup(cache, keys):
+    for key in keys:
+        try:
+            return cache[key]
+        except KeyError:
+            pass
+    return None
+
+
+def getdate(datestring, now):
+    """return (date, relative) for datestring, where date is None if
+    datestring is invalid and relative is true if date depends on the
+    timestamp now"""
+
+    res = _lookup(_dates, (datestring, (datestring, now)))
+    if res is not None:
+        _stats["parse_hits"] += 1
+        return res
+
+    _stats["parse_misses"] += 1
+    date = _parsedate(datestring, now)
+    # a date, which changes with the year, day, hour, minute or second of
+    # now, is relative
+    if date is not None and _parsedate(datestring, now - _shift) != date:
+        res = _dates[(datestring, now)] = (date, True)
+    else:
+        res = _dates[datestring] = (date, False)
+    return res
+
+
+def stats():
+    return dict(_stats, dates=len(_dates.cache), results=len(_results.cache))
+
+
+def time(format, datestring=None, lang=None):
+    now = int(_time.time())
+    keys = [(format, datestring, lang, now)]
     if datestring:
-        if re.match("\d\d\d\d$", datestring):
-            try:
-                date = datetime.datetime.now().replace(
-                    hour=int(datestring[:2]), minute=int(datestring[2:]), second=0)
-            except ValueError:
-                pass
-
-        if date is None:
-            try:
-                date = parsedate(datestring)
-            except ValueError:
-                pass
-            except Exception, err:
-                sys.stderr.write("ERROR in parsedate: %r while parsing %r" % (err, datestring))
-                pass
-
-        if date is None:
-            return u'<strong class="error">Error: invalid time</strong>'
+        keys.insert(0, (format, datestring, lang))
+
+    res = _lookup(_results, keys)
+    if res is not None:
+        _stats["hits"] += 1
+        return res
+
+    _stats["misses"] += 1
+    if datestring:
+        date, relative = getdate(datestring, now)
+    else:
+        date, relative = datetime.datetime.fromtimestamp(now), True
 
     if date is None:
-        date = datetime.datetime.now()
+        res = u'<strong class="error">Error: invalid time</strong>'
+    else:
+        res = formatdate(format, date)
 
-    return formatdate(format, date)
+    _results[keys[-1] if relative else keys[0]] = res
+    return res
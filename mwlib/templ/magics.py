@@ -447,6 +447,8 @@ class ParserFunctions(object):
         nsnum, suffix, full = self.wikidb.nshandler.splitname(name)
         if nsnum == -2:
             exists = bool(self.wikidb.normalize_and_get_image_path(name.split(":")[1]))
+        elif hasattr(self.wikidb, "page_exists"):
+            exists = self.wikidb.page_exists(full)
         else:
             exists = bool(self.wikidb.normalize_and_get_page(name, 0))
 
@@ -29,5 +29,9 @@ class _eqmark(unicode):
     def __eq__(self, other):
         return self is other
 
+    def __reduce__(self):
+        # pickle by reference, the parser relies on the identity of eqmark
+        return "eqmark"
+
 
 eqmark = _eqmark("=")
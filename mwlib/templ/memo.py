@@ -0,0 +1,327 @@
+# Copyright (c) 2007-2009 PediaPress GmbH
+# See README.rst for additional licensing information.
+
+"""memoize the expansion of pure templates
+
+A template is pure if its output only depends on its arguments, i.e.
+neither the template nor any template it calls uses time or page
+magics, #ifexist, #tag, #time, displaytitle, relative template names or
+computed template names. One TemplateMemo is shared by all expanders
+using the same wikidb, i.e. by all articles of a book.
+
+The arguments of a call are not expanded up front. While a pure
+template is expanded, its ArgumentList records the lookups of its
+arguments: the name, the recursion depth and the value (or None for a
+missing argument). A later call is a hit, if repeating these lookups in
+the same order and at the same depths yields the same values. Up to the
+first lookup with a different value the expansion would have done the
+same lookups, so checking an entry only expands arguments, which the
+expansion would have expanded anyway, and the output is the same as
+without the memo. If the check does not hit, the ArgumentList is reset
+to its state before the check, but keeps the expanded arguments, so
+that no argument is expanded twice. The entries for one template name form a tree, whose
+inner nodes are lookups with one child per value seen and whose leaves
+hold the output.
+
+Memoization is disabled unless expander.memo_size is set.
+"""
+
+import sys
+import weakref
+from collections import OrderedDict
+
+from mwlib import conf
+from mwlib.uniq import uniqrx
+from mwlib.templ import magics, magic_nodes, nodes
+from mwlib.templ.evaluate import OutputBuffer, failed_read
+
+
+
+def _method_names(*classes):
+    res = set()
+    for c in classes:
+        res.update(x for x in c.__dict__ if x.isupper())
+    return res
+
+impure_magics = _method_names(magics.TimeMagic, magics.LocaltimeMagic, magics.PageMagic)
+impure_magics.update(["IFEXIST", "TAG"])
+
+impure_nodes = (magic_nodes.Time, magic_nodes.Tag, magic_nodes.Displaytitle,
+                magic_nodes.rel2abs, magic_nodes.Safesubst)
+
+
+def _literal_name(name):
+    """return the literal template name or the literal part of it up to
+    and including the first colon. return None if the name is computed"""
+
+    if isinstance(name, basestring):
+        return name, True
+    if name and isinstance(name[0], basestring) and ":" in name[0]:
+        return name[0], False
+    return None, False
+
+
+class TemplateMemo(object):
+    def __init__(self, maxsize):
+        self.maxsize = maxsize
+        self.size = 0
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+        self._purity = {}
+        self._contexts = {}
+
+    def _check_name(self, expander, name, complete, callees):
+        """return False, if calling the template or magic named name is
+        impure. add the name of called templates to callees"""
+
+        name = name.strip()
+        if ":" in name:
+            try_name = name.split(":", 1)[0]
+            try_name = expander.resolve_magic_alias(try_name) or try_name
+            klass = magic_nodes.registry.get(try_name)
+            if klass is not None:
+                return klass not in impure_nodes
+            if expander.resolver.has_magic(try_name):
+                return try_name.upper().lstrip("#") not in impure_magics
+        elif complete and expander.resolver.has_magic(name):
+            return name.upper().lstrip("#") not in impure_magics
+
+        if not complete or name.startswith("/"):
+            return False
+
+        callees.append(name)
+        return True
+
+    def _scan(self, expander, node, callees):
+        """return False, if node is impure by itself. add the names of
+        templates called from node to callees"""
+
+        if isinstance(node, basestring):
+            return True
+        if isinstance(node, impure_nodes):
+            return False
+
+        if type(node) is nodes.Template:
+            name, complete = _literal_name(node[0])
+            if name is None or not self._check_name(expander, name, complete, callees):
+                return False
+
+        for x in node:
+            if not self._scan(expander, x, callees):
+                return False
+        return True
+
+    def is_pure(self, expander, name):
+        try:
+            return self._purity[name]
+        except KeyError:
+            pass
+
+        # walk all templates reachable from name
+        todo = [name]
+        seen = set(todo)
+        pure = True
+        while todo and pure:
+            n = todo.pop()
+            if n.startswith("/"):
+                pure = False
+                break
+
+            p = expander.getParsedTemplate(n)
+            if p is None:
+                continue
+
+            callees = []
+            pure = self._scan(expander, p, callees)
+            for c in callees:
+                if c not in seen:
+                    seen.add(c)
+                    todo.append(c)
+
+        self._purity[name] = pure
+        return pure
+
+    def is_pure_call(self, expander, node):
+        """return whether the output of the template call node only
+        depends on its source and on the templates it calls"""
+        callees = []
+        if not self._scan(expander, node, callees):
+            return False
+        for c in callees:
+            if not self.is_pure(expander, c):
+                return False
+        return True
+
+    def _get_context(self, expander):
+        local_values = expander.resolver.local_values
+        if not local_values:
+            return None
+
+        try:
+            lv, ctx = self._contexts[id(local_values)]
+            if lv is local_values:
+                return ctx
+        except KeyError:
+            pass
+
+        ctx = frozenset(local_values.items())
+        self._contexts[id(local_values)] = (local_values, ctx)
+        return ctx
+
+    def _store(self, key, reads, depth, entry):
+        """add the output entry of the expansion, which did the lookups
+        reads, at recursion depth depth to the tree of key"""
+
+        for n, d, v in reads:
+            if v is failed_read:
+                return
+
+        size = entry[-1] + sum(sys.getsizeof(n) + sys.getsizeof(v) for n, d, v in reads)
+        if size > self.maxsize:
+            return
+
+        item = self.entries.pop(key, None)
+        if item is not None and item[0] + size > self.maxsize:
+            # start over with the tree of key
+            self.size -= item[0]
+            item = None
+        if item is None:
+            item = [0, None]
+        self.entries[key] = item
+
+        # inner nodes are [(name, relative depth), {value: node}], leaves
+        # are (depth, chunks, uniqs)
+        parent, value, node = None, None, item[1]
+        for n, d, v in reads:
+            lookup = (n, d - depth)
+            if node is None:
+                node = [lookup, {}]
+                if parent is None:
+                    item[1] = node
+                else:
+                    parent[1][value] = node
+            elif type(node) is not list or node[0] != lookup:
+                # the expansion at another depth went another way
+                return
+            parent, value, node = node, v, node[1].get(v)
+
+        if type(node) is list:
+            return
+        if node is not None and node[0] >= depth:
+            return
+        leaf = (depth, ) + entry[:-1]
+        if parent is None:
+            item[1] = leaf
+        else:
+            parent[1][value] = leaf
+
+        item[0] += size
+        self.size += size
+        while self.size > self.maxsize:
+            k, old = self.entries.popitem(last=False)
+            self.size -= old[0]
+
+    def _lookup(self, expander, node, variables):
+        """return the leaf of the tree node, which matches the arguments
+        variables, or None"""
+
+        depth = expander.recursion_count
+        state = variables._get_state()
+        variables.replayed = {}
+        while type(node) is list:
+            (n, d), children = node
+            expander.recursion_count = depth + d
+            try:
+                v = variables.get(n, None)
+            except Exception:
+                # the expansion raises at this lookup
+                node = None
+                break
+            finally:
+                expander.recursion_count = depth
+            node = children.get(v)
+
+        # an entry is only valid, if it did not run into the recursion
+        # limit, i.e. if it was computed with at least the same depth
+        if node is not None and depth <= node[0]:
+            variables.replayed = None
+            return node
+
+        # the lookups may have parsed arguments the expansion has not
+        # parsed yet. the expansions done by them are kept in replayed
+        variables._set_state(state)
+        return None
+
+    def flatten(self, expander, name, parsed, variables, res):
+        """expand template name with body parsed into res"""
+
+        # maybe_newline marks are only resolved in an OutputBuffer
+        key = (self._get_context(expander), name, type(res) is OutputBuffer)
+        depth = expander.recursion_count
+
+        item = self.entries.get(key)
+        if item is not None:
+            leaf = self._lookup(expander, item[1], variables)
+            if leaf is not None:
+                self.hits += 1
+                del self.entries[key]
+                self.entries[key] = item
+
+                res.extend(leaf[1])
+                uniq2repl = expander.uniquifier.uniq2repl
+                for k, v in leaf[2]:
+                    if k not in uniq2repl:
+                        uniq2repl[k] = v
+                return
+
+        self.misses += 1
+        oldlen = len(res)
+        reads = variables.reads = []
+        try:
+            expander.flatten_template(parsed, variables, res)
+        finally:
+            variables.reads = None
+            variables.replayed = None
+        chunks = tuple(res[oldlen:])
+
+        uniq2repl = expander.uniquifier.uniq2repl
+        uniqs = []
+        size = sys.getsizeof(name)
+        for x in chunks:
+            size += sys.getsizeof(x)
+            if "\x7fUNIQ" in x:
+                for u in uniqrx.findall(x):
+                    if u in uniq2repl:
+                        uniqs.append((u, uniq2repl[u]))
+
+        self._store(key, reads, depth, (chunks, tuple(uniqs), size))
+
+    def stats(self):
+        return dict(hits=self.hits, misses=self.misses, size=self.size, entries=len(self.entries))
+
+    def __repr__(self):
+        return "<TemplateMemo hits=%s misses=%s size=%s entries=%s>" % (
+            self.hits, self.misses, self.size, len(self.entries))
+
+
+_memos = weakref.WeakKeyDictionary()
+
+
+def get_memo(wikidb):
+    """return the TemplateMemo shared by all expanders using wikidb or
+    None if memoization is disabled"""
+
+    maxsize = conf.get("expander", "memo_size", 0, int)
+    if not maxsize or wikidb is None:
+        return None
+
+    try:
+        memo = _memos.get(wikidb)
+    except TypeError:
+        return None
+
+    if memo is None:
+        memo = _memos[wikidb] = TemplateMemo(maxsize)
+    return memo
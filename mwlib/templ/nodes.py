@@ -36,17 +36,14 @@ class IfNode(Node):
         # see http://code.pediapress.com/wiki/ticket/700#comment:1
         cond = cond.strip(unichr(0xebad))
 
-        res.append(maybe_newline)
-        tmp = []
+        tmp = OutputBuffer()
         if cond:
             if len(self) > 1:
                 flatten(self[1], expander, variables, tmp)
         else:
             if len(self) > 2:
                 flatten(self[2], expander, variables, tmp)
-        _insert_implicit_newlines(tmp)
-        res.append(u"".join(tmp).strip())
-        res.append(dummy_mark)
+        append_block(res, tmp)
 
 
 class IfeqNode(Node):
@@ -62,8 +59,7 @@ class IfeqNode(Node):
 
         from mwlib.templ.magics import maybe_numeric_compare
 
-        res.append(maybe_newline)
-        tmp = []
+        tmp = OutputBuffer()
 
         if maybe_numeric_compare(v1, v2):
             if len(self) > 2:
@@ -72,9 +68,30 @@ class IfeqNode(Node):
             if len(self) > 3:
                 flatten(self[3], expander, variables, tmp)
 
-        _insert_implicit_newlines(tmp)
-        res.append(u"".join(tmp).strip())
-        res.append(dummy_mark)
+        append_block(res, tmp)
+
+
+class BlockNode(Node):
+    """a #if, #ifeq or #switch, whose branch has been determined by
+    templ.optimizer. self[0] is the branch. templ.optimizer creates the
+    subclasses below, which tell the profiler the folded function"""
+
+    def flatten(self, expander, variables, res):
+        tmp = OutputBuffer()
+        flatten(self[0], expander, variables, tmp)
+        append_block(res, tmp)
+
+
+class IfBlockNode(BlockNode):
+    pass
+
+
+class IfeqBlockNode(BlockNode):
+    pass
+
+
+class SwitchBlockNode(BlockNode):
+    pass
 
 
 def maybe_numeric(a):
@@ -141,7 +158,6 @@ class SwitchNode(Node):
         if self.unresolved is None:
             self._init()
 
-        res.append(maybe_newline)
         val = []
         flatten(self[0], expander, variables, val)
         val = u"".join(val).strip()
@@ -175,12 +191,9 @@ class SwitchNode(Node):
                     break
             retval = retval or u""
 
-        tmp = []
+        tmp = OutputBuffer()
         flatten(retval, expander, variables, tmp)
-        _insert_implicit_newlines(tmp)
-        tmp = u"".join(tmp).strip()
-        res.append(tmp)
-        res.append(dummy_mark)
+        append_block(res, tmp)
 
 
 class Variable(Node):
@@ -238,7 +251,16 @@ class Template(Node):
             if klass is not None:
                 children = (try_remainder, )+args
                 # print "MAGIC:", klass,  children
-                klass(children).flatten(expander, variables, res)
+                profiler = expander.profiler
+                if profiler is None:
+                    klass(children).flatten(expander, variables, res)
+                else:
+                    idx = len(res)
+                    frame = profiler.enter()
+                    try:
+                        klass(children).flatten(expander, variables, res)
+                    finally:
+                        profiler.leave(frame, profiler.functions, try_name.upper(), output_size(res, idx))
                 return
 
             if expander.resolver.has_magic(try_name):
@@ -246,6 +268,7 @@ class Template(Node):
                 remainder = try_remainder
 
             if name == '#ifeq':
+                idx = len(res)
                 res.append(maybe_newline)
                 tmp = []
                 if len(args) >= 1:
@@ -262,6 +285,7 @@ class Template(Node):
                         flatten(args[2], expander, variables, tmp)
                         res.append(u"".join(tmp).strip())
                 res.append(dummy_mark)
+                resolve_newline(res, idx)
                 return
 
         var = []
@@ -273,26 +297,58 @@ class Template(Node):
 
         var = ArgumentList(args=var, expander=expander, variables=variables)
 
-        rep = expander.resolver(name, var)
+        profiler = expander.profiler
+        if profiler is None:
+            rep = expander.resolver(name, var)
+        else:
+            rep = profiler.call_magic(expander.resolver, name, var)
 
         if rep is not None:
             res.append(maybe_newline)
             res.append(rep)
             res.append(dummy_mark)
+            resolve_newline(res, len(res)-3)
         else:
             p = expander.getParsedTemplate(name)
             if p:
+                expander.budget.count_template()
                 if DEBUG:
                     msg = "EXPANDING %r %r  ===> " % (name, var)
                     oldidx = len(res)
                 res.append(mark_start(repr(name)))
+                idx = len(res)
                 res.append(maybe_newline)
-                flatten(p, expander, var, res)
+                memo = expander.memo
+                if profiler is not None:
+                    _profile_template(expander, name, p, var, res)
+                elif memo is not None and memo.is_pure(expander, name):
+                    memo.flatten(expander, name, p, var, res)
+                else:
+                    expander.flatten_template(p, var, res)
                 res.append(mark_end(repr(name)))
+                resolve_newline(res, idx)
 
                 if DEBUG:
                     msg += repr("".join(res[oldidx:]))
                     print msg
+                    print "ARGUMENTS %r %r" % (name, var)
+
+
+def _profile_template(expander, name, p, var, res):
+    profiler = expander.profiler
+    memo = expander.memo
+    idx = len(res)
+    hit = False
+    frame = profiler.enter(True)
+    try:
+        if memo is not None and memo.is_pure(expander, name):
+            hits = memo.hits
+            memo.flatten(expander, name, p, var, res)
+            hit = memo.hits > hits
+        else:
+            expander.flatten_template(p, var, res)
+    finally:
+        profiler.leave(frame, profiler.templates, name, output_size(res, idx), hit)
 
 
 def show(node, indent=0, out=None):
@@ -304,6 +360,7 @@ def show(node, indent=0, out=None):
     out.write("%s\n" % (node,))
 
 
-from mwlib.templ.evaluate import maybe_newline, mark_start, mark_end, dummy_mark, flatten, MemoryLimitError, ArgumentList, equalsplit, _insert_implicit_newlines
+from mwlib.templ.evaluate import maybe_newline, mark_start, mark_end, dummy_mark, flatten, MemoryLimitError, ArgumentList, equalsplit, OutputBuffer, resolve_newline, append_block
 from mwlib.templ import log, DEBUG
 from mwlib.templ.parser import optimize
+from mwlib.templ.profiler import output_size
@@ -0,0 +1,175 @@
+# Copyright (c) 2007-2009 PediaPress GmbH
+# See README.rst for additional licensing information.
+
+"""constant folding for parsed templates
+
+fold(node) is run by the parser after optimize and returns an
+equivalent tree, which needs fewer node evaluations:
+
+ - #if, #ifeq and #switch nodes, whose condition is literal, are
+   replaced by a BlockNode holding the branch, which would be taken.
+   The profiler accounts it as call of the folded function.
+   #switch nodes are only folded if the matching case precedes all
+   cases with computed keys and is not the default case, since the
+   names of the default case depend on the siteinfo of the expander.
+ - the key tables of #switch nodes are computed here instead of on
+   their first evaluation.
+ - sequences of strings in output position are joined into a single
+   string.
+
+<includeonly> and <noinclude> sections have already been resolved by
+the preprocessor, so conditions depending on them are literal here.
+
+Template arguments and the arguments of the other magic nodes are not
+joined, since their eqmarks separate names from values. As with memo,
+removing nodes means that expansions close to the recursion limit may
+succeed where they would otherwise fail.
+"""
+
+from mwlib.templ import nodes
+from mwlib.templ.magics import maybe_numeric_compare
+
+_sequences = (tuple, list, nodes.Node)
+
+
+def _literal(node):
+    """return the expansion of node, if it only consists of strings, None otherwise"""
+    if isinstance(node, basestring):
+        return node
+    if type(node) in _sequences:
+        for x in node:
+            if not isinstance(x, basestring):
+                return None
+        return u"".join(node)
+    return None
+
+
+def _fold_block(node):
+    return type(node)((fold(node[0]),))
+
+
+def _fold_sequence(node):
+    children = [fold(x) for x in node]
+
+    # joining strings does not change where implicit newlines are
+    # inserted, as long as none of them is empty
+    if children and all(isinstance(x, basestring) and x for x in children):
+        return u"".join(children)
+
+    if all(x is y for x, y in zip(children, node)):
+        return node
+    return type(node)(children)
+
+
+def _fold_args(node):
+    """fold the children of node, but keep node and its direct children,
+    which may contain eqmarks"""
+
+    children = [_fold_arg(x) for x in node]
+    if all(x is y for x, y in zip(children, node)):
+        return node
+    return type(node)(children)
+
+
+def _fold_arg(node):
+    if type(node) in (tuple, list):
+        return _fold_args(node)
+    return fold(node)
+
+
+def _fold_if(node):
+    node = nodes.IfNode(tuple(fold(x) for x in node))
+    cond = _literal(node[0])
+    if cond is None:
+        return node
+
+    if cond.strip().strip(unichr(0xebad)):
+        idx = 1
+    else:
+        idx = 2
+    if len(node) > idx:
+        return nodes.IfBlockNode((node[idx],))
+    return nodes.IfBlockNode((u"",))
+
+
+def _fold_ifeq(node):
+    node = nodes.IfeqNode(tuple(fold(x) for x in node))
+    v1 = _literal(node[0])
+    if len(node) > 1:
+        v2 = _literal(node[1])
+    else:
+        v2 = u""
+    if v1 is None or v2 is None:
+        return node
+
+    if maybe_numeric_compare(v1.strip(), v2.strip()):
+        idx = 2
+    else:
+        idx = 3
+    if len(node) > idx:
+        return nodes.IfeqBlockNode((node[idx],))
+    return nodes.IfeqBlockNode((u"",))
+
+
+def _fold_switch(node):
+    if node.unresolved is None:
+        node._init()
+
+    folded = {}
+
+    def fold_value(v):
+        try:
+            return folded[id(v)]
+        except KeyError:
+            res = folded[id(v)] = fold(v)
+            return res
+
+    fast = dict((k, (pos, fold_value(v))) for k, (pos, v) in node.fast.items())
+    unresolved = tuple((fold(k), fold_value(v)) for k, v in node.unresolved)
+
+    res = nodes.SwitchNode((fold(node[0]), node[1]))
+    res.fast = fast
+    res.unresolved = unresolved
+    res.sentinel = (len(unresolved)+1, None)
+
+    val = _literal(res[0])
+    if val is None:
+        return res
+
+    val = val.strip()
+    num_val = nodes.maybe_numeric(val)
+    pos, retval = min(fast.get(val, res.sentinel), fast.get(num_val, res.sentinel))
+    if pos == 0 and retval is not None:
+        return nodes.SwitchBlockNode((retval,))
+    return res
+
+
+def _fold_template(node):
+    return nodes.Template((fold(node[0]), _fold_args(node[1])))
+
+
+_folders = {
+    tuple: _fold_sequence,
+    list: _fold_sequence,
+    nodes.Node: _fold_sequence,
+    nodes.IfNode: _fold_if,
+    nodes.IfeqNode: _fold_ifeq,
+    nodes.SwitchNode: _fold_switch,
+    nodes.Template: _fold_template,
+    nodes.Variable: lambda node: nodes.Variable(tuple(fold(x) for x in node)),
+    nodes.BlockNode: _fold_block,
+    nodes.IfBlockNode: _fold_block,
+    nodes.IfeqBlockNode: _fold_block,
+    nodes.SwitchBlockNode: _fold_block,
+}
+
+
+def fold(node):
+    """return node with literal conditions folded"""
+    if isinstance(node, basestring):
+        return node
+    f = _folders.get(type(node))
+    if f is None:
+        # magic nodes
+        return _fold_args(node)
+    return f(node)
@@ -77,37 +77,34 @@ def optimize(node):
     return node
 
 
-from mwlib import lrucache
+from mwlib import lrucache, conf
+from mwlib._conf import as_bool
 
 
 class Parser(object):
     use_cache = False
     _cache = lrucache.mt_lrucache(2000)
 
-    def __init__(self, txt, included=True, replace_tags=None, siteinfo=None):
+    # fold literal conditions with templ.optimizer
+    fold = conf.get("expander", "fold", True, as_bool)
+
+    def __init__(self, txt, included=True, replace_tags=None, siteinfo=None, uniquifier=None):
         if isinstance(txt, str):
             txt = unicode(txt)
 
         self.txt = txt
         self.included = included
         self.replace_tags = replace_tags
+        self.uniquifier = uniquifier
         if siteinfo is None:
             from mwlib.siteinfo import get_siteinfo
             siteinfo = get_siteinfo("en")
         self.siteinfo = siteinfo
-        self.name2rx = {"if": re.compile("^#if:"),
-                        "switch": re.compile("^#switch:")}
-
-        magicwords = self.siteinfo.get("magicwords", [])
-        for d in magicwords:
-            name = d["name"]
-            if name in ("if", "switch"):
-                aliases = [re.escape(x) for x in d["aliases"]]
-                rx = "^#(%s):" % ("|".join(aliases),)
-                self.name2rx[name] = re.compile(rx)
-                # print name, rx
 
-        self.aliasmap = aliasmap(self.siteinfo)
+        from mwlib import sitecontext
+        ctx = sitecontext.get_context(siteinfo)
+        self.name2rx = ctx.name2rx
+        self.aliasmap = ctx.aliasmap
 
     def getToken(self):
         return self.tokens[self.pos]
@@ -320,7 +317,8 @@ class Parser(object):
             except KeyError:
                 pass
 
-        self.tokens = tokenize(self.txt, included=self.included, replace_tags=self.replace_tags)
+        self.tokens = tokenize(self.txt, included=self.included, replace_tags=self.replace_tags,
+                               uniquifier=self.uniquifier)
         self.pos = 0
         n = []
 
@@ -337,6 +335,9 @@ class Parser(object):
                 self.pos += 1
 
         n = optimize(n)
+        if self.fold:
+            from mwlib.templ import optimizer
+            n = optimizer.fold(n)
 
         if self.use_cache:
             self._cache[fp] = n
@@ -344,5 +345,6 @@ class Parser(object):
         return n
 
 
-def parse(txt, included=True, replace_tags=None, siteinfo=None):
-    return Parser(txt, included=included, replace_tags=replace_tags, siteinfo=siteinfo).parse()
+def parse(txt, included=True, replace_tags=None, siteinfo=None, uniquifier=None):
+    return Parser(txt, included=included, replace_tags=replace_tags, siteinfo=siteinfo,
+                  uniquifier=uniquifier).parse()
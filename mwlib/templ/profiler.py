@@ -0,0 +1,198 @@
+# Copyright (c) 2007-2009 PediaPress GmbH
+# See README.rst for additional licensing information.
+
+"""template expansion profiler
+
+When enabled (mw-render --profile-templates or
+MWLIB_EXPANDER_PROFILE=1), all expanders record per template and per
+parser function the number of calls, the cumulative and self wall
+time, the number of characters of output, the maximum nesting depth
+and the number of calls served from the TemplateMemo. Cumulative times
+of recursive templates include their nested calls. call_cache counts
+the top-level calls served from the callcache and the expansion time
+they saved.
+
+Disabled, the evaluators only test expander.profiler for None.
+"""
+
+import json
+import os
+from timeit import default_timer as timer
+
+from mwlib import conf
+from mwlib._conf import as_bool
+
+
+class Stats(object):
+    __slots__ = ["calls", "cumulative", "self_time", "output", "max_depth", "hits"]
+
+    def __init__(self):
+        self.calls = 0
+        self.cumulative = 0.0
+        self.self_time = 0.0
+        self.output = 0
+        self.max_depth = 0
+        self.hits = 0
+
+    def todict(self):
+        return dict(calls=self.calls,
+                    cumulative=self.cumulative,
+                    self_time=self.self_time,
+                    output=self.output,
+                    max_depth=self.max_depth,
+                    hits=self.hits,
+                    hit_rate=float(self.hits) / self.calls if self.calls else 0.0)
+
+
+class Profiler(object):
+    def __init__(self):
+        self.templates = {}
+        self.functions = {}
+        self.stack = []  # [start time, time spent in nested calls, template depth]
+        self.call_cache = dict(hits=0, misses=0, uncacheable=0, saved=0.0)
+        self.node_names = get_node_names()
+
+    def enter(self, template=False):
+        stack = self.stack
+        if stack:
+            depth = stack[-1][2]
+        else:
+            depth = 0
+        if template:
+            depth += 1
+        frame = [timer(), 0.0, depth]
+        stack.append(frame)
+        return frame
+
+    def leave(self, frame, table, name, output=0, hit=False):
+        now = timer()
+        stack = self.stack
+        while stack:
+            if stack.pop() is frame:
+                break
+
+        elapsed = now - frame[0]
+        if stack:
+            stack[-1][1] += elapsed
+
+        st = table.get(name)
+        if st is None:
+            st = table[name] = Stats()
+        st.calls += 1
+        st.cumulative += elapsed
+        st.self_time += elapsed - frame[1]
+        st.output += output
+        if frame[2] > st.max_depth:
+            st.max_depth = frame[2]
+        if hit:
+            st.hits += 1
+
+    def discard(self, frame):
+        """drop frame without accounting it"""
+        stack = self.stack
+        while stack:
+            if stack.pop() is frame:
+                break
+
+    def call(self, fun, name, expander, variables, res):
+        """call fun(expander, variables, res) and account it as parser
+        function name"""
+        idx = len(res)
+        frame = self.enter()
+        try:
+            fun(expander, variables, res)
+        finally:
+            self.leave(frame, self.functions, name, output_size(res, idx))
+
+    def flatten(self, node, expander, variables, res):
+        """node.flatten(expander, variables, res), accounted as parser
+        function, if node is one resolved by the parser"""
+        name = self.node_names.get(type(node))
+        if name is None:
+            node.flatten(expander, variables, res)
+        else:
+            self.call(node.flatten, name, expander, variables, res)
+
+    def call_magic(self, resolver, name, args):
+        """call resolver(name, args) and account it as parser function
+        name, if name is one"""
+
+        frame = self.enter()
+        try:
+            res = resolver(name, args)
+        except:
+            self.discard(frame)
+            raise
+        if res is None:
+            self.discard(frame)
+        else:
+            self.leave(frame, self.functions, name.upper(), output=len(res))
+        return res
+
+    def report(self):
+        return dict(templates=dict((k, v.todict()) for k, v in self.templates.items()),
+                    functions=dict((k, v.todict()) for k, v in self.functions.items()),
+                    call_cache=self.call_cache)
+
+    def write_report(self, path):
+        tmp = path + ".tmp"
+        f = open(tmp, "wb")
+        try:
+            json.dump(self.report(), f, indent=1, sort_keys=True)
+        finally:
+            f.close()
+        os.rename(tmp, path)
+
+
+def output_size(res, start):
+    """return the number of characters appended to res after index start"""
+    return sum(len(x) for x in res[start:])
+
+
+_node_names = None
+
+
+def get_node_names():
+    """return a dict mapping the node classes, which the parser creates
+    for parser functions, to the upper cased function name. folded
+    functions are accounted like the ones evaluated"""
+    global _node_names
+    if _node_names is None:
+        from mwlib.templ import nodes, magic_nodes
+        res = {nodes.SwitchNode: "#SWITCH",
+               nodes.IfBlockNode: "#IF",
+               nodes.IfeqBlockNode: "#IFEQ",
+               nodes.SwitchBlockNode: "#SWITCH"}
+        for name, klass in magic_nodes.registry.items():
+            if isinstance(klass, type) and not issubclass(klass, nodes.Template):
+                res[klass] = name.upper()
+        _node_names = res
+    return _node_names
+
+
+_profiler = None
+
+
+def enable():
+    """start profiling all expanders and return the Profiler"""
+    global _profiler
+    if _profiler is None:
+        _profiler = Profiler()
+    return _profiler
+
+
+def disable():
+    global _profiler
+    _profiler = None
+
+
+def get_profiler():
+    """return the active Profiler or None"""
+    if _profiler is None and conf.get("expander", "profile", False, as_bool):
+        return enable()
+    return _profiler
+
+
+def report_path(status_file):
+    """return the name of the report written next to status_file"""
+    return status_file + ".profile.json"
@@ -5,6 +5,11 @@
 import re
 from mwlib.templ import pp
 
+try:
+    from mwlib import _expander
+except ImportError:
+    _expander = None
+
 splitpattern = """
 ({{+)                     # opening braces
 |(}}+)                    # closing braces
@@ -33,12 +38,7 @@ class symbols:
     txt = 5
 
 
-def tokenize(txt, included=True, replace_tags=None):
-    txt = pp.preprocess(txt, included=included)
-
-    if replace_tags is not None:
-        txt = replace_tags(txt)
-
+def _tokenize(txt):
     tokens = []
     for (v1, v2, v3, v4, v5) in splitrx.findall(txt):
         if v5:
@@ -51,6 +51,57 @@ def tokenize(txt, included=True, replace_tags=None):
             tokens.append((2, v2))
         elif v1:
             tokens.append((1, v1))
+    return tokens
+
+
+_native_tags = {}
+
+
+def _has_native_tags(u):
+    """return whether the native scanner can match the tags of the
+    Uniquifier u"""
+    if u.rx is None:
+        u.compile()
+
+    try:
+        return _native_tags[u.tagnames]
+    except KeyError:
+        ok = _native_tags[u.tagnames] = all(x.isalnum() and x == x.lower() for x in u.tagnames)
+        return ok
+
+
+def tokenize(txt, included=True, replace_tags=None, uniquifier=None):
+    """preprocess and tokenize txt. replace_tags is called on the
+    preprocessed text. passing a Uniquifier as uniquifier instead lets the
+    native scanner replace its tags in the same call"""
+
+    if uniquifier is not None:
+        assert replace_tags is None, "pass either replace_tags or uniquifier"
+        replace_tags = uniquifier.replace_tags
+
+    if _expander is not None and type(txt) is unicode:
+        # the native scanner can do the work of pp.preprocess and
+        # Uniquifier.replace_tags in the same call
+        if replace_tags is None:
+            tokens = _expander.preprocess_scan(txt, included, None, None)
+            tokens.append((None, ''))
+            return tokens
+
+        if uniquifier is not None and _has_native_tags(uniquifier):
+            tokens = _expander.preprocess_scan(txt, included, uniquifier.tagnames, uniquifier.tag_to_uniq)
+            tokens.append((None, ''))
+            return tokens
+
+    txt = pp.preprocess(txt, included=included)
+
+    if replace_tags is not None:
+        txt = replace_tags(txt)
+
+    # the native scanner returns the same tokens as _tokenize
+    if _expander is not None and type(txt) is unicode:
+        tokens = _expander.scan(txt)
+    else:
+        tokens = _tokenize(txt)
 
     tokens.append((None, ''))
 
@@ -5,10 +5,66 @@
 import os
 import re
 
+uniqrx = re.compile("\x7fUNIQ-[a-z0-9]+-\\d+-[a-f0-9]+-QINU\x7f")
+
+default_tags = frozenset("nowiki math imagemap gallery source pre ref timeline poem pages".split())
+
+_tag_patterns = {}
+
+
+def get_tag_pattern(tagnames):
+    """return the regular expression matching comments and the extension
+    tags tagnames. the patterns are shared by all Uniquifiers"""
+
+    try:
+        return _tag_patterns[tagnames]
+    except KeyError:
+        pass
+
+    rx = """
+        (?P<comment> (\\n[ ]*)?<!--.*?-->([ ]*\\n)?) |
+        (?:
+        <(?P<tagname> NAMES)
+        (?P<vlist> \\s[^<>]*)?
+        (/>
+         |
+         (?<!/) >
+        (?P<inner>.*?)
+        </(?P=tagname)\\s*>))
+    """
+
+    rx = rx.replace("NAMES", "|".join(list(tagnames)))
+    rx = _tag_patterns[tagnames] = re.compile(rx, re.VERBOSE | re.DOTALL | re.IGNORECASE)
+    return rx
+
+
+def find_uniqs(txt):
+    """return the offsets (start, end) of the uniq markers in txt"""
+
+    res = []
+    find = txt.find
+    start = find("\x7fUNIQ-")
+    while start != -1:
+        end = find("-QINU\x7f", start)
+        if end == -1:
+            break
+        end += 6
+        if txt.find("\x7f", start + 1, end - 1) != -1:
+            # not a marker, but another one may start inside
+            start = find("\x7fUNIQ-", start + 1)
+            continue
+        if uniqrx.match(txt, start, end):
+            res.append((start, end))
+            start = find("\x7fUNIQ-", end)
+        else:
+            start = find("\x7fUNIQ-", end - 1)
+    return res
+
 
 class Uniquifier(object):
     random_string = None
     rx = None
+    tagnames = None
 
     def __init__(self):
         self.uniq2repl = {}
@@ -24,17 +80,24 @@ class Uniquifier(object):
         self.uniq2repl[retval] = repl
         return retval
 
-    def _repl_from_uniq(self, mo):
-        u = mo.group(0)
-        t = self.uniq2repl.get(u, None)
-        if t is None:
-            return u
-        return t["complete"]
-
     def replace_uniq(self, txt):
-        rx = re.compile("\x7fUNIQ-[a-z0-9]+-\\d+-[a-f0-9]+-QINU\x7f")
-        txt = rx.sub(self._repl_from_uniq, txt)
-        return txt
+        if "\x7f" not in txt:
+            return txt
+
+        res = []
+        last = 0
+        uniq2repl = self.uniq2repl
+        for start, end in find_uniqs(txt):
+            t = uniq2repl.get(txt[start:end])
+            if t is None:
+                continue
+            res.append(txt[last:start])
+            res.append(t["complete"])
+            last = end
+        if not res:
+            return txt
+        res.append(txt[last:])
+        return u"".join(res)
 
     def _repl_to_uniq(self, mo):
         tagname = mo.group("tagname")
@@ -44,42 +107,32 @@ class Uniquifier(object):
                 return '\n'
             return (mo.group(2) or "") + (mo.group(3) or "")
 
-        else:
-            tagname = tagname.lower()
+        return self.tag_to_uniq(tagname, mo.group("vlist"), mo.group("inner"), mo.group(0))
 
+    def tag_to_uniq(self, tagname, vlist, inner, complete):
+        """return the marker replacing the tag complete"""
+        tagname = tagname.lower()
         r = dict(
             tagname=tagname,
-            inner=mo.group("inner") or u"",
-            vlist=mo.group("vlist") or u"",
-            complete=mo.group(0))
+            inner=inner or u"",
+            vlist=vlist or u"",
+            complete=complete)
 
         if tagname == u"nowiki":
             r["complete"] = r["inner"]
 
         return self.get_uniq(r, tagname)
 
+    def compile(self):
+        from mwlib import tagext
+        self.tagnames = default_tags.union(tagext.default_registry.names())
+        self.rx = get_tag_pattern(self.tagnames)
+        return self.rx
+
     def replace_tags(self, txt):
         self.txt = txt
         rx = self.rx
         if rx is None:
-            tags = set("nowiki math imagemap gallery source pre ref timeline poem pages".split())
-            from mwlib import tagext
-            tags.update(tagext.default_registry.names())
-
-            rx = """
-                (?P<comment> (\\n[ ]*)?<!--.*?-->([ ]*\\n)?) |
-                (?:
-                <(?P<tagname> NAMES)
-                (?P<vlist> \\s[^<>]*)?
-                (/>
-                 |
-                 (?<!/) >
-                (?P<inner>.*?)
-                </(?P=tagname)\\s*>))
-            """
-
-            rx = rx.replace("NAMES", "|".join(list(tags)))
-            rx = re.compile(rx, re.VERBOSE | re.DOTALL | re.IGNORECASE)
-            self.rx = rx
+            rx = self.compile()
         newtxt = rx.sub(self._repl_to_uniq, txt)
         return newtxt
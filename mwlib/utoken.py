@@ -7,8 +7,10 @@
 
 import sys
 import re
+from itertools import izip
 import _uscan as _mwscan
 from mwlib.refine.util import resolve_entity, parseParams
+from mwlib.uniq import find_uniqs
 
 
 def walknode(node, filt=lambda x: True):
@@ -62,20 +64,27 @@ class _show(object):
 
 
 class token(object):
+    # the attributes most tokens have are stored in slots, the rare ones
+    # in __dict__, which is only allocated for the tokens that get one.
+    # __weakref__ gives the subclasses in mwlib.parser.nodes the same
+    # layout, so that compat can still assign __class__.
+    fields = ("type", "start", "len", "source", "_text", "children", "tagname", "vlist", "blocknode")
+    __slots__ = fields + ("__dict__", "__weakref__")
+
+    # values of the fields, which are not set (e.g. in nodes created
+    # without token.__init__)
+    _defaults = dict(_text=None, children=None, tagname=None, vlist=None, blocknode=False)
+
     caption = ''
-    vlist = None
     target = None
     level = None
-    children = None
 
     rawtagname = None
-    tagname = None
     ns = None
     lineprefix = None
     interwiki = None
     langlink = None
     namespace = None
-    blocknode = False
 
     # image attributes
     align = None
@@ -113,8 +122,26 @@ class token(object):
 
     t_html_tag_end = 100
 
+    # the types of the nodes created by mwlib.refine
+    t_complex_table = "complex_table"
+    t_complex_caption = "complex_caption"
+    t_complex_table_row = "complex_table_row"
+    t_complex_table_cell = "complex_table_cell"
+    t_complex_tag = "complex_tag"
+    t_complex_link = "link"
+    t_complex_section = "section"
+    t_complex_article = "article"
+    t_complex_indent = "indent"
+    t_complex_line = "line"
+    t_complex_named_url = "named_url"
+    t_complex_style = "style"
+    t_complex_node = "node"
+    t_complex_preformatted = "preformatted"
+    t_complex_compat = "compat"
+
+    t_vlist = "vlist"
+
     token2name = {}
-    _text = None
 
     @staticmethod
     def join_as_text(tokens):
@@ -130,15 +157,26 @@ class token(object):
 
     text = property(_get_text, _set_text)
 
-    def __init__(self, type=None, start=None, len=None, source=None, text=None, **kw):
+    def __init__(self, type=None, start=None, len=None, source=None, text=None,
+                 children=None, tagname=None, vlist=None, blocknode=False, **kw):
         self.type = type
         self.start = start
         self.len = len
         self.source = source
-        if text is not None:
-            self.text = text
+        self._text = text
+        self.children = children
+        self.tagname = tagname
+        self.vlist = vlist
+        self.blocknode = blocknode
 
-        self.__dict__.update(kw)
+        if kw:
+            self.__dict__.update(kw)
+
+    def __getattr__(self, name):
+        try:
+            return self._defaults[name]
+        except KeyError:
+            raise AttributeError(name)
 
     def __repr__(self):
         if isinstance(self, token):
@@ -186,9 +224,10 @@ class token(object):
     show = _show()
 
 
+# the complex types are shown by their value
 token2name = token.token2name
 for d in dir(token):
-    if d.startswith("t_"):
+    if d.startswith("t_") and isinstance(getattr(token, d), int):
         token2name[getattr(token, d)] = d
 del d, token2name
 
@@ -229,13 +268,21 @@ def _analyze_html_tag(t):
         t.type = t.t_html_tag_end
 
 
+def iter_records(tokens):
+    """iterate over the (type, start, len) records of the array returned
+    by scan. the tuples are reused by izip, if they are unpacked"""
+    it = iter(tokens)
+    return izip(it, it, it)
+
+
 def dump_tokens(text, tokens):
-    for type, start, len in tokens:
+    for type, start, len in iter_records(tokens):
         print type, repr(text[start:start + len])
 
 
 def scan(text):
-    text += u"\0" * 32
+    """scan text and return an array('i') holding a (type, start, len)
+    record for every token"""
     return _mwscan.scan(text)
 
 
@@ -258,12 +305,22 @@ startfeed strike strong sub sup caption table td th tr tt u ul var dl dt dd
 
         tokens = scan(text)
 
+        # offsets of the uniq markers, tokens are visited in order
+        if uniquifier:
+            uniqs = find_uniqs(text)
+        else:
+            uniqs = []
+        uniqpos = 0
+        numuniqs = len(uniqs)
+
         res = []
 
         def g():
             return text[start:start + tlen]
 
-        for type, start, tlen in tokens:
+        # every record becomes a token right away: the refine passes work
+        # on plain lists of tokens
+        for type, start, tlen in iter_records(tokens):
 
             if type == token.t_begintable:
                 txt = g()
@@ -273,16 +330,16 @@ startfeed strike strong sub sup caption table td th tr tt u ul var dl dt dd
                 tlen -= count
                 start += count
 
-            t = token(type=type, start=start, len=tlen, source=text)
-
             if type == token.t_entity:
-                t.text = resolve_entity(g())
-                t.type = token.t_text
-                res.append(t)
+                res.append(token(token.t_text, start, tlen, text, resolve_entity(g())))
             elif type == token.t_html_tag:
+                t = token(type, start, tlen, text)
                 s = g()
                 if uniquifier:
-                    s = uniquifier.replace_uniq(s)
+                    while uniqpos < numuniqs and uniqs[uniqpos][1] <= start:
+                        uniqpos += 1
+                    if uniqpos < numuniqs and uniqs[uniqpos][0] < start + tlen:
+                        s = uniquifier.replace_uniq(s)
                     t.text = s
                 _analyze_html_tag(t)
                 tagname = t.rawtagname
@@ -290,9 +347,9 @@ startfeed strike strong sub sup caption table td th tr tt u ul var dl dt dd
                 if tagname in self.allowed_tags:
                     res.append(t)
                 else:
-                    res.append(token(type=token.t_text, start=start, len=tlen, source=text))
+                    res.append(token(token.t_text, start, tlen, text))
             else:
-                res.append(t)
+                res.append(token(type, start, tlen, text))
 
         return res
 
@@ -0,0 +1,75 @@
+#! /usr/bin/env python
+"""
+report the bytes per token of the tree returned by refine.core.parse_txt,
+once for the tokens as they are and once as if every token kept all of
+its attributes in a __dict__. The wikitext is read from the file given on
+the command line or generated.
+"""
+
+import gc
+import sys
+
+from mwlib.refine import core
+from mwlib.utoken import token, walknode
+
+article = u"""== Section %(i)d ==
+'''Bold''' and ''italic'' text with a [[Link|link]], [[Other]] and [http://example.com/%(i)d an url].
+* item <b>one</b>
+* item two
+# numbered
+ preformatted text
+{| class="wikitable"
+! header !! header
+|-
+| cell || cell [[in cell]]
+|}
+
+"""
+
+
+class dicttoken(object):
+    pass
+
+
+def get_size(t):
+    """return the size of t and the dict holding its attributes"""
+    size = sys.getsizeof(t)
+    for x in gc.get_referents(t):
+        if type(x) is dict:
+            size += sys.getsizeof(x)
+    return size
+
+
+def get_dict_size(t):
+    """return the size of t if all of its attributes, which are not at
+    their default, were stored in a dict"""
+    d = dicttoken()
+    for name in token.fields:
+        value = getattr(t, name)
+        if name == "_text" or value is not token._defaults.get(name):
+            d.__dict__[name] = value
+    for x in gc.get_referents(t):
+        if type(x) is dict:
+            d.__dict__.update(x)
+    return sys.getsizeof(d) + sys.getsizeof(d.__dict__)
+
+
+def main():
+    if len(sys.argv) > 1:
+        txt = unicode(open(sys.argv[1]).read(), "utf-8")
+    else:
+        txt = u"".join(article % dict(i=i) for i in range(500))
+
+    tokens = list(walknode(core.parse_txt(txt)))
+    n = float(len(tokens))
+    slotted = sum(get_size(t) for t in tokens)
+    dicts = sum(get_dict_size(t) for t in tokens)
+    plain = sum(1 for t in tokens if not [x for x in gc.get_referents(t) if type(x) is dict])
+
+    print "tokens:                   %d (%d without __dict__)" % (n, plain)
+    print "bytes per token, dict:    %.1f" % (dicts / n,)
+    print "bytes per token, slotted: %.1f" % (slotted / n,)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+#! /usr/bin/env python
+"""
+report the time spent in each pass of refine.core.parse_txt, once with
+every pass walking the token tree on its own and once with the passes
+fused into a single traversal (MWLIB_REFINE_FUSED). The wikitext is read
+from the file given on the command line or generated.
+"""
+
+import sys
+import time
+
+from mwlib.refine import core
+
+article = u"""== Section %(i)d ==
+'''Bold''' and ''italic'' text with a [[Link|link]], [[Other]] and [http://example.com/%(i)d an url].
+* item <b>one</b>
+* item two
+** nested item with [[File:Image%(i)d.jpg|thumb|left|caption]]
+# numbered
+; term : definition
+ preformatted text
+<div class="x">a <span>div</span></div>
+{| class="wikitable"
+|+ caption
+! header !! header
+|-
+| cell || cell [[in cell]]
+|-
+| <ref>reference %(i)d</ref> || ''cell''
+|}
+
+"""
+
+
+def run(txt, fused, repeat=3):
+    core.combined_parser.fused = fused
+    best = None
+    for i in range(repeat):
+        timings = {}
+        stime = time.time()
+        core.parse_txt(txt, timings=timings)
+        needed = time.time() - stime
+        if best is None or needed < best[0]:
+            best = (needed, timings)
+    return best
+
+
+def main():
+    if len(sys.argv) > 1:
+        txt = unicode(open(sys.argv[1]).read(), "utf-8")
+    else:
+        txt = u"".join(article % dict(i=i) for i in range(200))
+
+    separate, t1 = run(txt, False)
+    fused, t2 = run(txt, True)
+
+    print "%-52s %10s %10s" % ("pass", "separate", "fused")
+    for name in sorted(set(t1) | set(t2), key=lambda n: -t1.get(n, 0.0)):
+        print "%-52s %10.4f %10.4f" % (name, t1.get(name, 0.0), t2.get(name, 0.0))
+    print "%-52s %10.4f %10.4f" % ("parse_txt", separate, fused)
+
+
+if __name__ == "__main__":
+    main()
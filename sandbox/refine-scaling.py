@@ -0,0 +1,64 @@
+#! /usr/bin/env python
+"""
+check that refine.core.parse_txt scales linearly with the size of the
+article. parses synthetic articles of 1, 5 and 20 MB (or the sizes in MB
+given on the command line) without section headings, so that the passes
+see long lists of tokens, and prints the seconds per MB for each kind of
+article and the slowest passes.
+"""
+
+import sys
+import time
+
+from mwlib.refine import core
+
+kinds = dict(
+    text=u"""'''Bold''' and ''italic'' text with a [[Link|link]] and [http://example.com/%(i)d an url] http://example.org/%(i)d.
+* item <b>one</b>
+** nested item with [[File:Image%(i)d.jpg|thumb|left|caption]]
+# numbered
+; term : definition
+ preformatted text
+<div class="x">a <span>div</span></div> <small>small</small>
+
+""",
+    table=u"""|-
+| %(i)d || [[Place %(i)d]] || ''x'' || 1.%(i)d
+""",
+    list=u"""* item <b>%(i)d</b> [[x]]
+""")
+
+
+def generate(kind, size):
+    res = []
+    if kind == "table":
+        res.append(u'{| class="wikitable"\n! a !! b !! c !! d\n')
+    n = 0
+    i = 0
+    while n < size:
+        s = kinds[kind] % dict(i=i)
+        res.append(s)
+        n += len(s)
+        i += 1
+    if kind == "table":
+        res.append(u"|}\n")
+    return u"".join(res)
+
+
+def main():
+    sizes = [float(x) for x in sys.argv[1:]] or [1, 5, 20]
+    print "%-6s %6s %9s %9s  %s" % ("kind", "MB", "seconds", "s/MB", "slowest passes")
+    for kind in sorted(kinds):
+        for size in sizes:
+            txt = generate(kind, int(size * 1024 * 1024))
+            timings = {}
+            stime = time.time()
+            core.parse_txt(txt, timings=timings)
+            needed = time.time() - stime
+            slowest = sorted(timings.items(), key=lambda x: -x[1])[:3]
+            print "%-6s %6.1f %9.2f %9.2f  %s" % (kind, size, needed, needed / size,
+                                                 ", ".join("%s %.2f" % x for x in slowest))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#! /usr/bin/env python
+"""
+report the time needed by utoken.scan and utoken.tokenize and the size
+of the records returned by the scanner, compared with the list of
+(type, start, len) tuples it used to return. The wikitext is read from
+the file given on the command line or generated.
+"""
+
+import sys
+import time
+
+from mwlib import utoken
+
+article = u"""== Section %(i)d ==
+'''Bold''' and ''italic'' text with a [[Link|link]], [[Other]] and [http://example.com/%(i)d an url].
+* item <b>one</b> &amp; &#x20;
+# numbered
+ preformatted text
+{| class="wikitable"
+! header !! header
+|-
+| cell || cell [[in cell]]
+|}
+
+"""
+
+
+def measure(fun, txt, repeat=5):
+    best = None
+    for i in range(repeat):
+        stime = time.time()
+        fun(txt)
+        needed = time.time() - stime
+        if best is None or needed < best:
+            best = needed
+    return best
+
+
+def get_list_size(records):
+    """return the size of records as a list of tuples"""
+    size = sys.getsizeof(records)
+    for r in records:
+        size += sys.getsizeof(r)
+        for x in r:
+            if not -5 <= x <= 256:
+                size += sys.getsizeof(x)
+    return size
+
+
+def main():
+    if len(sys.argv) > 1:
+        txt = unicode(open(sys.argv[1]).read(), "utf-8")
+    else:
+        txt = u"".join(article % dict(i=i) for i in range(2000))
+
+    tokens = utoken.scan(txt)
+    records = list(utoken.iter_records(tokens))
+
+    print "text:       %d chars, %d records, %d tokens" % (len(txt), len(records), len(utoken.tokenize(txt)))
+    print "records:    %d bytes (array), %d bytes (list of tuples)" % (
+        sys.getsizeof(tokens), get_list_size(records))
+    print "scan:       %.4f s" % (measure(utoken.scan, txt),)
+    print "tokenize:   %.4f s" % (measure(utoken.tokenize, txt),)
+
+
+if __name__ == "__main__":
+    main()
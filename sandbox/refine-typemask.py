@@ -0,0 +1,55 @@
+"""
+compare the time needed by refine.core.parse_txt for table and reference
+heavy wikitext with the passes run separately, fused and fused with
+subtrees skipped by their token type masks. The wikitext is read from the
+file given on the command line or generated.
+"""
+
+import sys
+import time
+
+from mwlib.refine import core
+
+row = u"""|-
+| %(i)d || [[Place %(i)d]] || <ref name="r%(i)d">Source %(i)d, p. %(i)d</ref> || 1.%(i)d
+| style="text-align:right" | %(i)d<ref>note</ref>
+"""
+
+article = u"""== Table %(i)d ==
+Text<ref>reference %(i)d with [http://example.com/%(i)d an url]</ref> before the table.
+{| class="wikitable sortable"
+|+ caption %(i)d
+! No !! Place !! Source !! Value !! Count
+%(rows)s|}
+<references/>
+
+"""
+
+
+def run(txt, fused, skip_subtrees, repeat=5):
+    core.combined_parser.fused = fused
+    core.fused_parsers.skip_subtrees = skip_subtrees
+    best = None
+    for i in range(repeat):
+        stime = time.time()
+        core.parse_txt(txt)
+        needed = time.time() - stime
+        if best is None or needed < best:
+            best = needed
+    return best
+
+
+def main():
+    if len(sys.argv) > 1:
+        txt = unicode(open(sys.argv[1]).read(), "utf-8")
+    else:
+        rows = u"".join(row % dict(i=i) for i in range(20))
+        txt = u"".join(article % dict(i=i, rows=rows) for i in range(20))
+
+    print "separate:             %.4f" % run(txt, False, False)
+    print "fused:                %.4f" % run(txt, True, False)
+    print "fused, skip subtrees: %.4f" % run(txt, True, True)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+#! /usr/bin/env python
+"""
+measure time and peak memory needed to expand the citeweb and
+bigswitch templates and a synthetic infobox with deeply nested #if's
+and #switch'es. each workload runs in a separate process, so that the
+maximum resident set size can be reported per workload.
+"""
+
+import os
+import sys
+import time
+import resource
+import subprocess
+
+from mwlib import expander
+
+
+def load(fn, marker):
+    txt = open(os.path.join(os.path.dirname(__file__), fn)).read()
+    return unicode(txt.split(marker, 1)[1].split('"""', 1)[0], "utf-8")
+
+
+def infobox(depth=12, rows=40):
+    row = u"<tr><th>%(n)s</th><td>{{#if:{{{%(n)s|}}}|{{#switch:{{{%(n)s}}}|a=alpha|b=beta|#default={{{%(n)s}}} }}|-}}</td></tr>\n"
+    body = u"".join(row % dict(n="row%d" % i) for i in range(rows))
+    for i in range(depth):
+        body = u"{{#if:{{{show%d|1}}}|\n%s\n{{#ifeq:{{{x|}}}|%d|x|}}}}" % (i, body, i)
+    return u'<table class="infobox">\n' + body + u"\n</table>"
+
+
+def workloads():
+    args = u"|".join(u"row%d=%s" % (i, "ab"[i % 2]) for i in range(0, 40, 3))
+    return {
+        "citeweb": (dict(citeweb=load("citeweb.py", 'citeweb = u"""')),
+                    u"{{citeweb|url=http://example.com|title=Example|author=Someone|date=2004|accessdate=2007-06-19}}\n" * 500),
+        "bigswitch": (dict(einwohnerzahlen=load("bigswitch.py", 'einwohnerzahlen = u"""')),
+                      u"".join(u"{{einwohnerzahlen|%d}}\n" % (68384 + i) for i in range(50))),
+        "infobox": (dict(infobox=infobox()), (u"{{infobox|%s}}\n" % args) * 50),
+    }
+
+
+def run(name, repeat=5):
+    templates, txt = workloads()[name]
+    db = expander.DictDB(**templates)
+    best = None
+    for i in range(repeat):
+        stime = time.time()
+        res = expander.Expander(txt, pagename="test", wikidb=db).expandTemplates()
+        needed = time.time() - stime
+        if best is None or needed < best:
+            best = needed
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print "%-10s %8d chars %.3fs %6d KB maxrss" % (name, len(res), best, maxrss)
+
+
+def main():
+    if len(sys.argv) > 1:
+        for name in sys.argv[1:]:
+            run(name)
+        return
+
+    for name in sorted(workloads()):
+        sys.stdout.flush()
+        subprocess.call([sys.executable, __file__, name])
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,53 @@
+#! /usr/bin/env python
+"""
+expand a page with 200 calls of a template looking up the population
+of a commune in the bigswitch template, then the same page with one
+call changed, with and without the call cache
+(MWLIB_EXPANDER_CALL_CACHE).
+"""
+
+import os
+import shutil
+import tempfile
+import time
+
+from mwlib import expander
+from mwlib.templ import callcache
+
+
+def load(fn, marker):
+    txt = open(os.path.join(os.path.dirname(__file__), fn)).read()
+    return unicode(txt.split(marker, 1)[1].split('"""', 1)[0], "utf-8")
+
+
+commune = u"{{{1}}}: {{einwohner|{{{1}}} (Name)}}, {{einwohner|{{{1}}}}} ({{einwohner|{{{1}}} (Jahr)}})"
+page = u"".join(u"* {{commune|%d}}\n" % (64001 + i) for i in range(200))
+edited = page.replace(u"{{commune|64017}}", u"{{commune|64018}}")
+
+
+def run(db, txt):
+    stime = time.time()
+    res = expander.Expander(txt, pagename="test", wikidb=db).expandTemplates()
+    return res, time.time() - stime
+
+
+def main():
+    # the #default of the original template uses {{PAGENAME}}
+    einwohner = load("bigswitch.py", 'einwohnerzahlen = u"""').replace(u"{{PAGENAME}}", u"?")
+    db = expander.DictDB(commune=commune, einwohner=einwohner)
+    run(db, page)  # parse the templates
+    expected, t0 = run(db, edited)
+
+    tmpdir = tempfile.mkdtemp()
+    try:
+        os.environ["MWLIB_EXPANDER_CALL_CACHE"] = tmpdir
+        res, t1 = run(db, page)
+        res, t2 = run(db, edited)
+        assert res == expected
+        print "without cache: %.3fs  first render: %.3fs  after edit: %.3fs" % (t0, t1, t2)
+        print callcache.get_callcache()
+    finally:
+        shutil.rmtree(tmpdir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+#! /usr/bin/env python
+"""
+compute the template closure of the articles of nuwiki zip files
+(default: the speisesalz test fixture) and report the number of breadth
+first batches (round trips with unlimited batch size) against the number
+of templates.
+"""
+
+import os
+import sys
+import zipfile
+
+from mwlib import nuwiki, expander
+from mwlib.templ import deps
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    for fn in sys.argv[1:] or ["speisesalz-nuwiki.zip"]:
+        env = nuwiki.adapt(zipfile.ZipFile(os.path.join(here, "..", "tests", fn)))
+
+        def get_pages(names):
+            res = {}
+            for name in names:
+                page = env.nuwiki.get_page(name)
+                if page is not None:
+                    res[name] = page.rawtext
+            return res
+
+        for a in env.metabook.articles():
+            page = env.normalize_and_get_page(a.title, 0)
+            if page is None:
+                continue
+            batches = list(deps.get_closure([(a.title, page.rawtext)], get_pages, env.nshandler,
+                                            redirects=env.redirects))
+            print "%-20s %-30s %4d templates in %d batches" % (
+                fn, a.title[:30], sum(len(x) for x in batches), len(batches))
+
+if __name__ == "__main__":
+    main()
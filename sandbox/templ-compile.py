@@ -0,0 +1,71 @@
+#! /usr/bin/env python
+"""
+compare template expansion with and without compiled templates. runs
+the tests from tests/test_expander.py and the citeweb snippet.
+"""
+
+import os
+import sys
+import time
+import inspect
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "tests"))
+
+import test_expander
+from mwlib import expander
+from mwlib.templ import evaluate
+
+tests = []
+for name, fun in sorted(vars(test_expander).items()):
+    if name.startswith("test_") and inspect.isfunction(fun) and not inspect.getargspec(fun)[0]:
+        tests.append(fun)
+
+
+class devnull(object):
+    def write(self, s):
+        pass
+
+
+def run_tests():
+    stdout, stderr = sys.stdout, sys.stderr
+    sys.stdout = sys.stderr = devnull()
+    try:
+        _run_tests()
+    finally:
+        sys.stdout, sys.stderr = stdout, stderr
+
+
+def _run_tests():
+    for fun in tests:
+        try:
+            r = fun()
+            if inspect.isgenerator(r):
+                for x in r:
+                    x[0](*x[1:])
+        except Exception:
+            pass
+
+
+citeweb = open(os.path.join(os.path.dirname(__file__), "citeweb.py")).read()
+citeweb = unicode(citeweb.split('citeweb = u"""', 1)[1].split('"""', 1)[0], "utf-8")
+db = expander.DictDB(citeweb=citeweb)
+snippet = u"{{citeweb|url=http://example.com|title=Example|author=Someone|coauthors=Others|quote=abc}}\n"
+
+
+def run_citeweb():
+    expander.Expander(snippet * 500, pagename="test", wikidb=db).expandTemplates()
+
+
+def measure(fun, count):
+    stime = time.time()
+    for i in range(count):
+        fun()
+    return (time.time() - stime) / count
+
+for name, fun, count in [("test_expander", run_tests, 10), ("citeweb", run_citeweb, 10)]:
+    res = []
+    for flag in (False, True):
+        evaluate.Expander.compile_templates = flag
+        fun()  # warm up caches
+        res.append(measure(fun, count))
+    print "%-15s tree: %.4fs  compiled: %.4fs  speedup: %.2f" % (name, res[0], res[1], res[0] / res[1])
@@ -0,0 +1,60 @@
+#! /usr/bin/env python
+"""
+measure the time needed to expand the citeweb template and a template
+with literal conditions, with and without constant folding
+(templ.optimizer).
+"""
+
+import os
+import time
+
+from mwlib import expander
+from mwlib.templ import parser, cache
+
+
+def load(fn, marker):
+    txt = open(os.path.join(os.path.dirname(__file__), fn)).read()
+    return unicode(txt.split(marker, 1)[1].split('"""', 1)[0], "utf-8")
+
+
+# conditions, which only become literal after <includeonly> has been
+# resolved, as used by templates documenting themselves
+langbox = u"""{{#if:<includeonly>1</includeonly>|{{#switch:de
+| en = English
+| de = {{#ifeq:<includeonly>x</includeonly>|x|Deutsch ({{{1|}}})|doc}}
+| #default = ?
+}}|documentation}}
+{{#ifeq:<includeonly>a</includeonly>|a|[[Category:{{{1|}}}]]|}}"""
+
+workloads = [
+    ("citeweb", dict(citeweb=load("citeweb.py", 'citeweb = u"""')),
+     u"{{citeweb|url=http://example.com|title=Example|author=Someone|date=2004|accessdate=2007-06-19}}\n" * 200),
+    ("langbox", dict(langbox=langbox), u"{{langbox|x}}\n" * 1000),
+]
+
+
+def run(templates, txt, repeat=5):
+    db = expander.DictDB(**templates)
+    best = None
+    for i in range(repeat):
+        cache._cache = None
+        e = expander.Expander(txt, pagename="test", wikidb=db)
+        stime = time.time()
+        res = e.expandTemplates()
+        needed = time.time() - stime
+        if best is None or needed < best:
+            best = needed
+    return res, best
+
+
+def main():
+    for name, templates, txt in workloads:
+        parser.Parser.fold = False
+        res1, t1 = run(templates, txt)
+        parser.Parser.fold = True
+        res2, t2 = run(templates, txt)
+        assert res1 == res2
+        print "%-10s %.3fs -> %.3fs" % (name, t1, t2)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,38 @@
+#! /usr/bin/env python
+"""
+expand chains of nested #if's, whose branches start with list items,
+i.e. need an implicit newline. prints the time needed per kilobyte of
+output, which should not grow with the size of the output.
+"""
+
+import time
+from mwlib import expander
+
+# {{item}} is a chain of 20 nested #if's
+item = u"x"
+for i in range(20):
+    item = u"{{#if:1|\n* level %d {{{1|}}}%s}}" % (i, item)
+
+db = expander.DictDB(item=item)
+
+
+def measure(count, repeat=5):
+    txt = u"{{item|a}}\n" * count
+    best = None
+    for i in range(repeat):
+        e = expander.Expander(txt, pagename="test", wikidb=db)
+        stime = time.time()
+        res = e.expandTemplates()
+        needed = time.time() - stime
+        if best is None or needed < best:
+            best = needed
+    return best, len(res)
+
+
+def main():
+    for count in (10, 100, 1000, 5000):
+        needed, size = measure(count)
+        print "%5d calls %8d chars %.3fs %.3fms/KB" % (count, size, needed, needed * 1000 * 1024 / size)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+#! /usr/bin/env python
+"""
+compare the time needed to preprocess and tokenize the pages of the
+largest test fixtures and the citeweb and bigswitch templates with
+pp.preprocess, Uniquifier.replace_tags and the scanner run one after
+another and with the native preprocess_scan.
+"""
+
+import os
+import sys
+import time
+import zipfile
+
+from mwlib.templ import scanner, pp
+from mwlib.uniq import Uniquifier
+
+here = os.path.dirname(os.path.abspath(__file__))
+
+
+def load(fn, marker):
+    txt = open(os.path.join(here, fn)).read()
+    return unicode(txt.split(marker, 1)[1].split('"""', 1)[0], "utf-8")
+
+
+def load_pages(fn):
+    zf = zipfile.ZipFile(os.path.join(here, "..", "tests", fn))
+    res = []
+    for name in zf.namelist():
+        if os.path.basename(name).startswith("revisions-"):
+            d = unicode(zf.read(name), "utf-8")
+            res.extend(p.split("\n", 1)[1] for p in (" " + d).split(" --page-- ")[1:])
+    return res
+
+
+def separate(texts, included):
+    u = Uniquifier()
+    for txt in texts:
+        txt = u.replace_tags(pp.preprocess(txt, included=included))
+        if type(txt) is unicode:
+            scanner._expander.scan(txt)
+        else:
+            scanner._tokenize(txt)
+
+
+def fused(texts, included):
+    u = Uniquifier()
+    for txt in texts:
+        scanner.tokenize(txt, included=included, uniquifier=u)
+
+
+def measure(fun, texts, included, repeat=20):
+    best = None
+    for i in range(repeat):
+        stime = time.time()
+        fun(texts, included)
+        needed = time.time() - stime
+        if best is None or needed < best:
+            best = needed
+    return best
+
+
+def main():
+    if scanner._expander is None:
+        sys.exit("mwlib._expander not available")
+
+    workloads = [("speisesalz", load_pages("speisesalz-nuwiki.zip")),
+                 ("lambda", load_pages("lambda.zip")),
+                 ("citeweb", [load("citeweb.py", 'citeweb = u"""')]),
+                 ("bigswitch", [load("bigswitch.py", 'einwohnerzahlen = u"""')])]
+
+    for name, texts in workloads:
+        size = sum(len(x) for x in texts)
+        for included in (False, True):
+            t1 = measure(separate, texts, included)
+            t2 = measure(fused, texts, included)
+            print "%-10s included=%-5s %7d chars  separate: %6.2fms  fused: %6.2fms  (%.1fx)" % (
+                name, included, size, t1 * 1000, t2 * 1000, t1 / max(t2, 1e-9))
+
+if __name__ == "__main__":
+    main()
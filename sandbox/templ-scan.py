@@ -0,0 +1,49 @@
+#! /usr/bin/env python
+"""
+compare the throughput of the native template scanner (mwlib._expander)
+and the regular expression based one in MB/s. scans the citeweb and
+bigswitch templates and the wikitext given on the command line.
+"""
+
+import os
+import sys
+import time
+
+from mwlib.templ import scanner, pp
+
+
+def load(fn, marker):
+    txt = open(os.path.join(os.path.dirname(__file__), fn)).read()
+    return unicode(txt.split(marker, 1)[1].split('"""', 1)[0], "utf-8")
+
+
+def measure(fun, txt, repeat=20):
+    best = None
+    for i in range(repeat):
+        stime = time.time()
+        fun(txt)
+        needed = time.time() - stime
+        if best is None or needed < best:
+            best = needed
+    return len(txt.encode("utf-8")) / 1024.0 / 1024.0 / max(best, 1e-9)
+
+
+def main():
+    texts = [("citeweb", load("citeweb.py", 'citeweb = u"""')),
+             ("bigswitch", load("bigswitch.py", 'einwohnerzahlen = u"""'))]
+    for fn in sys.argv[1:]:
+        texts.append((fn, unicode(open(fn).read(), "utf-8")))
+
+    if scanner._expander is None:
+        print "mwlib._expander not available"
+
+    for name, txt in texts:
+        txt = pp.preprocess(txt * 20)
+        assert scanner._expander is None or scanner._expander.scan(txt) == scanner._tokenize(txt)
+        print "%-12s %8d chars  regex: %7.2f MB/s" % (name, len(txt), measure(scanner._tokenize, txt)),
+        if scanner._expander is not None:
+            print "  native: %7.2f MB/s" % (measure(scanner._expander.scan, txt),),
+        print
+
+if __name__ == "__main__":
+    main()
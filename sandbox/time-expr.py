@@ -1,15 +1,29 @@
 #! /usr/bin/env python
 
+# usage: time-expr.py <expr.txt
+
 import sys
 import time
-from mwlib import expr
+from mwlib import expr, lrucache
 
 e = []
 for x in sys.stdin:
     e.append(eval(x))
 
-print "have %s expressions" % len(e)
-stime = time.time()
-for x in e:
-    expr.expr(u"1+2")
-print "needed", time.time() - stime
+print "have %s expressions, %s distinct" % (len(e), len(set(e)))
+
+
+def uncached(s):
+    return expr.Expr().parse_expr(s)
+
+
+for name, fun in [("uncached", uncached), ("programs only", expr.evaluate), ("cached", expr.expr)]:
+    expr._programs = lrucache.mt_lrucache(2000)
+    expr._results = lrucache.mt_lrucache(20000)
+    stime = time.time()
+    for x in e:
+        try:
+            fun(x)
+        except Exception:
+            pass
+    print "%-14s %.3fs" % (name, time.time() - stime)
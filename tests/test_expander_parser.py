@@ -1,8 +1,9 @@
 #! /usr/bin/env py.test
 
+import pytest
 from mwlib.expander import parse
 from mwlib.siteinfo import get_siteinfo
-from mwlib.templ import nodes, magic_nodes
+from mwlib.templ import nodes, magic_nodes, parser
 
 nl_siteinfo = get_siteinfo("nl")
 
@@ -17,7 +18,12 @@ def test_one_empty_arguments():
     assert len(t[1]) == 1, "expected exactly one argument"
 
 
-def test_parse_if():
+@pytest.fixture
+def no_fold(monkeypatch):
+    monkeypatch.setattr(parser.Parser, "fold", False)
+
+
+def test_parse_if(no_fold):
     t = parse(u"{{#if: 1 | yes | no}}")
     print t
     assert isinstance(t, nodes.IfNode)
@@ -27,12 +33,25 @@ def test_parse_if():
     assert isinstance(t, nodes.IfNode)
 
 
-def test_parse_if_localized():
+def test_parse_if_localized(no_fold):
     t = parse(u"{{#als: 1 | yes | no}}", siteinfo=nl_siteinfo)
     print t
     assert isinstance(t, nodes.IfNode)
 
 
+def test_parse_if_folded():
+    t = parse(u"{{#if: 1 | yes | no}}")
+    assert t == nodes.IfBlockNode((u" yes ",))
+
+    t = parse(u"{{#if: 1 | yes | no}}", siteinfo=nl_siteinfo)
+    assert t == nodes.IfBlockNode((u" yes ",))
+
+
+def test_parse_if_localized_folded():
+    t = parse(u"{{#als: 1 | yes | no}}", siteinfo=nl_siteinfo)
+    assert t == nodes.IfBlockNode((u" yes ",))
+
+
 def test_parse_switch():
     t = parse(u"{{#switch: A | a=lower | UPPER}}")
     print t
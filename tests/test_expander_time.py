@@ -101,3 +101,25 @@ def test_dateutil_raises_typeerror():
 
 def test_time_minus_days():
     yield expandstr, "{{#time:Y-m-d| 20070827000000 -12 day}}", "2007-08-15"
+
+
+def test_cache():
+    from mwlib.templ import magic_time
+    st = magic_time.stats()
+    expandstr(u"{{#time:Y|12 March 1901}} {{#time:F|12 March 1901}} {{#time:Y|12 March 1901}}",
+              u"1901 March 1901")
+    st2 = magic_time.stats()
+    assert st2["hits"] - st["hits"] == 1
+    assert st2["misses"] - st["misses"] == 2
+    assert st2["parse_misses"] - st["parse_misses"] == 1
+    assert st2["parse_hits"] - st["parse_hits"] == 1
+
+
+def test_cache_relative():
+    import datetime
+    from mwlib.templ import magic_time
+    assert magic_time.getdate(u"1 May 2001", 1000)[1] is False
+    assert magic_time.getdate(u"+1 day", 1000) == (datetime.datetime(1970, 1, 2, 0, 16, 40), True)
+    assert magic_time.getdate(u"+1 day", 2000) == (datetime.datetime(1970, 1, 2, 0, 33, 20), True)
+    assert magic_time.getdate(u"2008", 1000)[1] is True
+    assert magic_time.getdate(u"garbage 99", 1000) == (None, False)
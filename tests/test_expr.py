@@ -163,3 +163,25 @@ def test_braindamaged_scientific():
     yield expandstr, "{{#expr:1e2e3}}", "100000"
     yield ee, "{{#expr:2*e}}", 2 * math.e
     yield ee, "{{#expr: e E E}}", 1420.9418661882
+
+
+def test_program_shared_by_shape():
+    assert expr.evaluate(u"1+2*3") == 7
+    program = expr._programs[expr.shape(u"1+2*3")[0]]
+    assert expr.evaluate(u" 4 + 5 * 0.5") == 6.5
+    assert expr._programs[expr.shape(u"4+5*6")[0]] is program
+
+
+def test_compiled_errors():
+    for s in [u"1 2", u"(1", u"1)", u"1 foo 2", u"1/0", u"1+", u"*"]:
+        try:
+            expr.Expr().parse_expr(s)
+        except Exception, err:
+            first = (type(err), str(err))
+        for i in range(2):
+            try:
+                expr.expr(s)
+            except Exception, err:
+                assert (type(err), str(err)) == first
+            else:
+                assert 0, "expected error"
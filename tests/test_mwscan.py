@@ -3,6 +3,10 @@
 from mwlib import utoken as mwscan
 
 
+def scan_records(text):
+    return list(mwscan.iter_records(mwscan.scan(text)))
+
+
 def test_resolve_symbolic_entity():
     assert mwscan.resolve_entity(u"&amp;") == u"&", "bad result"
 
@@ -21,14 +25,14 @@ def test_resolve_entity_out_of_range():
 
 
 def test_url():
-    s = mwscan.scan(
+    s = scan_records(
         "http://tools.wikimedia.de/~magnus/geo/geohack.php?language=de&params=50_0_0_N_8_16_16_E_type:city(190934)_region:DE-RP")
     print s
     assert len(s) == 1, "expected one url"
 
 
 def _check_table_markup(s):
-    toks = [t[0] for t in mwscan.scan(s)]
+    toks = [t[0] for t in scan_records(s)]
     print "TOKENS:", toks
     assert mwscan.token.t_begin_table not in toks, "should not contain table markup"
     assert mwscan.token.t_end_table not in toks, "should not contain table markup"
@@ -48,3 +52,18 @@ def test_table_bol_end_code():
 
 def test_table_bol_end():
     _check_table_markup("foo |} bar")
+
+
+def test_scan_records():
+    text = u"a [[b]]"
+    tokens = mwscan.scan(text)
+    assert tokens.typecode == "i"
+    records = list(mwscan.iter_records(tokens))
+    assert [text[start:start + len] for type, start, len in records] == [u"a ", u"[[", u"b", u"]]"]
+    assert records[1][0] == mwscan.token.t_2box_open
+
+
+def test_scan_stops_at_nul():
+    assert len(mwscan.scan(u"")) == 0
+    assert scan_records(u"a\0b") == [(mwscan.token.t_text, 0, 1)]
+
@@ -7,6 +7,8 @@ import subprocess
 import tempfile
 import zipfile
 
+from mwlib import myjson as json, siteinfo
+from mwlib.expander import expandstr
 from mwlib.nuwiki import adapt
 
 
@@ -35,3 +37,40 @@ class Test_nuwiki_xnet(object):
         assert self.nuwiki.siteinfo['general']['lang'] == 'de'
         assert self.nuwiki.nshandler is not None
         assert self.nuwiki.nfo['base_url'] == 'http://de.wikipedia.org/w/'
+
+
+def make_nuwiki(tmpdir, existing=None):
+    tmpdir.join("siteinfo.json").write(json.dumps(siteinfo.get_siteinfo("en")))
+    tmpdir.join("revisions-1.txt").write('\n\f --page-- {"title": "Foo", "ns": 0}\nfoo')
+    tmpdir.join("redirects.json").write(json.dumps({"Bar": "Foo"}))
+    tmpdir.join("nfo.json").write(json.dumps({"base_url": "http://en.wikipedia.org/w/",
+                                              "script_extension": ".php"}))
+    if existing is not None:
+        tmpdir.join("existing.txt").write("\n".join(existing))
+    return adapt(str(tmpdir))
+
+
+def test_page_exists_without_index(tmpdir):
+    db = make_nuwiki(tmpdir)
+    assert db.existing is None
+    assert db.page_exists(u"Foo")
+    assert db.page_exists(u"Bar")
+    assert not db.page_exists(u"Baz")
+
+
+def test_page_exists(tmpdir):
+    db = make_nuwiki(tmpdir, [u"Bar", u"Baz", u"Foo"])
+    assert db.page_exists(u"Baz")
+    assert not db.page_exists(u"Qux")
+    expandstr(u"{{#ifexist:baz|yes|no}} {{#ifexist:Qux|yes|no}}", u"yes no", wikidb=db)
+
+
+def test_fsoutput_existing(tmpdir):
+    from mwlib.net.fetch import fsoutput
+    out = fsoutput(str(tmpdir.join("out")))
+    out.write_pages({"pages": {"1": {"title": u"Foo", "ns": 0, "revisions": [{"revid": 1, "*": u"x"}]},
+                               "2": {"title": u"Baz", "ns": 0},
+                               "-1": {"title": u"Missing", "ns": 0, "missing": ""}}})
+    out.write_redirects({u"Bar": u"Foo"})
+    out.close()
+    assert tmpdir.join("out", "existing.txt").read() == "Bar\nBaz\nFoo"
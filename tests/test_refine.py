@@ -656,3 +656,111 @@ def test_newline_in_link_text():
     core.show(r)
     links = core.walknodel(r, lambda x: x.type == T.t_complex_link)
     assert links, "no links found"
+
+
+def show_str(tokens):
+    from StringIO import StringIO
+    out = StringIO()
+    show(tokens, out=out)
+    return out.getvalue()
+
+
+@pytest.mark.parametrize("txt", [
+    u"== a ==\n* [[x|y]] ''z'' [http://example.com e]\n pre\n<div>d</div>",
+    u"{|\n|a||b\nx\n|-\n|<ref>r\n* l</ref>\n|}\n\n{|\n{|\n|}\n|}",
+    u"<table><tr>y<td>c</td></tr></table> |>]]",
+    u"<ref><inputbox>y</inputbox></ref> [[File:x.jpg|thumb|[http://x.org u]|caption]]",
+    u"; t : d\n:: e\n# <b>x\n# y</b>\n\n'''b'' i'''",
+])
+def test_fused_parsers(txt, monkeypatch):
+    monkeypatch.setattr(core.combined_parser, "fused", False)
+    expected = show_str(core.parse_txt(txt))
+    monkeypatch.setattr(core.combined_parser, "fused", True)
+    assert show_str(core.parse_txt(txt)) == expected
+
+
+def test_fused_parsers_triggers(monkeypatch):
+    monkeypatch.setattr(core.combined_parser, "fused", True)
+    calls = []
+
+    def wrap(tokens, xopts):
+        if tokens and tokens[0].type == T.t_text:
+            tokens[:] = [T(type=T.t_complex_node, children=tokens[:])]
+
+    wrap.triggers = set([T.t_text])
+    wrap.produces = set([T.t_complex_node])
+
+    def record(tokens, xopts):
+        calls.append([x.type for x in tokens])
+
+    record.triggers = set([T.t_text, T.t_complex_node])
+    record.produces = set()
+    record.restructures = False
+
+    tokens = [T(type=T.t_text, text=u"a"), T(type=T.t_special, text=u"|")]
+    core.combined_parser([record, wrap, record])(tokens, core.XBunch())
+    assert calls == [[T.t_text, T.t_special], [T.t_complex_node],
+                     [T.t_text, T.t_special]]
+
+
+def test_fused_parsers_skip_subtrees(monkeypatch):
+    monkeypatch.setattr(core.combined_parser, "fused", True)
+    visited = []
+    process = core.fused_parsers.process
+
+    def record_process(self, tokens, owner, entry):
+        visited.append([x.type for x in tokens])
+        process(self, tokens, owner, entry)
+
+    monkeypatch.setattr(core.fused_parsers, "process", record_process)
+    calls = []
+
+    def record(tokens, xopts):
+        calls.append([x.type for x in tokens])
+
+    record.triggers = set([T.t_text])
+    record.produces = set()
+    record.restructures = False
+
+    tokens = [T(type=T.t_text, text=u"a"),
+              T(type=T.t_complex_node, children=[T(type=T.t_special, text=u"|")]),
+              T(type=T.t_complex_node, children=[
+                  T(type=T.t_complex_node, children=[T(type=T.t_text, text=u"b")])])]
+    core.combined_parser([record, record])(tokens, core.XBunch())
+    top = [T.t_text, T.t_complex_node, T.t_complex_node]
+    assert calls == [top, top, [T.t_text], [T.t_text]]
+    # the list with the t_special token is never visited
+    assert visited == [top, [T.t_complex_node], [T.t_text]]
+
+
+def test_get_type_mask():
+    assert core.get_type_mask([]) == 0
+    mask = core.get_type_mask([T.t_text, T.t_complex_table])
+    assert mask & core.get_type_mask([T.t_complex_table])
+    assert not mask & core.get_type_mask([T.t_complex_node, T.t_special])
+    assert core.get_type_mask(["not a token type"]) & ~mask
+
+
+def test_timings(monkeypatch):
+    monkeypatch.setattr(core.combined_parser, "fused", True)
+    timings = {}
+    core.parse_txt(u"[[a]] [http://b c]\n{|\n|d\n|}", timings=timings)
+    assert timings["parse_links"] > 0
+    assert timings["parse_tables"] > 0
+    assert "traversal" in timings
+
+
+def test_token_slots():
+    t = T(type=T.t_text, start=0, len=3, source=u"abc")
+    assert t.text == u"abc"
+    assert t.children is None and t.tagname is None and not t.blocknode
+
+    t.is_header = True
+    assert t.__dict__ == dict(is_header=True)
+    assert T(type=T.t_complex_link, target=u"a").target == u"a"
+
+    from mwlib.parser import nodes as N
+    n = N.Node()
+    assert n.children == [] and n.tagname is None
+    with pytest.raises(AttributeError):
+        n.no_such_attribute
@@ -0,0 +1,57 @@
+#! /usr/bin/env py.test
+
+import copy
+
+from mwlib import sitecontext, siteinfo, nshandling
+from mwlib.expander import Expander, DictDB
+from mwlib.templ import parser
+from mwlib.refine import core
+
+
+def test_shared_by_identity():
+    si = siteinfo.get_siteinfo("de")
+    ctx = sitecontext.get_context(si)
+    assert sitecontext.get_context(si) is ctx
+    assert ctx.fingerprint == sitecontext.fingerprint(si)
+
+
+def test_shared_by_fingerprint():
+    si = siteinfo.get_siteinfo("de")
+    assert sitecontext.get_context(copy.deepcopy(si)) is sitecontext.get_context(si)
+
+
+def test_different_siteinfo():
+    assert sitecontext.get_context(siteinfo.get_siteinfo("de")) is not sitecontext.get_context(siteinfo.get_siteinfo("en"))
+
+
+def test_expander_and_parser_share_context():
+    e1 = Expander(u"{{#if:1|a}}", wikidb=DictDB())
+    e2 = Expander(u"{{#if:|b|a}}", wikidb=DictDB())
+    assert e1.context is e2.context
+    assert e1.nshandler is e2.nshandler
+    assert e1.aliasmap is e2.aliasmap
+
+    p = parser.Parser(u"", siteinfo=e1.siteinfo)
+    assert p.name2rx is e1.context.name2rx
+    assert p.aliasmap is e1.context.aliasmap
+    assert e2.expandTemplates() == u"a"
+
+
+def test_nshandler_for_lang():
+    assert nshandling.get_nshandler_for_lang("en") is nshandling.get_nshandler_for_lang("en")
+
+
+def test_imagemod():
+    si = siteinfo.get_siteinfo("de")
+    imagemod = sitecontext.get_context(si).imagemod
+    assert imagemod is sitecontext.get_imagemod(si["magicwords"])
+    assert imagemod.parse(u"miniatur") == ("img_thumbnail", u"miniatur")
+    assert imagemod.parse(u"120px") == ("img_width", u"120")
+    assert imagemod.parse(u"foo") == (None, None)
+    assert sitecontext.get_imagemod() is sitecontext.get_imagemod(None)
+
+
+def test_parse_txt_imagemod():
+    xopts = core.XBunch(magicwords=None)
+    core.parse_txt(u"[[Image:x.jpg|thumb]]", xopts)
+    assert xopts.imagemod is sitecontext.get_imagemod()
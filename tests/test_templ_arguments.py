@@ -0,0 +1,44 @@
+#! /usr/bin/env py.test
+
+import pytest
+from mwlib.expander import expandstr, DictDB, Expander
+from mwlib.templ import evaluate, parser
+
+
+@pytest.fixture(autouse=True)
+def debug(monkeypatch):
+    monkeypatch.setattr(evaluate, "DEBUG", True)
+
+
+def get_arguments(txt, **templates):
+    e = Expander(u"", wikidb=DictDB(**templates))
+    return evaluate.ArgumentList(args=parser.parse(txt)[1], expander=e,
+                                 variables=evaluate.ArgumentList(expander=e))
+
+
+def test_positional_expanded_once():
+    args = get_arguments(u"{{x| {{t}} | b }}", t=u"a")
+    assert args[0] == u"a"
+    assert args[0] == u"a"
+    assert args[1] == u"b"
+    assert args.stats == dict(lookups=3, hits=1, expanded=1)
+
+
+def test_named_expanded_once():
+    args = get_arguments(u"{{x|{{t}}= {{t}}b | c = d |e}}", t=u"a")
+    assert args.get(u"a", None) == u"ab"
+    assert args.get(u"a", None) == u"ab"
+    assert args.get(u"c", None) == u"d"
+    assert args.get(u"1", None) == u"e"
+    assert args.get(u"2", None) is None
+    assert args.stats == dict(lookups=5, hits=2, expanded=2)
+
+
+def test_memory_limit():
+    args = get_arguments(u"{{x|{{t}}}}", t=u"a" * (256 * 1024 + 1))
+    pytest.raises(evaluate.MemoryLimitError, args.get, 0, None)
+
+
+def test_repeated_arguments():
+    db = DictDB(t=u"{{{1}}}{{{1}}}{{#if:{{{a|}}}|{{{a}}}{{{a}}}}}", u=u"<{{{1}}}>")
+    expandstr(u"{{t|{{u|x}}|a=  {{u|y}} }}", u"<x><x><y><y>", wikidb=db)
@@ -0,0 +1,165 @@
+#! /usr/bin/env py.test
+
+import pytest
+from mwlib.expander import DictDB
+from mwlib.templ import evaluate, budget
+
+
+@pytest.fixture(params=["recursive", "compiled"])
+def evaluator(request, monkeypatch):
+    monkeypatch.setattr(evaluate.Expander, "compile_templates", request.param == "compiled")
+    return request.param
+
+
+def expand(txt, db, **limits):
+    e = evaluate.Expander(txt, pagename="test", wikidb=db, budget=budget.Budget(**limits))
+    return e.expandTemplates(), e.budget
+
+
+def unlimited(**kw):
+    limits = dict(max_nodes=0, max_output=0, max_seconds=0, max_templates=0)
+    limits.update(kw)
+    return limits
+
+
+# each call of {{a}} calls {{b}} 10 times
+db = DictDB(a=u"{{b|{{{1}}}}}" * 10,
+            b=u"{{#if:{{{1}}}|[{{{1}}}]}}")
+
+
+def test_no_limits(evaluator):
+    res, b = expand(u"{{a|x}}" * 100, db, **unlimited())
+    assert res == u"[x]" * 1000
+    assert b.exceeded is None
+    assert b.templates == 1100
+    assert b.nodes > 1100
+
+
+def test_no_limits_checked_once(evaluator, monkeypatch):
+    checks = []
+    check = budget.Budget.check
+    monkeypatch.setattr(budget.Budget, "check", lambda self, e: checks.append(1) or check(self, e))
+
+    res, b = expand(u"{{a|x}}" * 100, db, **unlimited(max_templates=2000))
+    assert res == u"[x]" * 1000
+    assert len(checks) == 1
+    assert b.nodes > 1100
+
+    res, b = expand(u"{{a|x}}" * 100, db, **unlimited(max_output=5000))
+    assert len(checks) > 4
+
+
+def test_max_templates(evaluator):
+    res, b = expand(u"{{a|x}}" * 100, db, **unlimited(max_templates=550))
+    assert u"[x]" * 450 in res
+    assert len(res) < 3 * 1000
+    assert "template calls" in b.exceeded
+
+
+def test_max_nodes(evaluator):
+    res, b = expand(u"{{a|x}}" * 100, db, **unlimited(max_nodes=1000))
+    assert res.startswith(u"[x]")
+    assert len(res) < 3 * 1000
+    assert "node evaluations" in b.exceeded
+    assert b.nodes == 1001
+
+
+def test_max_output(evaluator):
+    res, b = expand(u"{{a|xxxxxxxxxx}}" * 1000, db, **unlimited(max_output=10000))
+    assert res.startswith(u"[xxxxxxxxxx]")
+    assert 10000 < len(res) < 20000
+    assert "characters of output" in b.exceeded
+
+
+class Clock(object):
+    def __init__(self, step=0):
+        self.now = 1000.0
+        self.step = step
+
+    def time(self):
+        self.now += self.step
+        return self.now
+
+
+def test_max_seconds(evaluator, monkeypatch):
+    monkeypatch.setattr(budget, "time", Clock(step=1))
+    res, b = expand(u"{{a|x}}" * 100, db, **unlimited(max_seconds=0.5))
+    assert res == u""
+    assert "seconds" in b.exceeded
+
+
+def test_exceeded_stays_exceeded(evaluator):
+    e = evaluate.Expander(u"{{a|x}}", pagename="test", wikidb=db,
+                          budget=budget.Budget(**unlimited(max_templates=5)))
+    assert e.expandTemplates() == u"[x]" * 4
+    assert e.parseAndExpand(u"a{{b|y}}") == u""
+
+
+def test_unlimited_by_default(monkeypatch):
+    monkeypatch.setattr(budget, "_limits", {})
+    b = budget.Budget()
+    assert (b.max_nodes, b.max_output, b.max_seconds, b.max_templates) == (0, 0, 0, 0)
+
+
+def test_clock_starts_with_expansion(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(budget, "time", clock)
+    e = evaluate.Expander(u"{{a|x}}", pagename="test", wikidb=db,
+                          budget=budget.Budget(**unlimited(max_seconds=10)))
+    clock.now += 60
+    assert e.expandTemplates() == u"[x]" * 10
+    clock.now += 60
+    assert e.parseAndExpand(u"{{b|y}}") == u""
+    assert "seconds" in e.budget.exceeded
+
+
+def test_not_caught_by_parser_functions(evaluator):
+    # the argument is expanded inside the error handlers of #expr and #ifexpr
+    for txt in (u"x{{#expr|{{a|1}}}}y", u"x{{#ifexpr|{{a|1}}|t|f}}y"):
+        res, b = expand(txt, db, **unlimited(max_templates=5))
+        assert res == u"x"
+        assert "template calls" in b.exceeded
+
+
+def test_shared_budget(evaluator):
+    b = budget.Budget(**unlimited(max_templates=15))
+    e = evaluate.Expander(u"{{a|x}}", pagename="test", wikidb=db, budget=b)
+    assert e.expandTemplates() == u"[x]" * 10
+    nodes = b.nodes
+    sub = evaluate.Expander(u"{{a|y}}", pagename="test", wikidb=db, budget=b)
+    assert sub.expandTemplates() == u"[y]" * 3
+    assert b.templates == 16
+    assert nodes < b.nodes < 2 * nodes
+
+
+def test_shared_output_size():
+    b = budget.Budget(**unlimited(max_output=25))
+    assert evaluate.Expander(u"{{a|x}}", pagename="test", wikidb=db, budget=b).expandTemplates() == u"[x]" * 10
+    res = evaluate.Expander(u"{{a|x}}", pagename="test", wikidb=db, budget=b).expandTemplates()
+    assert res == u""
+    assert "characters of output" in b.exceeded
+
+
+def test_set_limits(monkeypatch):
+    monkeypatch.setattr(budget, "_limits", {})
+    monkeypatch.setenv("MWLIB_EXPANDER_MAX_NODES", "1234")
+    assert budget.Budget().max_nodes == 1234
+    budget.set_limits(max_nodes="99", max_seconds="2.5")
+    b = budget.Budget()
+    assert b.max_nodes == 99
+    assert b.max_seconds == 2.5
+    with pytest.raises(ValueError):
+        budget.set_limits(max_foo=1)
+
+
+def test_variables_counted_alike(monkeypatch):
+    # variables with a literal name are counted like any other node
+    vdb = DictDB(v=u"{{{1}}}{{{a|{{{1}}}}}}{{{ 2 |d}}}{{{b}}}",
+                 w=u"{{v|{{{1}}}|a=[{{{1}}}]}}")
+    txt = u"{{w|x}}" * 3 + u"{{v|y}}"
+    results = {}
+    for mode in ("recursive", "compiled"):
+        monkeypatch.setattr(evaluate.Expander, "compile_templates", mode == "compiled")
+        results[mode] = [expand(txt, vdb, **unlimited(max_nodes=n))[0] for n in range(1, 40)]
+    assert results["compiled"] == results["recursive"]
+    assert results["recursive"][-1] == u"x[x]d{{{b}}}" * 3 + u"yyd{{{b}}}"
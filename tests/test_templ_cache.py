@@ -0,0 +1,49 @@
+#! /usr/bin/env py.test
+
+import cPickle
+from mwlib.expander import expandstr, DictDB
+from mwlib.templ import cache, marks
+from mwlib.uniq import Uniquifier
+
+
+def test_eqmark_pickle():
+    e = cPickle.loads(cPickle.dumps((u"a", marks.eqmark), 2))
+    assert e[1] is marks.eqmark
+
+
+def test_hits_and_misses():
+    c = cache.TemplateCache()
+    u = Uniquifier()
+    p1 = c.parse(u"{{#if:{{{1}}}|a|b}}", u)
+    p2 = c.parse(u"{{#if:{{{1}}}|a|b}}", u)
+    assert p1 == p2
+    assert c.stats() == dict(hits=1, disk_hits=0, misses=1)
+
+
+def test_disk_tier(tmpdir):
+    raw = u"{{{1}}}<ref>{{{2}}}</ref>x=y"
+    c1 = cache.TemplateCache(path=tmpdir.strpath)
+    p1 = c1.parse(raw, Uniquifier())
+
+    c2 = cache.TemplateCache(path=tmpdir.strpath)
+    u = Uniquifier()
+    p2 = c2.parse(raw, u)
+    assert c2.stats() == dict(hits=0, disk_hits=1, misses=0)
+    assert repr(p1) == repr(p2)
+    assert len(u.uniq2repl) == 1
+
+
+def test_uniq_markers_rebound():
+    db = DictDB(t=u"a<nowiki>{{{1}}}</nowiki>b")
+    for i in range(2):
+        expandstr(u"{{t}}<nowiki>x</nowiki>{{t}}", u"a{{{1}}}bxa{{{1}}}b", wikidb=db)
+
+
+def test_shared_between_uniquifiers():
+    c = cache.TemplateCache()
+    raw = u"<nowiki>a</nowiki>{{{1}}}"
+    u1, u2 = Uniquifier(), Uniquifier()
+    p1 = c.parse(raw, u1)
+    p2 = c.parse(raw, u2)
+    assert p1 is p2
+    assert u1.uniq2repl == u2.uniq2repl
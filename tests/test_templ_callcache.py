@@ -0,0 +1,85 @@
+#! /usr/bin/env py.test
+
+import pytest
+from mwlib.expander import DictDB
+from mwlib.templ import evaluate, callcache, profiler
+
+
+@pytest.fixture
+def cache(tmpdir, monkeypatch):
+    monkeypatch.setenv("MWLIB_EXPANDER_CALL_CACHE", str(tmpdir))
+    monkeypatch.setattr(callcache, "_cache", None)
+    return callcache.get_callcache
+
+
+def expand(txt, db, pagename="test"):
+    return evaluate.Expander(txt, pagename=pagename, wikidb=db).expandTemplates()
+
+
+def test_unchanged_calls_are_reused(cache):
+    db = DictDB(a=u"[{{{1}}}{{b}}]", b=u"b")
+    assert expand(u"{{a|1}} {{a|2}}", db) == u"[1b] [2b]"
+    assert cache().stats()["misses"] == 2
+
+    assert expand(u"{{a|1}} {{a|3}}", DictDB(a=u"[{{{1}}}{{b}}]", b=u"b")) == u"[1b] [3b]"
+    assert cache().stats()["hits"] == 1
+    assert cache().stats()["misses"] == 3
+
+
+def test_changed_templates(cache):
+    assert expand(u"{{a}}", DictDB(a=u"{{b}}", b=u"b")) == u"b"
+    assert expand(u"{{a}}", DictDB(a=u"{{b}}", b=u"B")) == u"B"
+    assert expand(u"{{a}}", DictDB(a=u"{{b}}")) == u""
+    assert expand(u"{{a}}", DictDB(a=u"{{b}}", b=u"b")) == u"b"
+    assert cache().stats()["hits"] == 0
+    assert expand(u"{{a}}", DictDB(a=u"{{b}}", b=u"b")) == u"b"
+    assert cache().stats()["hits"] == 1
+
+
+def test_persistent(cache, monkeypatch):
+    db = DictDB(a=u"a<nowiki>{{b}}</nowiki>")
+    assert expand(u"{{a}}", db) == u"a{{b}}"
+    monkeypatch.setattr(callcache, "_cache", None)
+    assert expand(u"{{a}}", DictDB(a=u"a<nowiki>{{b}}</nowiki>")) == u"a{{b}}"
+    assert cache().stats()["hits"] == 1
+
+
+def test_impure_calls(cache):
+    db = DictDB(p=u"{{PAGENAME}}", q=u"x{{p}}")
+    assert expand(u"{{q}}", db, pagename="One") == u"xOne"
+    assert expand(u"{{q}}", db, pagename="Two") == u"xTwo"
+    assert cache().stats()["uncacheable"] == 2
+
+
+def test_recursion_limit(cache):
+    # the top-level sequence is truncated like in evaluate.flatten
+    def expand_limited(txt, limit, use_cache):
+        db = DictDB(a=u"[{{b}}]", b=u"<{{c}}>", c=u"c")
+        e = evaluate.Expander(txt, pagename="test", wikidb=db, recursion_limit=limit)
+        if not use_cache:
+            e.callcache = None
+        return e.expandTemplates()
+
+    for limit in range(6):
+        for txt in [u"x {{a}} y", u"x {{#if:1|{{a}}}} y", u"x [[{{a}}]] y"]:
+            assert expand_limited(txt, limit, True) == expand_limited(txt, limit, False)
+    assert cache().stats()["misses"] > 0
+
+
+def test_implicit_newlines(cache):
+    db = DictDB(a=u"* x")
+    for txt in [u"{{a}}", u"a {{a}}", u"a\n{{a}}", u"a {{a}}{{a}}", u"{{a}}\n{{a}}"]:
+        expected = expand(txt, DictDB(a=u"* x"))
+        assert expand(txt, db) == expected
+    assert cache().stats()["hits"] > 0
+
+
+def test_profiler_report(cache, monkeypatch):
+    p = profiler.Profiler()
+    monkeypatch.setattr(profiler, "_profiler", p)
+    db = DictDB(a=u"a")
+    expand(u"{{a}}{{PAGENAME}}", db)
+    # a call at the same depth, a lone {{a}} is one level less deep
+    expand(u"{{a}}b", db)
+    assert p.report()["call_cache"]["hits"] == 1
+    assert p.report()["call_cache"]["uncacheable"] == 1
@@ -0,0 +1,44 @@
+#! /usr/bin/env py.test
+
+# run the expander tests again with compiled templates
+from test_expander import *
+
+import pytest
+from mwlib.expander import expandstr, DictDB
+from mwlib.templ import compiler, parser, evaluate
+
+
+@pytest.fixture(autouse=True)
+def compile_templates(monkeypatch):
+    monkeypatch.setattr(evaluate.Expander, "compile_templates", True)
+
+
+def test_compiled_is_cached():
+    p = parser.parse(u"{{{1}}}{{#if:{{{2|}}}|a|b}}")
+    assert compiler.get_compiled(p) is compiler.get_compiled(p)
+
+
+def test_profiling_decided_when_compiling():
+    p = parser.parse(u"{{#if:{{{1|}}}|a|b}}")
+    assert compiler.get_compiled(p) is not compiler.get_compiled(p, True)
+    assert compiler.compile_node(p).__name__ == "f"
+    assert compiler.compile_node(p, True).__name__ == "profiled"
+
+
+def test_recursion_limit():
+    db = DictDB(a=u"x{{a}}")
+    res = expandstr(u"{{a}}", wikidb=db)
+    assert res == u""
+
+
+def test_switch_computed_keys():
+    db = DictDB(t=u"{{#switch:{{{1}}}|{{{2}}}=two|1.0=num|#default=def}}")
+    expandstr(u"{{t|b|b}}", u"two", wikidb=db)
+    expandstr(u"{{t|1|b}}", u"num", wikidb=db)
+    expandstr(u"{{t|c|b}}", u"def", wikidb=db)
+
+
+def test_variable_default():
+    db = DictDB(t=u"{{{1|{{{a|}}}x}}}{{{ b }}}{{{{{{c}}}}}}")
+    expandstr(u"{{t|b=1|c=b}}", u"x11", wikidb=db)
+    expandstr(u"{{t}}", u"x{{{b}}}{{{{{{c}}}}}}", wikidb=db)
@@ -0,0 +1,86 @@
+#! /usr/bin/env py.test
+
+from mwlib import nshandling, siteinfo
+from mwlib.expander import DictDB
+from mwlib.templ import deps, parser, cache
+
+
+def get_deps(raw, title=u"Test"):
+    return deps.get_dependencies(parser.parse(raw), title)
+
+
+def test_get_dependencies():
+    assert get_deps(u"{{foo| {{ bar }} }}{{foo{{{1}}}}}{{{ {{baz}} }}}") == [
+        (u"foo", 10), (u"bar", 10), (u"baz", 10)]
+    assert get_deps(u"{{/sub}}{{:Main}}{{Template:X}}") == [
+        (u"Test/sub", 0), (u":Main", 10), (u"Template:X", 10)]
+    assert get_deps(u"<ref>{{cite}}</ref>") == [(u"cite", 10)]
+
+
+def test_magic_words_are_no_dependencies():
+    assert get_deps(u"{{PAGENAME}}{{lc:{{x}}}}{{#if:{{{1|}}}|{{y}}}}{{DEFAULTSORT:z}}{{#expr:1}}") == [
+        (u"x", 10), (u"y", 10)]
+
+
+def test_invoke():
+    assert get_deps(u"{{#invoke:Citation|cite}}") == [(u"Citation", 828)]
+
+
+def make_closure(pages, redirects=None):
+    si = siteinfo.get_siteinfo("en")
+    nshandler = nshandling.nshandler(si)
+    batches = []
+
+    def get_pages(names):
+        batches.append(sorted(names))
+        return dict((n, pages[n]) for n in names if n in pages)
+
+    roots = [(u"Article", pages.pop(u"Article"))]
+    res = list(deps.get_closure(roots, get_pages, nshandler, redirects=redirects))
+    assert res == batches
+    return batches
+
+
+def test_breadth_first_batches():
+    batches = make_closure({u"Article": u"{{a}}{{b}}{{missing}}",
+                            u"Template:A": u"{{c}}{{b}}",
+                            u"Template:B": u"{{c}}",
+                            u"Template:C": u"{{a}}{{d}}",
+                            u"Template:D": u"d"})
+    assert batches == [[u"Template:A", u"Template:B", u"Template:Missing"],
+                       [u"Template:C"],
+                       [u"Template:D"]]
+
+
+def test_redirects():
+    batches = make_closure({u"Article": u"{{r}}{{s}}",
+                            u"Template:R": u"#REDIRECT [[Template:T]]",
+                            u"Template:T": u"{{u}}",
+                            u"Template:U": u"u"},
+                           redirects={u"Template:S": u"Template:U"})
+    assert batches == [[u"Template:R", u"Template:U"],
+                       [u"Template:T"]]
+
+
+def test_modules():
+    si = siteinfo.get_siteinfo("en")
+    c = deps.Closure(nshandling.nshandler(si))
+    assert c.has_modules == ("828" in si["namespaces"])
+    todo = c.add_page(u"Article", u"{{#invoke:M|f}}{{t}}")
+    if c.has_modules:
+        assert todo == [u"Module:M", u"Template:T"]
+        assert c.add_pages({u"Module:M": u"return {{x}}"}) == []
+    else:
+        assert todo == [u"Template:T"]
+
+
+def test_warms_template_cache(monkeypatch):
+    monkeypatch.setattr(cache, "_cache", cache.TemplateCache())
+    si = siteinfo.get_siteinfo("en")
+    c = deps.Closure(nshandling.nshandler(si))
+    c.add_pages({u"Template:A": u"a{{b}}"})
+
+    from mwlib.templ import evaluate
+    e = evaluate.Expander(u"{{a}}", pagename="Test", wikidb=DictDB(a=u"a{{b}}"))
+    assert e.expandTemplates() == u"a"
+    assert cache.get_cache().stats()["hits"] == 1
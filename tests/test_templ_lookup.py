@@ -0,0 +1,85 @@
+#! /usr/bin/env py.test
+
+from mwlib import nuwiki, nshandling, siteinfo
+from mwlib.expander import DictDB
+from mwlib.templ import evaluate, lookup
+
+
+class NuDB(object):
+    """resolves names and redirects like nuwiki"""
+
+    def __init__(self, redirects=None, **pages):
+        self.siteinfo = siteinfo.get_siteinfo("en")
+        self.nshandler = nshandling.nshandler(self.siteinfo)
+        self.redirects = redirects or {}
+        self.pages = dict((k, nuwiki.page(dict(title=k), v)) for k, v in pages.items())
+        self.fetched = []
+
+    def get_siteinfo(self):
+        return self.siteinfo
+
+    def get_page(self, name, revision=None):
+        self.fetched.append(name)
+        return self.pages.get(self.redirects.get(name, name)) or self.pages.get(name)
+
+    def normalize_and_get_page(self, name, defaultns):
+        return self.get_page(self.nshandler.get_fqname(name, defaultns=defaultns))
+
+
+def expand(txt, db):
+    return evaluate.Expander(txt, pagename="test", wikidb=db).expandTemplates()
+
+
+def test_shared_across_expanders():
+    db = NuDB(**{"Template:A": u"a"})
+    assert expand(u"{{a}}{{missing}}", db) == u"a"
+    assert expand(u"{{a}}{{missing}}", db) == u"a"
+    assert db.fetched == [u"Template:A", u"Template:Missing"]
+
+    stats = lookup.get_lookup(db).stats()
+    assert stats["lookups"] == 4
+    assert stats["hits"] == 2
+    assert stats["missing"] == 1
+
+
+def test_canonical_names():
+    db = NuDB(**{"Template:A b": u"x"})
+    assert expand(u"{{a b}}{{A_b}}{{Template:a b}}{{template:A b}}", db) == u"xxxx"
+    assert db.fetched == [u"Template:A b"]
+    assert lookup.get_lookup(db).stats()["shared"] == 3
+
+
+def test_redirects():
+    db = NuDB(redirects={u"Template:R": u"Template:T", u"Template:Broken": u"Template:Nothing"},
+              **{"Template:T": u"t", "Template:Broken": u"b"})
+    assert expand(u"{{t}}{{r}}{{broken}}{{nothing}}", db) == u"ttb"
+    assert db.fetched == [u"Template:T", u"Template:Broken", u"Template:Nothing"]
+
+    entry = lookup.get_lookup(db).get_entry(db, u"r", 10)
+    assert (entry.fqname, entry.target) == (u"Template:T", u"Template:T")
+    entry = lookup.get_lookup(db).get_entry(db, u"broken", 10)
+    assert (entry.fqname, entry.target, entry.raw) == (u"Template:Broken", u"Template:Nothing", u"b")
+
+
+def test_redirect_first():
+    db = NuDB(redirects={u"Template:R": u"Template:T"}, **{"Template:T": u"t"})
+    assert expand(u"{{r}}{{t}}", db) == u"tt"
+    assert db.fetched == [u"Template:R"]
+    assert lookup.get_lookup(db).stats()["redirected"] == 1
+
+
+def test_dictdb():
+    db = DictDB(a=u"x")
+    assert expand(u"{{a}}{{A}}", db) == u"xx"
+    stats = lookup.get_lookup(db).stats()
+    assert stats["fetched"] == 2
+    assert stats["shared"] == 0
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.setenv("MWLIB_EXPANDER_LOOKUP_CACHE", "0")
+    db = NuDB(**{"Template:A": u"a"})
+    assert expand(u"{{a}}", db) == u"a"
+    assert expand(u"{{a}}", db) == u"a"
+    assert db.fetched == [u"Template:A", u"Template:A"]
+    assert lookup.get_lookup(db) is None
@@ -0,0 +1,88 @@
+#! /usr/bin/env py.test
+
+from mwlib.expander import expandstr, DictDB, Expander
+from mwlib.templ import memo
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def memo_size(monkeypatch):
+    monkeypatch.setenv("MWLIB_EXPANDER_MEMO_SIZE", str(16 * 1024 * 1024))
+
+
+def test_pure_template_memoized():
+    db = DictDB(flag=u"[[File:Flag of {{{1}}}.svg|{{{size|20px}}}]]")
+    expandstr(u"{{flag|A}} {{flag| A |size=10px}}", u"[[File:Flag of A.svg|20px]] [[File:Flag of  A .svg|10px]]", wikidb=db)
+    expandstr(u"{{flag|A}}{{flag|1=A}}", u"[[File:Flag of A.svg|20px]][[File:Flag of A.svg|20px]]", wikidb=db)
+    m = memo.get_memo(db)
+    assert m.stats()["misses"] == 2
+    assert m.stats()["hits"] == 2
+
+
+def test_impure_templates():
+    db = DictDB(p=u"{{PAGENAME}}", q=u"x{{p}}", r=u"{{#ifexist:{{{1}}}|a|b}}", s=u"{{{{{1}}}}}")
+    m = memo.get_memo(db)
+    e = Expander(u"", pagename="Test", wikidb=db)
+    assert not m.is_pure(e, u"p")
+    assert not m.is_pure(e, u"q")
+    assert not m.is_pure(e, u"r")
+    assert not m.is_pure(e, u"s")
+    assert not m.is_pure(e, u"/sub")
+
+    expandstr(u"{{q}}", u"xPage1", wikidb=db, pagename="Page1")
+    expandstr(u"{{q}}", u"xPage2", wikidb=db, pagename="Page2")
+
+
+def test_pure_parser_functions():
+    db = DictDB(a=u"{{#if:{{{1|}}}|{{b|{{{1}}}}}|{{lc:X}}}}{{#expr:1+{{{1|0}}}}}", b=u"<{{{1}}}>")
+    m = memo.get_memo(db)
+    assert m.is_pure(Expander(u"", wikidb=db), u"a")
+    expandstr(u"{{a|1}}{{a}}{{a|1}}", u"<1>2x1<1>2", wikidb=db)
+    assert m.hits == 1
+
+
+def test_uniq_markers():
+    db = DictDB(t=u"<nowiki>''{{{1}}}''</nowiki>")
+    expandstr(u"{{t|a}}", u"''{{{1}}}''", wikidb=db)
+    expandstr(u"{{t|a}}", u"''{{{1}}}''", wikidb=db)
+    assert memo.get_memo(db).hits == 1
+
+
+def test_size_limit():
+    m = memo.TemplateMemo(5000)
+    db = DictDB(t=u"{{{1}}}" * 10)
+    e = Expander(u"{{t|%s}}" % (u"x" * 1000,), wikidb=db)
+    e.memo = m
+    e.expandTemplates()
+    assert m.size == 0
+
+    e = Expander(u"".join(u"{{t|%s}}" % i for i in range(100)), wikidb=db)
+    e.memo = m
+    e.expandTemplates()
+    assert 0 < m.size <= 5000
+    assert len(m.entries) < 100
+
+
+def test_unused_arguments():
+    db = DictDB(flag=u"[{{{1}}}]", loop=u"{{loop}}", err=u"{{#expr:1/0}}")
+    expandstr(u"{{flag|A|x}}{{flag|A|y}}{{flag|A|{{loop}}}}{{flag|B|{{err}}}}",
+              u"[A][A][A][B]", wikidb=db)
+    m = memo.get_memo(db)
+    assert m.stats()["misses"] == 2
+    assert m.stats()["hits"] == 2
+
+
+def test_same_output_as_without_memo(monkeypatch):
+    templates = dict(a=u"{{#if:{{{1|}}}|{{b|{{{1}}}|{{{2|}}}}}|{{{x|none}}}}}",
+                     b=u"<{{{1}}}{{#ifeq:{{{2}}}|y|{{{1}}}}}>",
+                     r=u"{{a|{{r|{{{1}}}}}}}",
+                     s=u"{{#switch:{{{1}}}|a={{{2}}}|#default={{{3|d}}}}}",
+                     l=u"{{l}}")
+    txt = (u"{{a|1}}{{a|1|x=2}}{{a||x=2}}{{a}}{{a|1|y}}{{a|2|y}}{{a|1|n}}"
+           u"{{r|1}}{{a|{{r}}}}{{b|1|y}}{{b|1|{{r}}}}"
+           # the lookup of 3 parses 1=, which overrides the first argument
+           u"{{s|x}}[{{s|x|1={{l}}}}]{{s|a|1=a}}")
+    expected = Expander(txt, wikidb=DictDB(**templates)).expandTemplates()
+    monkeypatch.setenv("MWLIB_EXPANDER_MEMO_SIZE", "0")
+    assert Expander(txt, wikidb=DictDB(**templates)).expandTemplates() == expected
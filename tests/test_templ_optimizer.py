@@ -0,0 +1,91 @@
+#! /usr/bin/env py.test
+
+import pytest
+from mwlib.expander import DictDB
+from mwlib.templ import evaluate, nodes, parser, optimizer
+
+
+def parse(txt):
+    return parser.parse(txt, included=True)
+
+
+def test_fold_if():
+    assert parse(u"{{#if: 1 | yes | no}}") == nodes.IfBlockNode((u" yes ",))
+    assert parse(u"{{#if: | yes | no}}") == nodes.IfBlockNode((u" no",))
+    assert parse(u"{{#if: | yes }}") == nodes.IfBlockNode((u"",))
+    assert isinstance(parse(u"{{#if: {{{1}}} | yes | no}}"), nodes.IfNode)
+
+
+def test_fold_ifeq():
+    assert parse(u"{{#ifeq: 1 | 01 | yes | no}}") == nodes.IfeqBlockNode((u" yes ",))
+    assert parse(u"{{#ifeq: a | b | yes | no}}") == nodes.IfeqBlockNode((u" no",))
+    assert isinstance(parse(u"{{#ifeq: a | {{{1}}} | yes | no}}"), nodes.IfeqNode)
+
+
+def test_fold_switch():
+    assert parse(u"{{#switch: b | a = 1 | b | c = 2 | 3}}") == nodes.SwitchBlockNode((u" 2 ",))
+    assert parse(u"{{#switch: 3.0 | 1 = x | 3 = y}}") == nodes.SwitchBlockNode((u" y",))
+
+    # the names of the default case depend on the siteinfo
+    assert isinstance(parse(u"{{#switch: d | a = 1 | 3}}"), nodes.SwitchNode)
+    # computed keys before the matching case need to be evaluated
+    assert isinstance(parse(u"{{#switch: b | {{{1}}} = 1 | b = 2}}"), nodes.SwitchNode)
+
+
+def test_switch_tables():
+    t = parse(u"{{#switch: {{{1}}} | a = {{#if:1|x}} | {{{2}}} = y}}")
+    assert isinstance(t, nodes.SwitchNode)
+    assert t.fast[u"a"] == (0, (u" ", nodes.IfBlockNode((u"x",)), u" "))
+    assert len(t.unresolved) == 1
+
+
+def test_fold_nested():
+    t = parse(u"{{#if:1|{{#ifeq:a|a|{{#switch:x|x=deep}}}}}}")
+    assert t == nodes.IfBlockNode((nodes.IfeqBlockNode((nodes.SwitchBlockNode((u"deep",)),)),))
+
+
+def test_hoist_strings():
+    # the eqmark is kept in template arguments, but joined in branches
+    t = parse(u"{{#if:{{{1}}}|a=b}}")
+    assert t[1] == u"a=b"
+    t = parse(u"{{t|a=b}}")
+    assert t[1][0][1] is parser.eqmark
+
+
+def test_noinclude():
+    t = parse(u"{{#if:<includeonly>1</includeonly>|a|b}}")
+    assert t == nodes.IfBlockNode((u"a",))
+    t = parser.parse(u"{{#if:<includeonly>1</includeonly>|a|b}}", included=False)
+    assert t == nodes.IfBlockNode((u"b",))
+
+
+cases = [
+    u"x\n{{#if:1|* a}}",
+    u"x{{#if:1|* a}}",
+    u"{{#if: | |\n{{{!}} }}",
+    u"{{#switch: a | a | b = * c }}x",
+    u"{{#if:1|a=b}}{{#ifeq:a|a|x=y|z}}",
+    u"{{t|{{#if:1|* x}}}}",
+    u"{{t|a={{#switch:1|1=:z}}}}\n{{#if:1|#x}}",
+    u"{{#if:1|{{t|;y}}}}",
+]
+
+
+@pytest.mark.parametrize("txt", cases)
+@pytest.mark.parametrize("evaluator", ["recursive", "compiled"])
+def test_same_output(txt, evaluator, monkeypatch):
+    monkeypatch.setattr(evaluate.Expander, "compile_templates", evaluator == "compiled")
+    db = DictDB(t=u"{{#if:1|{{{1|}}}{{{a|}}}}}")
+
+    def expand():
+        return evaluate.Expander(txt, pagename="test", wikidb=db).expandTemplates()
+
+    monkeypatch.setattr(parser.Parser, "fold", False)
+    expected = expand()
+    monkeypatch.setattr(parser.Parser, "fold", True)
+    assert expand() == expected
+
+
+def test_fold_idempotent():
+    t = parse(u"{{#switch:{{{1}}}|a={{#if:1|x}}|b=y}}")
+    assert optimizer.fold(t) == t
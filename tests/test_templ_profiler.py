@@ -0,0 +1,101 @@
+#! /usr/bin/env py.test
+
+import json
+
+import pytest
+from mwlib.expander import DictDB
+from mwlib.templ import evaluate, profiler
+
+
+@pytest.fixture(params=["recursive", "compiled"])
+def evaluator(request, monkeypatch):
+    monkeypatch.setattr(evaluate.Expander, "compile_templates", request.param == "compiled")
+    return request.param
+
+
+@pytest.fixture
+def prof(monkeypatch):
+    monkeypatch.delenv("MWLIB_EXPANDER_PROFILE", raising=False)
+    p = profiler.Profiler()
+    monkeypatch.setattr(profiler, "_profiler", p)
+    return p
+
+
+def expand(txt, db):
+    return evaluate.Expander(txt, pagename="test", wikidb=db).expandTemplates()
+
+
+def test_calls_and_depth(evaluator, prof):
+    db = DictDB(outer=u"[{{inner|{{{1}}}}}]", inner=u"{{#if:{{{1|}}}|{{#expr:{{{1}}}*2}}|none}}")
+    assert expand(u"{{outer|3}} {{outer|}} {{inner|1}}", db) == u"[6] [none] 2"
+
+    outer = prof.templates[u"outer"]
+    inner = prof.templates[u"inner"]
+    assert outer.calls == 2
+    assert outer.max_depth == 1
+    assert outer.output == len(u"[6][none]")
+    assert inner.calls == 3
+    assert inner.max_depth == 2
+    assert prof.functions[u"#IF"].calls == 3
+    assert prof.functions[u"#EXPR"].calls == 2
+    assert outer.cumulative >= outer.self_time
+    assert outer.cumulative >= inner.cumulative / 3
+    assert prof.stack == []
+
+
+def test_folded_functions(evaluator, prof):
+    db = DictDB(t=u"{{#if:1|a}}{{#ifeq:x|x|b}}{{#switch:c|c=c}}{{#if:{{{1|}}}||d}}")
+    assert expand(u"{{t}}", db) == u"abcd"
+    assert prof.functions[u"#IF"].calls == 2
+    assert prof.functions[u"#IF"].output == 2
+    assert prof.functions[u"#IFEQ"].calls == 1
+    assert prof.functions[u"#SWITCH"].calls == 1
+
+
+def test_memo_hits(evaluator, prof, monkeypatch):
+    monkeypatch.setenv("MWLIB_EXPANDER_MEMO_SIZE", str(1024 * 1024))
+    db = DictDB(flag=u"[[File:Flag of {{{1}}}.svg]]")
+    expand(u"{{flag|A}}{{flag|A}}{{flag|A}}{{flag|B}}", db)
+    st = prof.templates[u"flag"].todict()
+    assert st["calls"] == 4
+    assert st["hits"] == 2
+    assert st["hit_rate"] == 0.5
+
+
+def test_report(prof, tmpdir):
+    expand(u"{{a}}{{lc:X}}", DictDB(a=u"A"))
+    path = profiler.report_path(str(tmpdir.join("status")))
+    prof.write_report(path)
+    report = json.load(open(path))
+    assert report["templates"][u"a"]["calls"] == 1
+    assert report["functions"][u"LC"]["output"] == 1
+
+
+def test_disabled(monkeypatch):
+    monkeypatch.delenv("MWLIB_EXPANDER_PROFILE", raising=False)
+    monkeypatch.setattr(profiler, "_profiler", None)
+    assert evaluate.Expander(u"", wikidb=DictDB()).profiler is None
+
+    monkeypatch.setenv("MWLIB_EXPANDER_PROFILE", "1")
+    assert evaluate.Expander(u"", wikidb=DictDB()).profiler is not None
+
+
+def test_enable_disable(monkeypatch):
+    monkeypatch.delenv("MWLIB_EXPANDER_PROFILE", raising=False)
+    monkeypatch.setattr(profiler, "_profiler", None)
+    p = profiler.enable()
+    assert profiler.get_profiler() is p
+    profiler.disable()
+    assert profiler.get_profiler() is None
+
+
+def test_recursion(evaluator, prof, monkeypatch):
+    db = DictDB(loop=u"x{{#if:{{{1|1}}}|{{loop}}}}")
+    monkeypatch.setattr(profiler, "_profiler", None)
+    expected = expand(u"{{loop}}", db)
+    monkeypatch.setattr(profiler, "_profiler", prof)
+    assert expand(u"{{loop}}", db) == expected
+    assert prof.stack == []
+    # the innermost call hits the recursion limit before reaching its #if
+    calls = prof.templates[u"loop"].calls
+    assert prof.functions[u"#IF"].calls in (calls - 1, calls)
@@ -0,0 +1,93 @@
+#! /usr/bin/env py.test
+# -*- coding: utf-8 -*-
+
+import pytest
+from mwlib.templ import scanner, pp
+from mwlib.uniq import Uniquifier
+
+texts = [
+    u"",
+    u"a{{b|c=d}}e{{{1|x}}}}}{{{{{{",
+    u"{[[x]]]] [[ } {| |} < > =",
+    u"<nowiki>{{a}}</NOWIKI> <nowiki>{{b}}",
+    u"<noinclude>x</noinclude> <NoInclude>y <includeonly>z</includeonly>",
+    u"<math>{{x}}</math><math >a</math>",
+    u"<imagemap foo>[[a]]</imagemap> <imagemap <x>",
+    u"<gallery caption=\"a\">\n{{a}}\n</Gallery> <gallery>",
+    u"<ref name=a/> <ref name=a> <references/> <ref/>",
+    u"<source lang=c>{{a}}</source> <source>",
+    u"<pre>{{a}}</pre> <pre class=\"x\">a</pre> <prefix>x</pre> <pre</pre>",
+    u"\x00{{a\x00|b}}\x00<ref a\x00/>",
+    u"ä{{ö|ü=ß}}K<noinclude>İ</noinclude>",
+]
+
+
+@pytest.mark.skipif("scanner._expander is None")
+@pytest.mark.parametrize("txt", texts)
+def test_native_scanner(txt):
+    assert scanner._expander.scan(txt) == scanner._tokenize(txt)
+
+
+def test_tokenize():
+    tokens = scanner.tokenize(u"a{{b|c}}<nowiki>}}</nowiki>")
+    assert tokens == [(5, u"a"), (1, u"{{"), (5, u"b"), (5, u"|"), (5, u"c"), (2, u"}}"),
+                      (5, u"<nowiki>}}</nowiki>"), (None, '')]
+
+
+pp_texts = texts + [
+    u"a\n  <!-- x -->  \nb <!-- y -->\nc\n<!-- z --> d <!-- open",
+    u"<!-- <noinclude> -->x</noinclude> y\n",
+    u"<noinclude>x\n",
+    u"a<onlyinclude>b<noinclude>c</noinclude></onlyinclude>d<ONLYINCLUDE>e</onlyinclude><onlyinclude>f",
+    u"<no<includeonly>x</includeonly>include>a</noinclude x>",
+    u"<ref name=a/>{{<ref name=b>x</REF >}}<references/><go>x</go><googlemap a>y</googlemap>",
+    u"<nowiki>a</nowiki> <nowiki/> <Pre class=x>b</pre\n> <ref>open",
+]
+
+
+def separate(txt, included, u):
+    txt = u.replace_tags(pp.preprocess(txt, included=included))
+    return scanner._tokenize(txt) + [(None, '')]
+
+
+@pytest.mark.skipif("scanner._expander is None")
+@pytest.mark.parametrize("txt", pp_texts)
+@pytest.mark.parametrize("included", [True, False])
+def test_preprocess_scan(txt, included):
+    u1 = Uniquifier()
+    u2 = Uniquifier()
+    assert scanner.tokenize(txt, included=included, uniquifier=u1) == separate(txt, included, u2)
+    assert u1.uniq2repl == u2.uniq2repl
+
+    assert scanner.tokenize(txt, included=included) == scanner._tokenize(pp.preprocess(txt, included=included)) + [(None, '')]
+
+
+def test_replace_tags_override():
+    from mwlib.expander import Expander, DictDB
+
+    class MyExpander(Expander):
+        def replace_tags(self, txt):
+            return Expander.replace_tags(self, txt.replace(u"x", u"y"))
+
+    e = MyExpander(u"x<nowiki>{{a}}</nowiki>x", pagename="Test", wikidb=DictDB())
+    assert e.expandTemplates() == u"y{{a}}y"
+    assert e.parseAndExpand(u"x") == u"y"
+
+
+def test_uniquifier_fallback():
+    # the native scanner only matches lower case alphanumeric tag names
+    from mwlib.uniq import get_tag_pattern
+
+    def make_uniquifier():
+        u = Uniquifier()
+        u.compile()
+        u.tagnames = u.tagnames.union([u"my-tag"])
+        u.rx = get_tag_pattern(u.tagnames)
+        return u
+
+    u1 = make_uniquifier()
+    u2 = make_uniquifier()
+    txt = u"a<my-tag>{{b}}</my-tag>c"
+    assert scanner.tokenize(txt, uniquifier=u1) == separate(txt, True, u2)
+    assert u1.uniq2repl == u2.uniq2repl
+    assert len(u1.uniq2repl) == 1
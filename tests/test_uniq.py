@@ -40,3 +40,37 @@ def test_comment():
     yield repl, "foo\n<!-- bla -->\nbar", "foo\nbar"
     yield repl, "foo\n<!-- bla -->bar", "foo\nbar"
     yield repl, "foo<!-- bla -->\nbar", "foo\nbar"
+
+
+def test_shared_pattern():
+    u1 = uniq.Uniquifier()
+    u2 = uniq.Uniquifier()
+    u1.replace_tags(u"<ref>a</ref>")
+    u2.replace_tags(u"<ref>b</ref>")
+    assert u1.rx is u2.rx
+    assert u1.rx is uniq.get_tag_pattern(u1.tagnames)
+
+
+def test_find_uniqs():
+    u = uniq.Uniquifier()
+    s = u.replace_tags(u"a<ref>b</ref>c<nowiki>d</nowiki>")
+    offsets = uniq.find_uniqs(s)
+    assert [uniq.uniqrx.match(s, b).end() for b, e in offsets] == [e for b, e in offsets]
+    assert len(offsets) == 2
+    assert uniq.find_uniqs(u"\x7fUNIQ-x\x7fUNIQ-ref-1-ab-QINU\x7f") == [(7, 27)]
+    assert uniq.find_uniqs(u"\x7fUNIQ-?-QINU\x7fUNIQ-ref-1-ab-QINU\x7f") == [(12, 32)]
+
+
+def test_replace_uniq():
+    u = uniq.Uniquifier()
+    s = u.replace_tags(u"a<ref>b</ref>c<nowiki>d</nowiki>")
+    assert u.replace_uniq(s) == u"a<ref>b</ref>cd"
+    assert u.replace_uniq(s + u"\x7fUNIQ-ref-99-ab-QINU\x7f") == u"a<ref>b</ref>cd\x7fUNIQ-ref-99-ab-QINU\x7f"
+    assert u.replace_uniq(u"abc") == u"abc"
+
+
+def test_html_tag_with_uniq():
+    u = uniq.Uniquifier()
+    s = u.replace_tags(u'<span title="<nowiki>x</nowiki>">a</span><b><nowiki>y</nowiki></b>')
+    tags = [t for t in utoken.tokenize(s, uniquifier=u) if t.type == utoken.token.t_html_tag]
+    assert [t.text for t in tags] == [u'<span title="x">', u"<b>"]